@@ -0,0 +1,444 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from library import Book, HashTable, Library, ShardedLibrary, TitleIndexBst, edit_distance
+
+Record = Tuple[str, str, str, str]
+
+words = [
+    "algorithms", "data", "structures", "introduction", "python", "networks", "deep",
+    "learning", "systems", "design", "theory", "applied", "modern", "advanced", "guide",
+]
+
+
+# --- synthetic catalogues ---
+
+def uniform_catalogue(n: int, seed: int) -> List[Record]:
+    """Random titles of 2-4 words, nearly all distinct."""
+    rng = random.Random(seed)
+    return [
+        (f"B{i}", " ".join(rng.choices(words, k=rng.randint(2, 4))) + f" {i}",
+         f"Author {rng.randrange(max(1, n // 20))}", rng.choice(words))
+        for i in range(n)
+    ]
+
+
+def skewed_catalogue(n: int, seed: int) -> List[Record]:
+    """Titles and authors drawn from a Zipf-like distribution (a few very popular)."""
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    return [
+        (f"B{i}", " ".join(rng.choices(words, weights, k=3)) + f" {rng.randrange(100)}",
+         f"Author {int(rng.paretovariate(1.2))}", rng.choices(words, weights)[0])
+        for i in range(n)
+    ]
+
+
+def sorted_catalogue(n: int, seed: int) -> List[Record]:
+    """Titles arriving in sorted order (the old unbalanced tree's worst case)."""
+    return [(f"B{i}", f"Title {i:08d}", f"Author {i % 1000}", "Maths") for i in range(n)]
+
+
+def duplicate_catalogue(n: int, seed: int) -> List[Record]:
+    """Only ~100 distinct titles, so most books share a title."""
+    rng = random.Random(seed)
+    return [(f"B{i}", f"Common Title {rng.randrange(100)}", f"Author {i % 50}", "Maths") for i in range(n)]
+
+
+catalogues: Dict[str, Callable[[int, int], List[Record]]] = {
+    "uniform": uniform_catalogue,
+    "skewed": skewed_catalogue,
+    "sorted": sorted_catalogue,
+    "duplicates": duplicate_catalogue,
+}
+
+
+# --- timing ---
+
+def measure(
+    run: Callable[..., Any], operations: int, repeats: int, setup: Optional[Callable[[], Any]] = None
+) -> Dict[str, Any]:
+    """
+    Time `run` (which performs `operations` operations) `repeats` times
+    with the garbage collector paused, and report ns per operation.
+    If `setup` is given it runs untimed before each repeat and its result
+    is passed to `run`. The median is the headline number; min and all
+    runs are kept too.
+    """
+    runs = []
+    for _ in range(repeats):
+        args = (setup(),) if setup is not None else ()
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            run(*args)
+            runs.append((time.perf_counter() - start) * 1e9 / operations)
+        finally:
+            gc.enable()
+    return {"ns_per_op": statistics.median(runs), "min_ns_per_op": min(runs), "runs": runs}
+
+
+def sample(records: List[Record], count: int, seed: int) -> List[Record]:
+    rng = random.Random(seed)
+    return [rng.choice(records) for _ in range(count)]
+
+
+# --- benchmarks ---
+
+def bench_hash_table(records: List[Record], repeats: int, seed: int) -> Dict[str, Dict[str, Any]]:
+    keys = [record[0] for record in records]
+    lookups = [record[0] for record in sample(records, min(len(records), 100_000), seed)]
+    results = {}
+
+    for open_addressing in (False, True):
+        mode = "open" if open_addressing else "chained"
+
+        def put_all() -> HashTable:
+            table = HashTable(open_addressing=open_addressing)
+            for key in keys:
+                table.put(key, key)
+            return table
+
+        table = put_all()
+        results[f"hashtable.{mode}.put"] = measure(put_all, len(keys), repeats)
+        results[f"hashtable.{mode}.get"] = measure(lambda: [table.get(key) for key in lookups], len(lookups), repeats)
+
+        def delete_all(filled: HashTable) -> None:
+            for key in keys:
+                filled.delete(key)
+
+        results[f"hashtable.{mode}.delete"] = measure(delete_all, len(keys), repeats, setup=put_all)
+
+    return results
+
+
+def bench_title_index(records: List[Record], repeats: int, seed: int) -> Dict[str, Dict[str, Any]]:
+    books = [Book(*record) for record in records]
+    queries = [record[1] for record in sample(records, min(len(records), 20_000), seed)]
+    prefixes = [title[:4] for title in queries[:2_000]]
+
+    def insert_all() -> TitleIndexBst:
+        index = TitleIndexBst()
+        for book in books:
+            index.insert(book.title, book)
+        return index
+
+    def bulk() -> TitleIndexBst:
+        index = TitleIndexBst()
+        index.bulk_insert(books)
+        return index
+
+    index = bulk()
+    return {
+        "title_index.insert": measure(insert_all, len(books), repeats),
+        "title_index.bulk_insert": measure(bulk, len(books), repeats),
+        "title_index.search_exact": measure(lambda: [index.search_exact(t) for t in queries], len(queries), repeats),
+        "title_index.search_prefix_top10": measure(
+            lambda: [index.search_prefix(p, 10) for p in prefixes], len(prefixes), repeats
+        ),
+    }
+
+
+def bench_library(records: List[Record], repeats: int, seed: int) -> Dict[str, Dict[str, Any]]:
+    picks = sample(records, min(len(records), 20_000), seed)
+    ids = [record[0] for record in picks]
+    titles = [record[1] for record in picks]
+    authors = [record[2] for record in picks[:2_000]]
+    subjects = [record[3] for record in picks[:2_000]]
+
+    def add_all() -> Library:
+        lib = Library()
+        for record in records:
+            lib.add_book(*record)
+        return lib
+
+    def bulk() -> Library:
+        lib = Library()
+        lib.bulk_load(records)
+        return lib
+
+    lib = bulk()
+    loan_ids = list(dict.fromkeys(ids))[:5_000]
+
+    def borrow_and_return() -> None:
+        for book_id in loan_ids:
+            lib.borrow_book(book_id, "U1")
+        for book_id in loan_ids:
+            lib.return_book(book_id)
+
+    def overdue() -> None:
+        for _ in range(100):
+            lib.list_overdue_books(today=date.today() + timedelta(days=30))
+
+    for book_id in loan_ids[::10]:
+        lib.borrow_book(book_id, "U1")  # leave some loans out for the overdue report
+    results = {
+        "library.add_book": measure(add_all, len(records), repeats),
+        "library.bulk_load": measure(bulk, len(records), repeats),
+        "library.get_book_by_id": measure(lambda: [lib.get_book_by_id(i) for i in ids], len(ids), repeats),
+        "library.search_title_exact": measure(lambda: [lib.search_title_exact(t) for t in titles], len(titles), repeats),
+        "library.search_title_prefix_top10": measure(
+            lambda: [lib.search_title_prefix(t[:3], limit=10) for t in titles[:2_000]], 2_000, repeats
+        ),
+        "library.query": measure(
+            lambda: [lib.query(author=a, subject=s) for a, s in zip(authors, subjects)], len(authors), repeats
+        ),
+        "library.list_overdue_books": measure(overdue, 100, repeats),
+        "library.list_all_books": measure(lib.list_all_books, 1, repeats),
+        "library.list_books_sorted_by_title": measure(lib.list_books_sorted_by_title, 1, repeats),
+    }
+    for book_id in loan_ids[::10]:
+        lib.return_book(book_id)
+    results["library.borrow_and_return"] = measure(borrow_and_return, 2 * len(loan_ids), repeats)
+    return results
+
+
+def bench_fuzzy(records: List[Record], repeats: int, seed: int) -> Dict[str, Dict[str, Any]]:
+    """Typo-tolerant title search: trigram index against a linear edit-distance scan."""
+    rng = random.Random(seed)
+    lib = Library()
+    lib.bulk_load(records)
+    titles = lib.fuzzy_index.keys
+
+    queries = []
+    for title in rng.sample(titles, min(len(titles), 10)):
+        position = rng.randrange(len(title))
+        queries.append(title[:position] + title[position + 1:])  # one dropped letter
+
+    def linear_scan() -> None:
+        for query in queries:
+            [title for title in titles if edit_distance(query, title, 2) <= 2]
+
+    return {
+        "fuzzy.index_search": measure(
+            lambda: [lib.search_title_fuzzy(query, 2) for query in queries], len(queries), repeats
+        ),
+        "fuzzy.linear_scan": measure(linear_scan, len(queries), max(1, repeats // 2)),
+    }
+
+
+def zipf_queries(records: List[Record], count: int, seed: int, distinct: int = 500) -> List[Tuple[str, str]]:
+    """
+    `count` title searches drawn from `distinct` hot queries with Zipf
+    weights (the k-th most popular is asked 1/k as often as the first).
+    Half the hot queries are exact titles, half 3-8 letter prefixes.
+    """
+    rng = random.Random(seed)
+    hot = []
+    for _, title, _, _ in rng.sample(records, min(distinct, len(records))):
+        if rng.random() < 0.5:
+            hot.append(("exact", title))
+        else:
+            hot.append(("prefix", title[:rng.randint(3, 8)]))
+    weights = [1 / rank for rank in range(1, len(hot) + 1)]
+    return rng.choices(hot, weights, k=count)
+
+
+def bench_search_cache(records: List[Record], repeats: int, seed: int) -> Dict[str, Dict[str, Any]]:
+    """A Zipf-skewed title search workload with the result cache off and on, plus one with writes mixed in."""
+    queries = zipf_queries(records, 20_000, seed)
+    lib = Library()
+    lib.bulk_load(records)
+
+    def replay() -> None:
+        for kind, text in queries:
+            if kind == "exact":
+                lib.search_title_exact(text)
+            else:
+                lib.search_title_prefix(text, limit=10)
+
+    new_books = iter(range(10**9))
+
+    def replay_with_writes() -> None:
+        # one new book per 100 searches, titled like a hot query so it invalidates something
+        for i, (kind, text) in enumerate(queries):
+            if i % 100 == 0:
+                lib.add_book(f"N{next(new_books)}", text + " new edition", "Author", "Subject")
+            if kind == "exact":
+                lib.search_title_exact(text)
+            else:
+                lib.search_title_prefix(text, limit=10)
+
+    results = {"cache.zipf_searches_uncached": measure(replay, len(queries), repeats)}
+    lib.enable_search_cache()
+    replay()  # warm up
+    results["cache.zipf_searches_cached"] = measure(replay, len(queries), repeats)
+    results["cache.zipf_searches_cached"]["hit_rate"] = lib.search_cache.stats()["hit_rate"]
+    results["cache.zipf_searches_cached_with_writes"] = measure(replay_with_writes, len(queries), repeats)
+    return results
+
+
+def core_counts() -> List[int]:
+    """1, 2, 4, ... up to the number of cores, plus the core count itself."""
+    cores = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return counts
+
+
+def bench_sharding(
+    records: List[Record], repeats: int, seed: int, workers: Optional[List[int]] = None
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Sharded bulk load with 1, 2, 4, ... worker processes (one shard per
+    worker) against a single Library, reporting the speedup of each, and
+    the merged title-ordered listing against sorting one big library.
+    """
+    repeats = max(1, repeats // 2)  # every run starts worker processes
+
+    def bulk() -> None:
+        Library().bulk_load(records)
+
+    results = {"sharding.single_library_bulk_load": measure(bulk, len(records), repeats)}
+    baseline = results["sharding.single_library_bulk_load"]["min_ns_per_op"]
+    for count in workers or core_counts():
+        result = measure(lambda: ShardedLibrary(count).bulk_load(records, workers=count), len(records), repeats)
+        result["speedup"] = baseline / result["min_ns_per_op"]
+        results[f"sharding.bulk_load_{count}_workers"] = result
+
+    single = Library()
+    single.bulk_load(records)
+    sharded = ShardedLibrary(4)
+    sharded.bulk_load(records, workers=1)
+    results["sharding.single_library_sorted_listing"] = measure(single.list_books_sorted_by_title, len(records), repeats)
+    results["sharding.merged_sorted_listing"] = measure(sharded.list_books_sorted_by_title, len(records), repeats)
+    return results
+
+
+def bench_memory(records: List[Record]) -> Dict[str, Dict[str, Any]]:
+    """Bytes per book for a fully indexed Library (measured once, it is deterministic)."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    lib = Library()
+    lib.bulk_load(records)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    assert len(lib.id_index) == len(records)
+    per_book = used / len(records)
+    return {"library.memory": {"bytes_per_book": per_book}}
+
+
+groups = {
+    "hashtable": bench_hash_table,
+    "title_index": bench_title_index,
+    "library": bench_library,
+    "fuzzy": bench_fuzzy,
+    "sharding": bench_sharding,
+    "cache": bench_search_cache,
+}
+
+
+def run_suite(
+    sizes: List[int],
+    catalogue_names: Optional[List[str]] = None,
+    group_names: Optional[List[str]] = None,
+    repeats: int = 5,
+    seed: int = 1,
+    memory: bool = True,
+    progress: Callable[[str], None] = lambda message: None,
+) -> Dict[str, Any]:
+    """
+    Run every benchmark group on every catalogue at every size.
+    Result keys look like "library.get_book_by_id/skewed/100000".
+    """
+    results: Dict[str, Dict[str, Any]] = {}
+    for size in sizes:
+        for name in catalogue_names or list(catalogues):
+            records = catalogues[name](size, seed)
+            for group in group_names or list(groups):
+                progress(f"{group} / {name} / {size}")
+                for key, value in groups[group](records, repeats, seed).items():
+                    results[f"{key}/{name}/{size}"] = value
+            if memory:
+                for key, value in bench_memory(records).items():
+                    results[f"{key}/{name}/{size}"] = value
+
+    return {
+        "meta": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "sizes": sizes,
+            "seed": seed,
+            "repeats": repeats,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.2) -> List[str]:
+    """
+    Return a line for every benchmark that got more than `threshold`
+    (0.2 = 20%) slower or bigger than in the baseline. Timings compare
+    the fastest run, which is the least disturbed by other load on the
+    machine; benchmarks missing from either side are ignored.
+    """
+    regressions = []
+    for key, now in current["results"].items():
+        before = baseline["results"].get(key)
+        if before is None:
+            continue
+        metric = "min_ns_per_op" if "min_ns_per_op" in now else "bytes_per_book"
+        if before[metric] and now[metric] > before[metric] * (1 + threshold):
+            change = now[metric] / before[metric] - 1
+            regressions.append(f"{key}: {before[metric]:.1f} → {now[metric]:.1f} {metric} (+{change:.0%})")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark every Library data structure and operation")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma separated, e.g. 1000,100000,1000000")
+    parser.add_argument("--catalogues", default=",".join(catalogues), help="comma separated subset of " + ", ".join(catalogues))
+    parser.add_argument("--groups", default=",".join(groups), help="comma separated subset of " + ", ".join(groups))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc memory runs")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against a stored results file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    report = run_suite(
+        [int(size) for size in args.sizes.split(",")],
+        args.catalogues.split(","),
+        args.groups.split(","),
+        repeats=args.repeats,
+        seed=args.seed,
+        memory=not args.no_memory,
+        progress=lambda message: print("running", message, file=sys.stderr),
+    )
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"Wrote {len(report['results'])} results to {args.output}")
+    for key, result in report["results"].items():
+        if "speedup" in result:
+            print(f"  {key}: {result['speedup']:.2f}x a single Library")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) against {args.compare}:")
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,69 @@
-from collections import deque
+import csv
+import gc
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
 from datetime import date, timedelta
-from typing import Optional, Any, List, Tuple
+from itertools import islice, takewhile
+from operator import attrgetter, itemgetter
+from typing import Optional, Any, Callable, Dict, Iterable, Iterator, List, Set, Tuple
 
 
 class Book:
+    """
+    One catalogue entry. __slots__ keeps each book free of a per-object
+    __dict__, author and subject strings are interned so books by the same
+    author share one string, and the reservation queue is only created
+    the first time somebody reserves the book.
+    """
+
+    __slots__ = (
+        "book_id", "title", "author", "subject",
+        "is_on_loan", "due_date", "borrower_id", "_reservations",
+    )
+
     def __init__(self, book_id: str, title: str, author: str, subject: str) -> None:
         self.book_id = book_id
         self.title = title
-        self.author = author
-        self.subject = subject
+        self.author = sys.intern(author)
+        self.subject = sys.intern(subject)
 
         self.is_on_loan = False
         self.due_date: Optional[date] = None
         self.borrower_id: Optional[str] = None
-        self.reservation_queue = deque()  # queue of user_ids
+        self._reservations: Optional[ReservationQueue] = None  # made on first use
+
+    @property
+    def reservation_queue(self) -> "ReservationQueue":
+        """Queue of user_ids waiting for this book (created on first access)."""
+        if self._reservations is None:
+            self._reservations = ReservationQueue()
+        return self._reservations
+
+    @property
+    def has_reservations(self) -> bool:
+        """True if anyone is waiting, without creating an empty queue."""
+        return bool(self._reservations)
+
+    def __reduce__(self) -> Tuple[Any, Tuple[Any, ...]]:
+        # a flat tuple pickles much faster than the generic __slots__ state
+        return _restore_book, (
+            self.book_id, self.title, self.author, self.subject,
+            self.is_on_loan, self.due_date, self.borrower_id, self._reservations,
+        )
 
     def __repr__(self) -> str:
         return (
@@ -23,61 +73,551 @@ class Book:
             f"is_on_loan={self.is_on_loan})"
         )
 
+
+def _restore_book(
+    book_id: str, title: str, author: str, subject: str,
+    is_on_loan: bool, due_date: Optional[date], borrower_id: Optional[str], reservations: Optional["ReservationQueue"],
+) -> Book:
+    book = Book(book_id, title, author, subject)
+    book.is_on_loan = is_on_loan
+    book.due_date = due_date
+    book.borrower_id = borrower_id
+    book._reservations = reservations
+    return book
+
+
+class ReservationQueue:
+    """
+    Users waiting for one book, first come first served, each with the
+    date their hold lapses (or None).
+
+    An OrderedDict maps user_id -> (ticket, expires), so joining, taking
+    the front, checking whether a user is waiting and cancelling from
+    anywhere are all O(1), and nobody can queue twice. Tickets count up
+    in arrival order: a user's position is their ticket minus the front's,
+    less the cancelled tickets in between, which are kept sorted and
+    counted by binary search.
+    """
+
+    def __init__(self) -> None:
+        self._entries: "OrderedDict[str, Tuple[int, Optional[date]]]" = OrderedDict()
+        self._next_ticket = 0
+        self._cancelled: List[int] = []  # tickets cancelled behind the front, sorted
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._entries)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._entries
+
+    def append(self, user_id: str, expires: Optional[date] = None) -> bool:
+        """Add a user at the back. Returns False if they are already waiting."""
+        if user_id in self._entries:
+            return False
+        self._entries[user_id] = (self._next_ticket, expires)
+        self._next_ticket += 1
+        return True
+
+    def front(self) -> Optional[str]:
+        """The user at the front, or None if nobody is waiting."""
+        return next(iter(self._entries), None)
+
+    def popleft(self) -> Tuple[str, Optional[date]]:
+        """Take the user at the front: (user_id, expires)."""
+        user_id, (_, expires) = self._entries.popitem(last=False)
+        self._drop_cancelled_before_front()
+        return user_id, expires
+
+    def remove(self, user_id: str) -> bool:
+        """Take a user out from anywhere in the queue. Returns False if they were not waiting."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return False
+        front_ticket = next(iter(self._entries.values()))[0]
+        del self._entries[user_id]
+        if entry[0] == front_ticket:
+            self._drop_cancelled_before_front()
+        else:
+            insort(self._cancelled, entry[0])
+        return True
+
+    def _drop_cancelled_before_front(self) -> None:
+        if not self._entries:
+            self._cancelled.clear()
+            return
+        front_ticket = next(iter(self._entries.values()))[0]
+        del self._cancelled[:bisect_left(self._cancelled, front_ticket)]
+
+    def ticket(self, user_id: str) -> Optional[int]:
+        entry = self._entries.get(user_id)
+        return entry[0] if entry is not None else None
+
+    def position(self, user_id: str) -> Optional[int]:
+        """1 for the front of the queue, or None if the user is not waiting."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        front_ticket = next(iter(self._entries.values()))[0]
+        return 1 + entry[0] - front_ticket - bisect_left(self._cancelled, entry[0])
+
+    def entries(self) -> Iterator[Tuple[str, Optional[date]]]:
+        """(user_id, expires) from front to back."""
+        for user_id, (_, expires) in self._entries.items():
+            yield user_id, expires
+
+
+class SortedBlockList:
+    """
+    A sorted list kept as a list of short sorted blocks, plus the largest
+    value of each block. Finding a value is a binary search over the block
+    maxima and then inside one block, and adding or removing one shifts
+    only that block, so updates cost O(log n + block_size) instead of the
+    O(n) shift of one big sorted list. Iterating from a value is
+    O(log n + k) for k values.
+    """
+
+    block_size = 512  # blocks are split once they reach twice this
+
+    def __init__(self, values: Iterable[Any] = ()) -> None:
+        self.reset(values)
+
+    def reset(self, values: Iterable[Any]) -> None:
+        """Replace the contents with `values` (in any order)."""
+        values = sorted(values)
+        size = self.block_size
+        self._blocks: List[List[Any]] = [values[i:i + size] for i in range(0, len(values), size)]
+        self._maxes: List[Any] = [block[-1] for block in self._blocks]
+        self.size = len(values)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[Any]:
+        for block in self._blocks:
+            yield from block
+
+    def add(self, value: Any) -> None:
+        if not self._blocks:
+            self._blocks.append([value])
+            self._maxes.append(value)
+            self.size = 1
+            return
+        index = min(bisect_left(self._maxes, value), len(self._maxes) - 1)
+        block = self._blocks[index]
+        insort(block, value)
+        if len(block) >= 2 * self.block_size:
+            self._blocks.insert(index + 1, block[self.block_size:])
+            del block[self.block_size:]
+            self._maxes.insert(index + 1, self._blocks[index + 1][-1])
+        self._maxes[index] = block[-1]
+        self.size += 1
+
+    def remove(self, value: Any) -> bool:
+        """Remove one copy of `value`. Returns False if it is not there."""
+        index = bisect_left(self._maxes, value)
+        if index == len(self._maxes):
+            return False
+        block = self._blocks[index]
+        position = bisect_left(block, value)
+        if block[position] != value:
+            return False
+        del block[position]
+        if block:
+            self._maxes[index] = block[-1]
+        else:
+            del self._blocks[index]
+            del self._maxes[index]
+        self.size -= 1
+        return True
+
+    def iter_from(self, value: Any, inclusive: bool = True) -> Iterator[Any]:
+        """Values >= `value` (or > `value` if not inclusive), in order."""
+        find = bisect_left if inclusive else bisect_right
+        index = find(self._maxes, value)
+        if index == len(self._maxes):
+            return
+        block = self._blocks[index]
+        yield from block[find(block, value):]
+        for index in range(index + 1, len(self._blocks)):
+            yield from self._blocks[index]
+
+
+_DELETED = object()  # tombstone marker for open addressing
+
+
+class _ChainedStore:
+    """
+    Separate chaining storage: a list of buckets,
+    each bucket a list of (key, value) pairs.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.buckets: List[List[Tuple[str, Any]]] = [[] for _ in range(capacity)]
+        self.tombstones = 0  # chaining never leaves tombstones
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        for existing_key, value in self.buckets[hash(key) % self.capacity]:
+            if existing_key == key:
+                return True, value
+        return False, None
+
+    def put(self, key: str, value: Any) -> bool:
+        """Insert or update, return True if the key is new."""
+        bucket = self.buckets[hash(key) % self.capacity]
+        for i, (existing_key, _) in enumerate(bucket):
+            if existing_key == key:
+                bucket[i] = (key, value)
+                return False
+        bucket.append((key, value))
+        return True
+
+    def delete(self, key: str) -> bool:
+        bucket = self.buckets[hash(key) % self.capacity]
+        for i, (existing_key, _) in enumerate(bucket):
+            if existing_key == key:
+                del bucket[i]
+                return True
+        return False
+
+    def take_slot(self, index: int) -> List[Tuple[str, Any]]:
+        """Remove and return every entry stored in bucket `index`."""
+        entries = self.buckets[index]
+        self.buckets[index] = []
+        return entries
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        for bucket in self.buckets:
+            yield from bucket
+
+    def stats(self) -> Dict[str, Any]:
+        lengths = [len(bucket) for bucket in self.buckets]
+        occupied = sum(1 for length in lengths if length)
+        return {
+            "occupied_buckets": occupied,
+            "max_chain_length": max(lengths, default=0),
+            "mean_chain_length": sum(lengths) / occupied if occupied else 0.0,
+        }
+
+
+class _OpenAddressStore:
+    """
+    Open addressing storage with linear probing.
+    Keys and values live in two flat arrays instead of
+    one list-of-tuples per bucket, which is much smaller per entry.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.keys: List[Any] = [None] * capacity  # None = empty, _DELETED = tombstone
+        self.values: List[Any] = [None] * capacity
+        self.tombstones = 0
+
+    def _find(self, key: str) -> int:
+        """Return the slot holding `key`, or -1 if it is not stored."""
+        index = hash(key) % self.capacity
+        keys = self.keys
+        while True:
+            existing_key = keys[index]
+            if existing_key is None:
+                return -1
+            if existing_key is not _DELETED and existing_key == key:
+                return index
+            index += 1
+            if index == self.capacity:
+                index = 0
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        index = self._find(key)
+        if index < 0:
+            return False, None
+        return True, self.values[index]
+
+    def put(self, key: str, value: Any) -> bool:
+        """Insert or update, return True if the key is new."""
+        index = hash(key) % self.capacity
+        keys = self.keys
+        first_free = -1
+        while True:
+            existing_key = keys[index]
+            if existing_key is None:
+                break
+            if existing_key is _DELETED:
+                if first_free < 0:
+                    first_free = index
+            elif existing_key == key:
+                self.values[index] = value
+                return False
+            index += 1
+            if index == self.capacity:
+                index = 0
+
+        # reuse the first tombstone on the probe path if there was one
+        if first_free >= 0:
+            index = first_free
+            self.tombstones -= 1
+        keys[index] = key
+        self.values[index] = value
+        return True
+
+    def delete(self, key: str) -> bool:
+        index = self._find(key)
+        if index < 0:
+            return False
+        self.keys[index] = _DELETED
+        self.values[index] = None
+        self.tombstones += 1
+        return True
+
+    def take_slot(self, index: int) -> List[Tuple[str, Any]]:
+        """Remove and return the entry stored in slot `index` (if any)."""
+        key = self.keys[index]
+        if key is None or key is _DELETED:
+            return []
+        value = self.values[index]
+        # leave a tombstone so probe chains through this slot stay intact
+        self.keys[index] = _DELETED
+        self.values[index] = None
+        self.tombstones += 1
+        return [(key, value)]
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        for key, value in zip(self.keys, self.values):
+            if key is not None and key is not _DELETED:
+                yield key, value
+
+    def stats(self) -> Dict[str, Any]:
+        # probe length = how far past its home slot each key ended up
+        probes = [
+            (index - hash(key) % self.capacity) % self.capacity
+            for index, key in enumerate(self.keys)
+            if key is not None and key is not _DELETED
+        ]
+        return {
+            "occupied_slots": len(probes),
+            "tombstones": self.tombstones,
+            "max_probe_length": max(probes, default=0),
+            "mean_probe_length": sum(probes) / len(probes) if probes else 0.0,
+        }
+
+
 class HashTable:
     """
-    Simple hash table with separate chaining.
+    Hash table that resizes itself as it fills up.
     Key: string (e.g. book_id)
     Value: any Python object (e.g. Book instance)
+
+    By default it uses separate chaining; pass open_addressing=True
+    for an array-backed table with linear probing.
+
+    When the load factor goes above max_load_factor the table doubles
+    (and it halves when it drops below min_load_factor, if that is set).
+    Rehashing is incremental: the old table is kept next to the new one
+    and every operation moves a few slots across, so a single insert
+    never pays for rebuilding the whole table.
     """
 
-    def __init__(self, capacity: int = 101) -> None:
-        # capacity is the number of buckets
-        self.capacity = capacity
-        self.buckets: List[List[Tuple[str, Any]]] = [[] for _ in range(capacity)]
+    rehash_step = 4  # old slots migrated per operation while rehashing
+
+    def __init__(
+        self,
+        capacity: int = 101,
+        max_load_factor: float = 0.75,
+        min_load_factor: float = 0.0,
+        open_addressing: bool = False,
+    ) -> None:
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        if open_addressing and not 0 < max_load_factor < 1:
+            raise ValueError("open addressing needs 0 < max_load_factor < 1")
+        if min_load_factor * 2 >= max_load_factor:
+            raise ValueError("min_load_factor must be less than half of max_load_factor")
+
+        self.max_load_factor = max_load_factor
+        self.min_load_factor = min_load_factor
+        self.open_addressing = open_addressing
+        self.min_capacity = capacity
+        self.size = 0
+
+        self._table = self._new_store(capacity)
+        self._old: Optional[Any] = None  # table being drained during a rehash
+        self._migrate_index = 0
+
+    @property
+    def capacity(self) -> int:
+        """Number of buckets/slots in the current table."""
+        return self._table.capacity
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, key: str) -> bool:
+        return self._lookup(key)[0]
+
+    def _new_store(self, capacity: int) -> Any:
+        if self.open_addressing:
+            return _OpenAddressStore(capacity)
+        return _ChainedStore(capacity)
 
     def _bucket_index(self, key: str) -> int:
         """Compute index of bucket for the given key."""
         return hash(key) % self.capacity
 
+    # --- resizing ---
+
+    def _start_rehash(self, new_capacity: int) -> None:
+        if self._old is not None:
+            self._finish_rehash()
+        self._old = self._table
+        self._table = self._new_store(new_capacity)
+        self._migrate_index = 0
+
+    def _rehash_step(self, slots: int) -> None:
+        """Move up to `slots` slots from the old table into the new one."""
+        old = self._old
+        if old is None:
+            return
+        stop = min(self._migrate_index + slots, old.capacity)
+        for index in range(self._migrate_index, stop):
+            for key, value in old.take_slot(index):
+                self._table.put(key, value)
+        self._migrate_index = stop
+        if stop == old.capacity:
+            self._old = None
+
+    def _finish_rehash(self) -> None:
+        if self._old is not None:
+            self._rehash_step(self._old.capacity)
+
+    def _maybe_resize(self) -> None:
+        capacity = self.capacity
+        used = self.size + self._table.tombstones
+
+        if used > capacity * self.max_load_factor:
+            if self.size > capacity * self.max_load_factor / 2:
+                self._start_rehash(capacity * 2 + 1)
+            else:
+                # mostly tombstones: rebuild at the same size to clear them
+                self._start_rehash(capacity)
+        elif (
+            self.min_load_factor
+            and capacity > self.min_capacity
+            and self.size < capacity * self.min_load_factor
+        ):
+            self._start_rehash(max(self.min_capacity, capacity // 2))
+
+    def reserve(self, expected_size: int) -> None:
+        """
+        Grow the table up front so `expected_size` entries fit without
+        further resizing. Useful before a bulk insert.
+        """
+        needed = int(expected_size / self.max_load_factor) + 1
+        if needed > self.capacity:
+            self._start_rehash(needed)
+            self._finish_rehash()
+
+    # --- public operations ---
+
+    def _lookup(self, key: str) -> Tuple[bool, Any]:
+        self._rehash_step(self.rehash_step)
+        found, value = self._table.get(key)
+        if not found and self._old is not None:
+            found, value = self._old.get(key)
+        return found, value
+
     def put(self, key: str, value: Any) -> None:
         """Insert or update a key-value pair."""
-        index = self._bucket_index(key)
-        bucket = self.buckets[index]
+        self._rehash_step(self.rehash_step)
 
-        # Check if key already exists → update it
-        for i, (existing_key, _) in enumerate(bucket):
-            if existing_key == key:
-                bucket[i] = (key, value)
-                return
+        # key still waiting in the old table → move it across with the new value
+        if self._old is not None and self._old.delete(key):
+            self._table.put(key, value)
+            return
 
-        # Otherwise append new key-value pair
-        bucket.append((key, value))
+        if self._table.put(key, value):
+            self.size += 1
+            self._maybe_resize()
 
     def get(self, key: str) -> Optional[Any]:
         """Retrieve value for the given key, or None if not found."""
-        index = self._bucket_index(key)
-        bucket = self.buckets[index]
+        return self._lookup(key)[1]
 
-        for existing_key, value in bucket:
-            if existing_key == key:
-                return value
-        return None
+    def peek(self, key: str) -> Optional[Any]:
+        """
+        Like get, but does no rehash work, so it never changes the table.
+        Several threads may peek at once as long as nobody is writing.
+        """
+        found, value = self._table.get(key)
+        if not found and self._old is not None:
+            found, value = self._old.get(key)
+        return value
 
     def delete(self, key: str) -> bool:
         """Delete entry with given key, return True if deleted, False if not found."""
-        index = self._bucket_index(key)
-        bucket = self.buckets[index]
+        self._rehash_step(self.rehash_step)
+
+        deleted = self._table.delete(key)
+        if not deleted and self._old is not None:
+            deleted = self._old.delete(key)
+        if deleted:
+            self.size -= 1
+            self._maybe_resize()
+        return deleted
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """Iterate over all (key, value) pairs, in no particular order."""
+        yield from self._table.items()
+        if self._old is not None:
+            yield from self._old.items()
+
+    def values(self) -> Iterator[Any]:
+        """Iterate over all stored values."""
+        for _, value in self.items():
+            yield value
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # bucket positions come from hash(), which is salted per process,
+        # so a pickled table carries its entries and re-buckets them on load
+        state = self.__dict__.copy()
+        state["_table"] = list(self.items())
+        state["_old"] = None
+        state["_migrate_index"] = 0
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        entries = state.pop("_table")
+        self.__dict__.update(state)
+        self.size = 0
+        self._table = self._new_store(self.min_capacity)
+        self.reserve(len(entries))
+        for key, value in entries:
+            self.put(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        """Size, load and chain/probe lengths of the current table (O(capacity))."""
+        report = {
+            "size": self.size,
+            "capacity": self.capacity,
+            "load_factor": self.size / self.capacity,
+            "open_addressing": self.open_addressing,
+            "rehashing": self._old is not None,
+        }
+        report.update(self._table.stats())
+        return report
+
+
+_book_id = attrgetter("book_id")  # sort key of the books sharing an index key
+
 
-        for i, (existing_key, _) in enumerate(bucket):
-            if existing_key == key:
-                del bucket[i]
-                return True
-        return False
 class BstNode:
     """
     Node in a binary search tree (BST) for indexing books by title.
     key: lowercase title string
-    books: list of Book objects that share that title
+    books: list of Book objects that share that title, in book_id order
+    height: height of the subtree rooted here (leaf = 1), used for AVL balancing
     """
 
     def __init__(self, key: str, books: List["Book"]) -> None:
@@ -85,188 +625,2565 @@ class BstNode:
         self.books = books
         self.left: Optional["BstNode"] = None
         self.right: Optional["BstNode"] = None
+        self.height = 1
+
+
+def _height(node: Optional[BstNode]) -> int:
+    return node.height if node is not None else 0
 
 
 class TitleIndexBst:
     """
-    Binary search tree index for book titles.
+    Self-balancing (AVL) binary search tree index for book titles.
     Allows exact title searches and simple prefix searches.
+
+    Every operation is iterative, so the tree works for any number of
+    titles regardless of Python's recursion limit, and the AVL rotations
+    keep the height at O(log n) whatever order titles are inserted in.
+
+    `field` names the Book attribute bulk_insert reads the key from, so the
+    same tree can index authors as well (TitleIndexBst(field="author")).
     """
 
-    def __init__(self) -> None:
+    def __init__(self, field: str = "title") -> None:
+        self.field = field
         self.root: Optional[BstNode] = None
 
+    # --- balancing helpers ---
+
+    @staticmethod
+    def _update_height(node: BstNode) -> None:
+        node.height = 1 + max(_height(node.left), _height(node.right))
+
+    def _rotate_left(self, node: BstNode) -> BstNode:
+        pivot = node.right
+        node.right = pivot.left
+        pivot.left = node
+        self._update_height(node)
+        self._update_height(pivot)
+        return pivot
+
+    def _rotate_right(self, node: BstNode) -> BstNode:
+        pivot = node.left
+        node.left = pivot.right
+        pivot.right = node
+        self._update_height(node)
+        self._update_height(pivot)
+        return pivot
+
+    def _rebalance(self, node: BstNode) -> BstNode:
+        """Fix the height of `node` and rotate if it is out of balance."""
+        self._update_height(node)
+        balance = _height(node.left) - _height(node.right)
+
+        if balance > 1:
+            if _height(node.left.left) < _height(node.left.right):
+                node.left = self._rotate_left(node.left)
+            return self._rotate_right(node)
+        if balance < -1:
+            if _height(node.right.right) < _height(node.right.left):
+                node.right = self._rotate_right(node.right)
+            return self._rotate_left(node)
+        return node
+
+    def _rebalance_path(self, path: List[BstNode]) -> None:
+        """Walk back up from the bottom of `path`, rebalancing each node."""
+        for i in range(len(path) - 1, -1, -1):
+            node = path[i]
+            old_height = node.height
+            subtree = self._rebalance(node)
+
+            if i == 0:
+                self.root = subtree
+            elif path[i - 1].left is node:
+                path[i - 1].left = subtree
+            else:
+                path[i - 1].right = subtree
+
+            # nothing above can change once a subtree keeps its shape and height
+            if subtree is node and node.height == old_height:
+                break
+
+    # --- public operations ---
+
     def insert(self, title: str, book: Book) -> None:
         """Insert a book into the BST using its title as the key."""
         key = title.lower()
-        self.root = self._insert_recursive(self.root, key, book)
+        path: List[BstNode] = []
+        node = self.root
 
-    def _insert_recursive(
-        self,
-        node: Optional[BstNode],
-        key: str,
-        book: Book,
-    ) -> BstNode:
+        while node is not None:
+            if key == node.key:
+                # same title: add book to this node's list
+                insort(node.books, book, key=_book_id)
+                return
+            path.append(node)
+            node = node.left if key < node.key else node.right
+
+        new_node = BstNode(key, [book])
+        if not path:
+            self.root = new_node
+            return
+
+        parent = path[-1]
+        if key < parent.key:
+            parent.left = new_node
+        else:
+            parent.right = new_node
+        self._rebalance_path(path)
+
+    def remove(self, title: str, book: Book) -> bool:
+        """
+        Remove one book from the tree. When it was the last book with that
+        title the node is deleted and the tree rebalanced on the way up.
+        Returns False if the book was not indexed under this title.
+        """
+        key = title.lower()
+        path: List[BstNode] = []
+        node = self.root
+        while node is not None and node.key != key:
+            path.append(node)
+            node = node.left if key < node.key else node.right
         if node is None:
-            return BstNode(key, [book])
+            return False
 
-        if key < node.key:
-            node.left = self._insert_recursive(node.left, key, book)
-        elif key > node.key:
-            node.right = self._insert_recursive(node.right, key, book)
+        for i, existing in enumerate(node.books):
+            if existing is book:
+                del node.books[i]
+                break
         else:
-            # same title: add book to this node's list
-            node.books.append(book)
+            return False
+        if node.books:
+            return True
 
-        return node
+        # a node with two children takes over its in-order successor's entry,
+        # and the successor's node (which has no left child) is unlinked instead
+        target = node
+        if node.left is not None and node.right is not None:
+            path.append(node)
+            target = node.right
+            while target.left is not None:
+                path.append(target)
+                target = target.left
+            node.key, node.books = target.key, target.books
+
+        child = target.left if target.left is not None else target.right
+        if not path:
+            self.root = child
+        elif path[-1].left is target:
+            path[-1].left = child
+        else:
+            path[-1].right = child
+        self._rebalance_path(path)
+        return True
 
     def search_exact(self, title: str) -> List[Book]:
         """Find all books whose title exactly matches the given title."""
         key = title.lower()
-        return self._search_exact_recursive(self.root, key)
+        node = self.root
 
-    def _search_exact_recursive(
-        self,
-        node: Optional[BstNode],
-        key: str,
-    ) -> List[Book]:
-        if node is None:
-            return []
+        while node is not None:
+            if key < node.key:
+                node = node.left
+            elif key > node.key:
+                node = node.right
+            else:
+                return node.books
+        return []
+
+    def iter_prefix(self, prefix: str) -> Iterator[Book]:
+        """
+        Lazily yield books whose title starts with the given prefix
+        (case-insensitive), in title order.
+        """
+        prefix_key = prefix.lower()
+        stack: List[BstNode] = []
+        node = self.root
+
+        # descend to the smallest key >= prefix, remembering the path
+        while node is not None:
+            if node.key >= prefix_key:
+                stack.append(node)
+                node = node.left
+            else:
+                node = node.right
+
+        # in-order walk from there until keys stop matching the prefix
+        while stack:
+            node = stack.pop()
+            if not node.key.startswith(prefix_key):
+                return
+            yield from node.books
 
-        if key < node.key:
-            return self._search_exact_recursive(node.left, key)
-        if key > node.key:
-            return self._search_exact_recursive(node.right, key)
-        return node.books
+            child = node.right
+            while child is not None:
+                stack.append(child)
+                child = child.left
 
-    def search_prefix(self, prefix: str) -> List[Book]:
+    def search_prefix(self, prefix: str, limit: Optional[int] = None) -> List[Book]:
         """
         Find all books whose title starts with the given prefix
-        (case-insensitive).
+        (case-insensitive), at most `limit` of them if a limit is given.
         """
-        prefix_key = prefix.lower()
-        found: List[Book] = []
-        self._search_prefix_recursive(self.root, prefix_key, found)
-        return found
+        return list(islice(self.iter_prefix(prefix), limit))
 
-    def _search_prefix_recursive(
-        self,
-        node: Optional[BstNode],
-        prefix: str,
-        found: List[Book],
-    ) -> None:
-        if node is None:
-            return
+    def iter_entries(self, start: str = "") -> Iterator[Tuple[str, List[Book]]]:
+        """
+        Lazily yield (key, books) for every key >= start (lowercase), in key
+        order. Reaching the first key costs O(log n); each one after O(1)
+        amortised.
+        """
+        stack: List[BstNode] = []
+        node = self.root
+        while node is not None:
+            if node.key >= start:
+                stack.append(node)
+                node = node.left
+            else:
+                node = node.right
 
-        # In-order style traversal, checking for prefix matches
-        if node.key.startswith(prefix):
-            found.extend(node.books)
+        while stack:
+            node = stack.pop()
+            yield node.key, node.books
+            child = node.right
+            while child is not None:
+                stack.append(child)
+                child = child.left
 
-        if prefix <= node.key:
-            self._search_prefix_recursive(node.left, prefix, found)
-        if prefix >= node.key:
-            self._search_prefix_recursive(node.right, prefix, found)
-class Library:
+    def stats(self) -> Dict[str, Any]:
+        """Key count, height and worst balance factor of the tree (O(n))."""
+        keys = books = worst_balance = 0
+        for node in self._iter_nodes():
+            keys += 1
+            books += len(node.books)
+            worst_balance = max(worst_balance, abs(_height(node.left) - _height(node.right)))
+        return {
+            "keys": keys,
+            "books": books,
+            "height": _height(self.root),
+            "avl_height_bound": 1.44 * math.log2(keys + 2),
+            "max_balance_factor": worst_balance,
+        }
+
+    # --- bulk building ---
+
+    def _iter_nodes(self) -> Iterator[BstNode]:
+        """Yield every node in key order (iterative in-order walk)."""
+        stack: List[BstNode] = []
+        node = self.root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node
+            node = node.right
+
+    @staticmethod
+    def _build_balanced(entries: List[Tuple[str, List[Book]]]) -> Optional[BstNode]:
+        """
+        Build a perfectly balanced tree from (key, books) pairs sorted by key.
+        Each range is split at its middle, so a subtree over s keys has
+        height s.bit_length() and no rotations are needed.
+        """
+        root: Optional[BstNode] = None
+        stack: List[Tuple[int, int, Optional[BstNode], bool]] = []
+        if entries:
+            stack.append((0, len(entries), None, False))
+
+        while stack:
+            low, high, parent, is_left = stack.pop()
+            mid = (low + high) // 2
+            node = BstNode(*entries[mid])
+            node.height = (high - low).bit_length()
+
+            if parent is None:
+                root = node
+            elif is_left:
+                parent.left = node
+            else:
+                parent.right = node
+
+            if low < mid:
+                stack.append((low, mid, node, True))
+            if mid + 1 < high:
+                stack.append((mid + 1, high, node, False))
+        return root
+
+    def bulk_insert(self, books: Iterable[Book]) -> None:
+        """
+        Insert many books at once. The new titles are sorted, merged with
+        the keys already in the tree and the whole tree is rebuilt bottom-up,
+        which costs O(n + m log m) instead of m separate root-to-leaf inserts.
+        """
+        field = self.field
+        new_books = sorted(books, key=lambda b: getattr(b, field).lower())
+
+        entries: List[Tuple[str, List[Book]]] = []
+        existing = self._iter_nodes()
+        current = next(existing, None)
+
+        for book in new_books:
+            key = getattr(book, field).lower()
+            # copy over existing keys that come before this one
+            while current is not None and current.key < key:
+                entries.append((current.key, current.books))
+                current = next(existing, None)
+
+            if entries and entries[-1][0] == key:
+                insort(entries[-1][1], book, key=_book_id)
+            elif current is not None and current.key == key:
+                insort(current.books, book, key=_book_id)
+                entries.append((current.key, current.books))
+                current = next(existing, None)
+            else:
+                entries.append((key, [book]))
+
+        while current is not None:
+            entries.append((current.key, current.books))
+            current = next(existing, None)
+
+        self.root = self._build_balanced(entries)
+
+
+class RadixNode:
     """
-    Main library class that uses:
-    - HashTable for fast lookup by book_id
-    - TitleIndexBst for searching by title
+    Node in a compressed trie (radix tree) of lowercase titles.
+    label: the piece of title on the edge leading into this node
+    books: books whose whole title ends at this node, in book_id order
+    children: child nodes keyed by the first character of their label,
+    with child_keys holding the same characters in sorted order
     """
 
-    loan_period_days = 14
+    def __init__(self, label: str, books: Optional[List["Book"]] = None) -> None:
+        self.label = label
+        self.books: List[Book] = books if books is not None else []
+        self.children: Dict[str, "RadixNode"] = {}
+        self.child_keys: List[str] = []
 
-    def __init__(self) -> None:
-        self.id_index = HashTable()
-        self.title_index = TitleIndexBst()
+    def add_child(self, child: "RadixNode") -> None:
+        first = child.label[0]
+        if first not in self.children:
+            insort(self.child_keys, first)
+        self.children[first] = child
 
-    # --- catalogue operations ---
 
-    def add_book(self, book_id: str, title: str, author: str, subject: str) -> None:
-        """Add a new book to the library catalogue."""
-        if self.id_index.get(book_id) is not None:
-            raise ValueError(f"Book with id {book_id} already exists")
+class TitleIndexRadix:
+    """
+    Radix tree index for book titles, with the same API as TitleIndexBst.
 
-        book = Book(book_id, title, author, subject)
-        self.id_index.put(book_id, book)
-        self.title_index.insert(title, book)
+    Prefix search finds the node for the prefix in O(len(prefix)) and then
+    walks only the subtree below it, lazily and in title order, so asking
+    for the first k completions costs O(k) however many titles match.
+    """
 
-    def get_book_by_id(self, book_id: str) -> Optional[Book]:
-        """Return a book by its ID, or None if not found."""
-        return self.id_index.get(book_id)
+    def __init__(self, field: str = "title") -> None:
+        self.field = field
+        self.root = RadixNode("")
 
-    def search_title_exact(self, title: str) -> List[Book]:
-        """Return a list of books with exactly this title."""
-        return self.title_index.search_exact(title)
+    def insert(self, title: str, book: Book) -> None:
+        """Insert a book into the tree using its title as the key."""
+        key = title.lower()
+        node = self.root
+        i = 0
 
-    def search_title_prefix(self, prefix: str) -> List[Book]:
-        """Return a list of books whose titles start with this prefix."""
-        return self.title_index.search_prefix(prefix)
+        while i < len(key):
+            child = node.children.get(key[i])
+            if child is None:
+                node.add_child(RadixNode(key[i:], [book]))
+                return
 
-    # --- loan operations ---
+            label = child.label
+            common = 0
+            limit = min(len(label), len(key) - i)
+            while common < limit and label[common] == key[i + common]:
+                common += 1
 
-    def borrow_book(self, book_id: str, user_id: str) -> str:
-        """Borrow a book or join the reservation queue if it is on loan."""
-        book = self.get_book_by_id(book_id)
-        if book is None:
-            return "Book not found."
+            if common < len(label):
+                # split the edge: the shared part becomes a new inner node
+                middle = RadixNode(label[:common])
+                child.label = label[common:]
+                middle.add_child(child)
+                node.children[key[i]] = middle
+                child = middle
 
-        if not book.is_on_loan:
-            book.is_on_loan = True
-            book.borrower_id = user_id
-            book.due_date = date.today().replace() + timedelta(days=self.loan_period_days)
-            return f"Book borrowed successfully. Due date: {book.due_date}"
+            node = child
+            i += common
 
-        # already on loan → add to reservation queue
-        book.reservation_queue.append(user_id)
-        return "Book is currently on loan. You have been added to the reservation queue."
+        # same title: add book to this node's list
+        insort(node.books, book, key=_book_id)
 
-    def return_book(self, book_id: str) -> str:
-        """Return a book and possibly issue it to the next user in the reservation queue."""
-        book = self.get_book_by_id(book_id)
-        if book is None:
-            return "Book not found."
+    def bulk_insert(self, books: Iterable[Book]) -> None:
+        """Insert many books at once."""
+        for book in books:
+            self.insert(getattr(book, self.field), book)
 
-        if not book.is_on_loan:
-            return "Book is not currently on loan."
+    def remove(self, title: str, book: Book) -> bool:
+        """
+        Remove one book from the tree, pruning nodes that no longer lead to
+        any title and merging an inner node left with a single child.
+        Returns False if the book was not indexed under this title.
+        """
+        key = title.lower()
+        path = [self.root]
+        i = 0
+        while i < len(key):
+            child = path[-1].children.get(key[i])
+            if child is None or not key.startswith(child.label, i):
+                return False
+            path.append(child)
+            i += len(child.label)
 
-        book.is_on_loan = False
-        book.borrower_id = None
-        book.due_date = None
+        node = path[-1]
+        for index, existing in enumerate(node.books):
+            if existing is book:
+                del node.books[index]
+                break
+        else:
+            return False
 
-        if book.reservation_queue:
-            next_user = book.reservation_queue.popleft()
-            book.is_on_loan = True
-            book.borrower_id = next_user
-            book.due_date = date.today().replace() + timedelta(days=self.loan_period_days)
-            return (
-                "Book returned and issued to next user in queue: "
-                f"{next_user}, due on {book.due_date}"
-            )
+        # prune empty leaves, then fold a single-child inner node into its child
+        while len(path) > 1 and not node.books and not node.children:
+            parent = path[-2]
+            first = node.label[0]
+            del parent.children[first]
+            parent.child_keys.remove(first)
+            path.pop()
+            node = parent
+        if len(path) > 1 and not node.books and len(node.children) == 1:
+            (child,) = node.children.values()
+            child.label = node.label + child.label
+            path[-2].children[node.label[0]] = child
+        return True
 
-        return "Book returned and is now available."
+    def _find_node(self, key: str, whole_label: bool) -> Optional[RadixNode]:
+        """
+        Follow `key` down from the root. With whole_label=True the key must
+        end exactly on a node; otherwise it may stop part-way along an edge
+        and the node below that edge is returned.
+        """
+        node = self.root
+        i = 0
+        while i < len(key):
+            child = node.children.get(key[i])
+            if child is None:
+                return None
+            rest = key[i:]
+            if rest.startswith(child.label):
+                i += len(child.label)
+            elif not whole_label and child.label.startswith(rest):
+                return child
+            else:
+                return None
+            node = child
+        return node
 
-    # --- reporting/lists ---
+    def search_exact(self, title: str) -> List[Book]:
+        """Find all books whose title exactly matches the given title."""
+        node = self._find_node(title.lower(), whole_label=True)
+        return node.books if node is not None else []
+
+    def iter_prefix(self, prefix: str) -> Iterator[Book]:
+        """
+        Lazily yield books whose title starts with the given prefix
+        (case-insensitive), in title order.
+        """
+        start = self._find_node(prefix.lower(), whole_label=False)
+        if start is None:
+            return
+
+        # pre-order walk: a node's own title sorts before all its extensions
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            yield from node.books
+            for first in reversed(node.child_keys):
+                stack.append(node.children[first])
+
+    def search_prefix(self, prefix: str, limit: Optional[int] = None) -> List[Book]:
+        """
+        Find all books whose title starts with the given prefix
+        (case-insensitive), at most `limit` of them if a limit is given.
+        """
+        return list(islice(self.iter_prefix(prefix), limit))
+
+    def iter_entries(self, start: str = "") -> Iterator[Tuple[str, List[Book]]]:
+        """
+        Lazily yield (title, books) for every title >= start (lowercase), in
+        title order. Subtrees whose path sorts before `start` without leading
+        towards it are skipped whole, so only the path to `start` and its
+        siblings are looked at before the first title comes out.
+        """
+        stack = [(self.root, "")]
+        while stack:
+            node, path = stack.pop()
+            if path >= start:
+                if node.books:
+                    yield path, node.books
+            elif not start.startswith(path):
+                continue  # every title below here sorts before start
+            for first in reversed(node.child_keys):
+                child = node.children[first]
+                stack.append((child, path + child.label))
+
+    def stats(self) -> Dict[str, Any]:
+        """Node count, title count and depth (in edges) of the tree (O(n))."""
+        nodes = keys = books = depth = 0
+        stack = [(self.root, 0)]
+        while stack:
+            node, level = stack.pop()
+            nodes += 1
+            depth = max(depth, level)
+            if node.books:
+                keys += 1
+                books += len(node.books)
+            for child in node.children.values():
+                stack.append((child, level + 1))
+        return {"nodes": nodes, "keys": keys, "books": books, "height": depth}
+
+
+_token_pattern = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens."""
+    return _token_pattern.findall(text.lower())
+
+
+class TextIndex:
+    """
+    Inverted index over the words of each book's title, author and subject,
+    ranked with BM25.
+
+    Books get consecutive document numbers as they are added, so every
+    posting list is already sorted. A posting list is two flat arrays:
+    document numbers and how often the term occurs in that document.
+    AND queries start from the shortest list and intersect it with each
+    of the others (by set intersection, or by binary search when the other
+    list is much longer); OR queries add up scores over every list.
+    Only the top `limit` scores are kept.
+    """
+
+    k1 = 1.2
+    b = 0.75
+    compact_ratio = 0.25  # rebuild once this share of documents are tombstones
+
+    def __init__(self) -> None:
+        self.books: List[Optional[Book]] = []  # document number -> book (None once removed)
+        self.doc_numbers: Dict[str, int] = {}  # book_id -> document number
+        self.doc_lengths = array("I")
+        self.total_length = 0
+        self.removed = 0
+        self.postings: Dict[str, Tuple[array, array]] = {}  # term -> (doc numbers, term counts)
+        self.doc_freq: Dict[str, int] = {}  # term -> live documents containing it (postings count tombstones too)
+
+    def add(self, book: Book) -> None:
+        doc = len(self.books)
+        tokens = tokenize(f"{book.title} {book.author} {book.subject}")
+        self.books.append(book)
+        self.doc_numbers[book.book_id] = doc
+        self.doc_lengths.append(len(tokens))
+        self.total_length += len(tokens)
+
+        counts: Dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for term, count in counts.items():
+            entry = self.postings.get(term)
+            if entry is None:
+                entry = self.postings[term] = (array("I"), array("I"))
+            entry[0].append(doc)
+            entry[1].append(count)
+            self.doc_freq[term] = self.doc_freq.get(term, 0) + 1
+
+    def remove(self, book: Book) -> None:
+        """
+        Tombstone a book's document: its postings stay until the next
+        compaction, but searches skip it. Removing a document in place
+        would mean rewriting every posting array it appears in.
+        """
+        doc = self.doc_numbers.pop(book.book_id)
+        self.books[doc] = None
+        self.total_length -= self.doc_lengths[doc]
+        self.removed += 1
+        # the book still holds the fields it was indexed under (callers remove before changing them)
+        for term in set(tokenize(f"{book.title} {book.author} {book.subject}")):
+            self.doc_freq[term] -= 1
+
+    def maybe_compact(self) -> None:
+        """Rebuild without tombstones once they pass compact_ratio of all documents."""
+        if self.removed > self.compact_ratio * len(self.books):
+            live = [book for book in self.books if book is not None]
+            self.__init__()
+            for book in live:
+                self.add(book)
+
+    def _idf(self, term: str) -> float:
+        n = len(self.books) - self.removed
+        df = self.doc_freq[term]
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, limit: Optional[int] = 10, match_all: bool = True) -> List[Tuple[float, Book]]:
+        """
+        Return (score, book) pairs for books matching the query words,
+        best first. match_all=True needs every word (AND), otherwise
+        any word will do (OR).
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        lists = [self.postings.get(term) for term in terms]
+        if not terms or (match_all and None in lists):
+            return []
+        # (doc numbers, term counts, idf) per term, shortest list first
+        lists = sorted(
+            ((entry[0], entry[1], self._idf(term)) for term, entry in zip(terms, lists) if entry is not None),
+            key=lambda entry: len(entry[0]),
+        )
+
+        # BM25 per term: idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average length))
+        k1_plus_one = self.k1 + 1
+        base = self.k1 * (1 - self.b)
+        per_length = self.k1 * self.b * (len(self.books) - self.removed) / self.total_length if self.total_length else 0.0
+        lengths = self.doc_lengths
+        scores: Dict[int, float] = {}
+
+        if match_all:
+            # intersect the document numbers first (set operations run in C),
+            # then fetch the counts of the survivors by binary search
+            matched_docs = list(lists[0][0])
+            for docs, _, _ in lists[1:]:
+                if len(docs) > 16 * len(matched_docs):
+                    # much longer list: binary-search each remaining document in it
+                    kept = []
+                    position = 0
+                    for doc in matched_docs:
+                        position = bisect_left(docs, doc, position)
+                        if position < len(docs) and docs[position] == doc:
+                            kept.append(doc)
+                    matched_docs = kept
+                else:
+                    matched = set(matched_docs)
+                    matched.intersection_update(docs)
+                    matched_docs = sorted(matched)
+            for docs, counts, idf in lists:
+                position = 0
+                for doc in matched_docs:
+                    position = bisect_left(docs, doc, position)
+                    count = counts[position]
+                    score = idf * count * k1_plus_one / (count + base + per_length * lengths[doc])
+                    scores[doc] = scores.get(doc, 0.0) + score
+        else:
+            for docs, counts, idf in lists:
+                for doc, count in zip(docs, counts):
+                    score = idf * count * k1_plus_one / (count + base + per_length * lengths[doc])
+                    scores[doc] = scores.get(doc, 0.0) + score
+
+        if self.removed:
+            scores = {doc: score for doc, score in scores.items() if self.books[doc] is not None}
+        if limit is None:
+            best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        else:
+            best = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(score, self.books[doc]) for doc, score in best]
+
+
+def edit_distance(a: str, b: str, max_distance: Optional[int] = None) -> int:
+    """
+    Levenshtein distance between two strings. With max_distance set, only
+    the band of cells within max_distance of the diagonal is filled in,
+    and the answer is capped at max_distance + 1 (meaning "too far").
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is None:
+        previous = list(range(len(b) + 1))
+        for i, char_a in enumerate(a, start=1):
+            current = [i]
+            for j, char_b in enumerate(b, start=1):
+                current.append(min(
+                    previous[j] + 1,  # delete
+                    current[j - 1] + 1,  # insert
+                    previous[j - 1] + (char_a != char_b),  # substitute
+                ))
+            previous = current
+        return previous[-1]
+
+    too_far = max_distance + 1
+    if len(a) - len(b) > max_distance:
+        return too_far
+
+    previous = [min(j, too_far) for j in range(len(b) + 1)]
+    for i, char_a in enumerate(a, start=1):
+        current = [too_far] * (len(b) + 1)
+        current[0] = min(i, too_far)
+        row_best = current[0]
+        for j in range(max(1, i - max_distance), min(len(b), i + max_distance) + 1):
+            cost = min(
+                previous[j] + 1,  # delete
+                current[j - 1] + 1,  # insert
+                previous[j - 1] + (char_a != b[j - 1]),  # substitute
+                too_far,
+            )
+            current[j] = cost
+            if cost < row_best:
+                row_best = cost
+        if row_best > max_distance:
+            return too_far
+        previous = current
+    return previous[-1]
+
+
+def _trigrams(key: str) -> set:
+    padded = f"\0\0{key}\0\0"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FuzzyTitleIndex:
+    """
+    Trigram index for typo-tolerant title search.
+
+    One edit touches at most three trigrams of a title, so a title within
+    distance k of the query shares all but 3k of the query's trigrams, and
+    its length differs by at most k. Posting lists are split by title
+    length, so a search only counts trigram hits among titles of a
+    possible length; titles with too few hits are dropped before the
+    (banded) edit-distance check.
+    """
+
+    compact_ratio = 0.25  # rebuild once this share of title numbers are dead
+
+    def __init__(self) -> None:
+        self.keys: List[str] = []  # title number -> lowercase title
+        self.books: List[List[Book]] = []  # title number -> books with that title (empty once dead)
+        self.numbers: Dict[str, int] = {}  # lowercase title -> title number, live titles only
+        self.dead = 0
+        self.by_length: Dict[int, array] = {}  # title length -> title numbers
+        self.postings: Dict[Tuple[str, int], array] = {}  # (trigram, title length) -> title numbers
+
+    def add(self, book: Book) -> None:
+        key = book.title.lower()
+        number = self.numbers.get(key)
+        if number is not None:
+            self.books[number].append(book)
+            return
+
+        number = len(self.keys)
+        self.numbers[key] = number
+        self.keys.append(key)
+        self.books.append([book])
+        self.by_length.setdefault(len(key), array("I")).append(number)
+        for gram in _trigrams(key):
+            posting = self.postings.get((gram, len(key)))
+            if posting is None:
+                posting = self.postings[(gram, len(key))] = array("I")
+            posting.append(number)
+
+    def remove(self, book: Book) -> None:
+        """
+        Remove a book. A title left with no books becomes a dead number that
+        searches skip; its postings go at the next compaction.
+        """
+        key = book.title.lower()
+        number = self.numbers[key]
+        same_title = self.books[number]
+        same_title[:] = [existing for existing in same_title if existing is not book]
+        if not same_title:
+            del self.numbers[key]
+            self.dead += 1
+
+    def maybe_compact(self) -> None:
+        """Rebuild without dead titles once they pass compact_ratio of all titles."""
+        if self.dead > self.compact_ratio * len(self.keys):
+            live = [book for same_title in self.books for book in same_title]
+            self.__init__()
+            for book in live:
+                self.add(book)
+
+    def search(self, title: str, max_distance: int = 2) -> List[Tuple[int, str, List[Book]]]:
+        """Return (distance, title, books) for every title within max_distance, closest first."""
+        key = title.lower()
+        grams = _trigrams(key)
+        lengths = range(max(0, len(key) - max_distance), len(key) + max_distance + 1)
+        needed = len(grams) - 3 * max_distance
+
+        if needed <= 0:
+            # too short to filter on: any title of a possible length could match
+            candidates: Iterable[int] = [
+                number for length in lengths for number in self.by_length.get(length, ())
+            ]
+        else:
+            hits: Counter = Counter()
+            for gram in grams:
+                for length in lengths:
+                    posting = self.postings.get((gram, length))
+                    if posting is not None:
+                        hits.update(posting)
+            candidates = [number for number, count in hits.items() if count >= needed]
+
+        matches = []
+        for number in candidates:
+            if not self.books[number]:
+                continue  # dead title
+            other = self.keys[number]
+            distance = edit_distance(key, other, max_distance)
+            if distance <= max_distance:
+                matches.append((distance, other, self.books[number]))
+        matches.sort(key=lambda match: (match[0], match[1]))
+        return matches
+
+
+class OperationMetrics:
+    """
+    Call counts and latency histograms per operation name.
+    Bucket i counts calls that took at most bucket_bounds_us[i]
+    microseconds; the last bucket holds everything slower.
+    """
+
+    bucket_bounds_us = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1_000, 2_000, 5_000, 10_000, 100_000)
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._bounds = [bound / 1e6 for bound in self.bucket_bounds_us]
+        self.calls: Dict[str, int] = {}
+        self.total_seconds: Dict[str, float] = {}
+        self.max_seconds: Dict[str, float] = {}
+        self.histograms: Dict[str, List[int]] = {}
+
+    def record(self, name: str, seconds: float) -> None:
+        bucket = bisect_left(self._bounds, seconds)
+        with self._lock:
+            if name not in self.calls:
+                self.calls[name] = 0
+                self.total_seconds[name] = 0.0
+                self.max_seconds[name] = 0.0
+                self.histograms[name] = [0] * (len(self._bounds) + 1)
+            self.calls[name] += 1
+            self.total_seconds[name] += seconds
+            self.max_seconds[name] = max(self.max_seconds[name], seconds)
+            self.histograms[name][bucket] += 1
+
+    def _percentile_us(self, histogram: List[int], fraction: float) -> float:
+        """Upper bound of the bucket holding the given fraction of calls."""
+        target = fraction * sum(histogram)
+        seen = 0
+        for bound, count in zip(self.bucket_bounds_us, histogram):
+            seen += count
+            if seen >= target:
+                return bound
+        return math.inf
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                name: {
+                    "calls": calls,
+                    "mean_us": self.total_seconds[name] / calls * 1e6,
+                    "max_us": self.max_seconds[name] * 1e6,
+                    "p50_us": self._percentile_us(self.histograms[name], 0.50),
+                    "p99_us": self._percentile_us(self.histograms[name], 0.99),
+                    "histogram": list(self.histograms[name]),
+                }
+                for name, calls in self.calls.items()
+            }
+
+
+class SearchCache:
+    """
+    Bounded cache of title search results, least recently used evicted
+    first, each entry dropped `ttl_seconds` after it was stored (None =
+    never). Keys are ("exact", title, None) and ("prefix", prefix, limit),
+    lowercase.
+
+    Invalidation is exact: when a title comes or goes, only the entry for
+    that title and the entries for its prefixes (one dict lookup per
+    character) are dropped; everything else stays cached. Results longer
+    than max_result_size are not cached, so a short prefix cannot pin a
+    large slice of the catalogue in memory.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1_024,
+        ttl_seconds: Optional[float] = 60.0,
+        max_result_size: int = 1_000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_result_size = max_result_size
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str, Optional[int]], Tuple[float, List[Book]]]" = OrderedDict()
+        self._by_text: Dict[Tuple[str, str], Set[Tuple[str, str, Optional[int]]]] = {}  # (kind, text) -> keys
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, kind: str, text: str, limit: Optional[int] = None) -> Optional[List[Book]]:
+        """The cached result, or None on a miss (or if it has expired)."""
+        key = (kind, text, limit)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < self.clock():
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, kind: str, text: str, limit: Optional[int], books: List[Book]) -> None:
+        if len(books) > self.max_result_size:
+            return
+        key = (kind, text, limit)
+        expires = self.clock() + self.ttl_seconds if self.ttl_seconds is not None else math.inf
+        with self._lock:
+            if key not in self._entries:
+                self._by_text.setdefault((kind, text), set()).add(key)
+            self._entries[key] = (expires, books)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key: Tuple[str, str, Optional[int]]) -> None:
+        del self._entries[key]
+        keys = self._by_text[key[:2]]
+        keys.discard(key)
+        if not keys:
+            del self._by_text[key[:2]]
+
+    def invalidate_title(self, title: str) -> None:
+        """Drop every cached result a book with this title could appear in."""
+        key = title.lower()
+        with self._lock:
+            if not self._by_text:
+                return
+            touched = [("exact", key)] + [("prefix", key[:end]) for end in range(len(key) + 1)]
+            for text_key in touched:
+                for entry_key in list(self._by_text.get(text_key, ())):
+                    self._drop(entry_key)
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._by_text.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+class ReadWriteLock:
+    """
+    Lock that lets any number of readers in at once, or one writer alone.
+    Waiting writers stop new readers from entering so they are not starved.
+    Not re-entrant: a thread holding it must not acquire it again.
+    """
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        with self._condition:
+            while self._writer or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        with self._condition:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+
+class Library:
+    """
+    Main library class that uses:
+    - HashTable for fast lookup by book_id
+    - TitleIndexBst (or TitleIndexRadix) for searching by title
+    - TitleIndexBst keyed on author for exact and prefix author searches
+    - HashTable of subject -> books for subject searches
+    - SortedBlockList of (due_date, book_id) for books on loan, for overdue reports
+    - HashTables of user_id -> book_ids on loan / reserved, for per-user lists
+    - heap of (hold expiry, book_id, user_id, ticket) for expire_holds
+
+    title_index_type picks the title index: "bst" (default) or "radix".
+
+    The library is safe to share between threads. The indexes sit behind
+    a readers-writer lock, so searches run side by side and only adding
+    books locks everyone out. Loans are guarded per book by a fixed set
+    of striped locks, so borrows and returns of different books do not
+    wait for each other.
+    """
+
+    loan_period_days = 14
+    # None: reservations wait as long as the queue takes. A number makes a
+    # reservation lapse that many days after it was made, wherever it is
+    # in the queue by then.
+    hold_period_days: Optional[int] = None
+    loan_lock_stripes = 64
+
+    # methods that enable_metrics() times
+    instrumented_methods = (
+        "add_book", "bulk_load", "remove_book", "remove_books", "update_book",
+        "get_book_by_id", "get_books",
+        "search_title_exact", "search_title_prefix", "search_title_fuzzy",
+        "search_author_exact", "search_author_prefix", "search_subject", "search_text", "query",
+        "borrow_book", "return_book", "cancel_reservation", "reservation_position", "expire_holds",
+        "list_user_loans", "list_user_reservations",
+        "list_all_books", "list_books_sorted_by_title",
+        "list_overdue_books", "list_books_due_within",
+    )
+
+    def __init__(self, title_index_type: str = "bst") -> None:
+        self.id_index = HashTable()
+        if title_index_type == "bst":
+            self.title_index = TitleIndexBst()
+        elif title_index_type == "radix":
+            self.title_index = TitleIndexRadix()
+        else:
+            raise ValueError(f"Unknown title index type: {title_index_type}")
+        self.author_index = TitleIndexBst(field="author")
+        self.subject_index = HashTable()  # lowercase subject -> list of books
+        self.text_index = TextIndex()
+        self.fuzzy_index = FuzzyTitleIndex()
+        self.due_index = SortedBlockList()  # (due_date, book_id), one entry per book on loan
+        self.user_loans = HashTable()  # user_id -> set of book_ids they have on loan
+        self.user_reservations = HashTable()  # user_id -> set of book_ids they are queued for
+        self.hold_heap: List[Tuple[date, str, str, int]] = []  # (expires, book_id, user_id, ticket)
+        self.journal: Optional[Any] = None  # object with record(event), e.g. a LibraryStore
+
+        self.index_lock = ReadWriteLock()
+        self._loan_locks = [threading.Lock() for _ in range(self.loan_lock_stripes)]
+        self._due_lock = threading.Lock()
+        self._users_lock = threading.Lock()  # guards user_loans, user_reservations and hold_heap
+
+        self.metrics: Optional[OperationMetrics] = None
+        self._call_depth = threading.local()
+        self.search_cache: Optional[SearchCache] = None
+
+    # attributes that cannot cross a process boundary; rebuilt on unpickling
+    _process_local = (
+        "index_lock", "_loan_locks", "_due_lock", "_users_lock", "_call_depth", "journal", "metrics", "search_cache",
+    )
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """
+        Pickle the books and indexes only, so a library built in a worker
+        process can be sent back. Locks, the journal, metrics and timed
+        wrappers stay behind.
+        """
+        return {
+            name: value for name, value in self.__dict__.items()
+            if name not in self._process_local and name not in self.instrumented_methods
+        }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.journal = None
+        self.index_lock = ReadWriteLock()
+        self._loan_locks = [threading.Lock() for _ in range(self.loan_lock_stripes)]
+        self._due_lock = threading.Lock()
+        self._users_lock = threading.Lock()
+        self.metrics = None
+        self._call_depth = threading.local()
+        self.search_cache = None
+
+    # --- metrics ---
+
+    def enable_metrics(self) -> None:
+        """
+        Start counting and timing calls to the instrumented methods.
+        Timed wrappers are installed on this instance only, so a library
+        with metrics off runs the plain methods at no extra cost.
+        A call made from inside another instrumented call is not counted
+        again (return_book looking up the book is just part of return_book).
+        """
+        if self.metrics is not None:
+            return
+        self.metrics = OperationMetrics()
+        for name in self.instrumented_methods:
+            setattr(self, name, self._timed(name, getattr(self, name)))
+
+    def disable_metrics(self) -> None:
+        """Remove the timed wrappers and drop the collected metrics."""
+        for name in self.instrumented_methods:
+            self.__dict__.pop(name, None)
+        self.metrics = None
+
+    # --- search cache ---
+
+    def enable_search_cache(
+        self, max_entries: int = 1_024, ttl_seconds: Optional[float] = 60.0, max_result_size: int = 1_000
+    ) -> None:
+        """
+        Start caching search_title_exact and search_title_prefix results
+        (see SearchCache). Adding, removing or retitling a book drops the
+        cached results it touches, so a cached answer is never stale.
+        """
+        with self.index_lock.write():
+            self.search_cache = SearchCache(max_entries, ttl_seconds, max_result_size)
+
+    def disable_search_cache(self) -> None:
+        with self.index_lock.write():
+            self.search_cache = None
+
+    def _invalidate_titles(self, titles: Iterable[str]) -> None:
+        """Caller holds the index write lock, so no reader can cache a result in between."""
+        cache = self.search_cache
+        if cache is None:
+            return
+        titles = list(titles)
+        if len(titles) > cache.max_entries:
+            cache.clear()  # cheaper than checking every prefix of every title
+            return
+        for title in titles:
+            cache.invalidate_title(title)
+
+    def _timed(self, name: str, method: Any) -> Any:
+        metrics = self.metrics
+        depth = self._call_depth
+
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            outer = not getattr(depth, "value", 0)
+            depth.value = getattr(depth, "value", 0) + 1
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                depth.value -= 1
+                if outer:
+                    metrics.record(name, time.perf_counter() - start)
+
+        timed.__name__ = name
+        timed.__doc__ = method.__doc__
+        return timed
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Snapshot of per-operation metrics (if enabled) and of the shape of
+        every index: hash table load and chain/probe lengths, tree heights
+        and balance, and reservation queue lengths. Structural stats walk
+        the whole structure, so this is O(n); it is meant for monitoring,
+        not for every request.
+        """
+        with self.index_lock.read():
+            queues = [len(book.reservation_queue) for book in self.id_index.values() if book.has_reservations]
+            report: Dict[str, Any] = {
+                "books": len(self.id_index),
+                "id_index": self.id_index.stats(),
+                "title_index": self.title_index.stats(),
+                "author_index": self.author_index.stats(),
+                "subject_index": self.subject_index.stats(),
+            }
+        with self._due_lock:
+            report["loans"] = {
+                "on_loan": len(self.due_index),
+                "books_with_reservations": len(queues),
+                "waiting_users": sum(queues),
+                "max_queue_length": max(queues, default=0),
+            }
+        report["operations"] = self.metrics.snapshot() if self.metrics is not None else None
+        report["search_cache"] = self.search_cache.stats() if self.search_cache is not None else None
+        return report
+
+    def _loan_lock(self, book_id: str) -> threading.Lock:
+        return self._loan_locks[hash(book_id) % len(self._loan_locks)]
+
+    def _record(self, *event: Any) -> None:
+        """
+        Journal a change. Called inside the critical section that made it
+        (index write lock or the book's loan lock), so events reach the
+        journal in the order the changes were made.
+        """
+        if self.journal is not None:
+            self.journal.record(event)
+
+    @contextmanager
+    def _journalled(self) -> Iterator[None]:
+        """
+        Wrap a journalled change outside its locks. Compacting the journal
+        needs every lock to itself, so it only runs once they are released.
+        """
+        try:
+            yield
+        finally:
+            if self.journal is not None:
+                self.journal.compact_if_due()
+
+    def _add_user_entry(self, table: HashTable, user_id: str, book_id: str) -> None:
+        with self._users_lock:
+            book_ids = table.peek(user_id)
+            if book_ids is None:
+                table.put(user_id, {book_id})
+            else:
+                book_ids.add(book_id)
+
+    def _remove_user_entry(self, table: HashTable, user_id: str, book_id: str) -> None:
+        with self._users_lock:
+            book_ids = table.peek(user_id)
+            if book_ids is not None:
+                book_ids.discard(book_id)
+                if not book_ids:
+                    table.delete(user_id)
+
+    def _forget_book_users(self, book: Book) -> None:
+        """Drop a withdrawn book from its borrower's and every waiting user's lists."""
+        if book.is_on_loan:
+            self._remove_user_entry(self.user_loans, book.borrower_id, book.book_id)
+        if book.has_reservations:
+            for user_id in book.reservation_queue:
+                self._remove_user_entry(self.user_reservations, user_id, book.book_id)
+
+    def _index_subject(self, book: Book) -> None:
+        key = book.subject.lower()
+        books = self.subject_index.peek(key)
+        if books is None:
+            self.subject_index.put(key, [book])
+        else:
+            books.append(book)
+
+    # --- catalogue operations ---
+
+    def add_book(self, book_id: str, title: str, author: str, subject: str) -> None:
+        """Add a new book to the library catalogue."""
+        with self._journalled(), self.index_lock.write():
+            if self.id_index.get(book_id) is not None:
+                raise ValueError(f"Book with id {book_id} already exists")
+
+            book = Book(book_id, title, author, subject)
+            self.id_index.put(book_id, book)
+            self.title_index.insert(title, book)
+            self.author_index.insert(author, book)
+            self._index_subject(book)
+            self.text_index.add(book)
+            self.fuzzy_index.add(book)
+            self._invalidate_titles([title])
+            self._record("add", book_id, title, author, subject)
+
+    @contextmanager
+    def _all_loan_locks(self) -> Iterator[None]:
+        """Hold every loan stripe, always taken in the same order."""
+        for lock in self._loan_locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(self._loan_locks):
+                lock.release()
+
+    def _unindex(self, book: Book) -> None:
+        """
+        Take a book out of every index except the HashTable. Caller holds
+        the index write lock and the book's loan lock.
+        """
+        self.title_index.remove(book.title, book)
+        self.author_index.remove(book.author, book)
+        self.text_index.remove(book)
+        self.fuzzy_index.remove(book)
+        self._invalidate_titles([book.title])
+
+        subject_books = self.subject_index.peek(book.subject.lower())
+        subject_books[:] = [existing for existing in subject_books if existing is not book]
+        if not subject_books:
+            self.subject_index.delete(book.subject.lower())
+
+        if book.is_on_loan:
+            with self._due_lock:
+                self.due_index.remove((book.due_date, book.book_id))
+        self._forget_book_users(book)
+
+    def remove_book(self, book_id: str) -> Book:
+        """
+        Withdraw a book from the catalogue and every index.
+        A book on loan is withdrawn too; the returned Book still carries its
+        borrower and reservation queue so they can be told.
+        """
+        with self._journalled(), self._loan_lock(book_id), self.index_lock.write():
+            book = self.id_index.get(book_id)
+            if book is None:
+                raise ValueError(f"Book with id {book_id} not found")
+            self.id_index.delete(book_id)
+            self._unindex(book)
+            self.text_index.maybe_compact()
+            self.fuzzy_index.maybe_compact()
+            self._record("remove", book_id)
+        return book
+
+    def remove_books(self, book_ids: Iterable[str]) -> List[Book]:
+        """
+        Withdraw many books at once. Unknown ids are skipped. The trees pay
+        O(log n) per book; the text and fuzzy indexes only tombstone entries
+        and compact once at the end if enough have piled up, and each subject
+        list is filtered once for the whole batch.
+        Returns the books that were removed.
+        """
+        book_ids = list(book_ids)
+        removed: List[Book] = []
+        with self._journalled(), self._all_loan_locks(), self.index_lock.write():
+            for book_id in book_ids:
+                book = self.id_index.get(book_id)
+                if book is None:
+                    continue
+                self.id_index.delete(book_id)
+                self.title_index.remove(book.title, book)
+                self.author_index.remove(book.author, book)
+                self.text_index.remove(book)
+                self.fuzzy_index.remove(book)
+                self._forget_book_users(book)
+                removed.append(book)
+
+            self._invalidate_titles(book.title for book in removed)
+            gone = {id(book) for book in removed}
+            for subject in {book.subject.lower() for book in removed}:
+                subject_books = self.subject_index.peek(subject)
+                subject_books[:] = [book for book in subject_books if id(book) not in gone]
+                if not subject_books:
+                    self.subject_index.delete(subject)
+
+            loans = {(book.due_date, book.book_id) for book in removed if book.is_on_loan}
+            if loans:
+                with self._due_lock:
+                    self.due_index.reset(loan for loan in self.due_index if loan not in loans)
+
+            self.text_index.maybe_compact()
+            self.fuzzy_index.maybe_compact()
+            self._record("remove_books", [book.book_id for book in removed])
+        return removed
+
+    def update_book(
+        self,
+        book_id: str,
+        title: Optional[str] = None,
+        author: Optional[str] = None,
+        subject: Optional[str] = None,
+    ) -> Book:
+        """Change a book's title, author and/or subject, re-indexing it under the new values."""
+        with self._journalled(), self._loan_lock(book_id), self.index_lock.write():
+            book = self.id_index.get(book_id)
+            if book is None:
+                raise ValueError(f"Book with id {book_id} not found")
+
+            self.text_index.remove(book)
+            if title is not None:
+                self._invalidate_titles([book.title, title])
+                self.title_index.remove(book.title, book)
+                self.fuzzy_index.remove(book)
+                book.title = title
+                self.title_index.insert(title, book)
+                self.fuzzy_index.add(book)
+            if author is not None:
+                self.author_index.remove(book.author, book)
+                book.author = sys.intern(author)
+                self.author_index.insert(author, book)
+            if subject is not None:
+                subject_books = self.subject_index.peek(book.subject.lower())
+                subject_books[:] = [existing for existing in subject_books if existing is not book]
+                if not subject_books:
+                    self.subject_index.delete(book.subject.lower())
+                book.subject = sys.intern(subject)
+                self._index_subject(book)
+            self.text_index.add(book)
+            self.text_index.maybe_compact()
+            self.fuzzy_index.maybe_compact()
+            self._record("update", book_id, title, author, subject)
+        return book
+
+    def bulk_load(self, records: Iterable[Tuple[str, str, str, str]]) -> Dict[str, float]:
+        """
+        Add many books at once from (book_id, title, author, subject) records.
+
+        The id table is resized once for the whole batch, duplicates are
+        found in a single pass before anything is changed, and the title
+        index is rebuilt bottom-up from sorted titles. Every lock is held, so
+        a journal can fold the batch straight into a fresh snapshot.
+        Returns the number of books loaded and the time spent in each stage.
+        """
+        report: Dict[str, float] = {}
+
+        start = time.perf_counter()
+        books = [Book(book_id, title, author, subject) for book_id, title, author, subject in records]
+        report["read_seconds"] = time.perf_counter() - start
+
+        with self._every_lock():
+            start = time.perf_counter()
+            duplicates = self._duplicate_ids(book.book_id for book in books)
+            if duplicates:
+                shown = ", ".join(duplicates[:5])
+                raise ValueError(f"{len(duplicates)} duplicate book id(s), e.g. {shown}")
+            report["duplicate_check_seconds"] = time.perf_counter() - start
+
+            report.update(self._index_books(books))
+            self._record("bulk_load", len(books))
+        report["books_loaded"] = len(books)
+        return report
+
+    @contextmanager
+    def _every_lock(self) -> Iterator[None]:
+        """Hold every loan stripe and the index write lock, the way bulk_load and compaction do."""
+        with self._all_loan_locks(), self.index_lock.write():
+            yield
+
+    def _duplicate_ids(self, book_ids: Iterable[str]) -> List[str]:
+        """Ids already in the library or repeated in book_ids. Caller holds the index lock."""
+        seen = set()
+        duplicates: List[str] = []
+        for book_id in book_ids:
+            if book_id in seen or book_id in self.id_index:
+                duplicates.append(book_id)
+            seen.add(book_id)
+        return duplicates
+
+    def _adopt(self, built: "Library") -> None:
+        """
+        Take over the books and indexes of a library built elsewhere, such
+        as in a worker process, keeping this object's locks and journal.
+        The caller holds every lock and this library has no books.
+        """
+        self.__dict__.update(built.__getstate__())
+        if self.search_cache is not None:
+            self.search_cache.clear()
+
+    def _index_books(self, books: List[Book]) -> Dict[str, float]:
+        """
+        Add already-checked books to every index, timing each one.
+        The caller holds the index write lock (or owns the library alone).
+        """
+        report: Dict[str, float] = {}
+
+        start = time.perf_counter()
+        self.id_index.reserve(len(self.id_index) + len(books))
+        for book in books:
+            self.id_index.put(book.book_id, book)
+        report["id_index_seconds"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.title_index.bulk_insert(books)
+        self._invalidate_titles(book.title for book in books)
+        report["title_index_seconds"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.author_index.bulk_insert(books)
+        for book in books:
+            self._index_subject(book)
+            self.text_index.add(book)
+            self.fuzzy_index.add(book)
+        loans = [(book.due_date, book.book_id) for book in books if book.is_on_loan]
+        if loans:
+            with self._due_lock:
+                self.due_index.reset([*self.due_index, *loans])
+        for book in books:
+            if book.is_on_loan:
+                self._add_user_entry(self.user_loans, book.borrower_id, book.book_id)
+            if book.has_reservations:
+                self._index_queue(book)
+        report["secondary_index_seconds"] = time.perf_counter() - start
+
+        return report
+
+    def get_book_by_id(self, book_id: str) -> Optional[Book]:
+        """Return a book by its ID, or None if not found."""
+        with self.index_lock.read():
+            return self.id_index.peek(book_id)
+
+    def get_books(self, book_ids: Iterable[str]) -> List[Optional[Book]]:
+        """Look up many ids under one read lock; missing ids give None."""
+        with self.index_lock.read():
+            return [self.id_index.peek(book_id) for book_id in book_ids]
+
+    # A cache hit skips the index lock: entries are only stored under the
+    # read lock and dropped under the write lock, so a hit is either the
+    # current answer or the answer from just before a write in progress.
+
+    def search_title_exact(self, title: str) -> List[Book]:
+        """Return a list of books with exactly this title."""
+        cache = self.search_cache
+        if cache is not None:
+            books = cache.get("exact", title.lower())
+            if books is not None:
+                return list(books)
+        with self.index_lock.read():
+            books = list(self.title_index.search_exact(title))
+            if cache is not None:
+                cache.put("exact", title.lower(), None, books)
+                return list(books)
+            return books
+
+    def search_title_prefix(self, prefix: str, limit: Optional[int] = None) -> List[Book]:
+        """Return a list of books whose titles start with this prefix (at most `limit`)."""
+        cache = self.search_cache
+        if cache is not None:
+            books = cache.get("prefix", prefix.lower(), limit)
+            if books is not None:
+                return list(books)
+        with self.index_lock.read():
+            books = self.title_index.search_prefix(prefix, limit)
+            if cache is not None:
+                cache.put("prefix", prefix.lower(), limit, books)
+                return list(books)
+            return books
+
+    def iter_title_prefix(self, prefix: str) -> Iterator[Book]:
+        """
+        Lazily yield books whose titles start with this prefix, in title order
+        (books sharing a title by book_id), fetched a chunk at a time.
+        """
+        for _, book in self._iter_index(self.title_index, prefix.lower()):
+            yield book
+
+    def search_author_exact(self, author: str) -> List[Book]:
+        """Return a list of books by exactly this author."""
+        with self.index_lock.read():
+            return list(self.author_index.search_exact(author))
+
+    def search_author_prefix(self, prefix: str, limit: Optional[int] = None) -> List[Book]:
+        """Return a list of books whose author starts with this prefix (at most `limit`)."""
+        with self.index_lock.read():
+            return self.author_index.search_prefix(prefix, limit)
+
+    def iter_author_prefix(self, prefix: str) -> Iterator[Book]:
+        """Lazily yield books whose author starts with this prefix, in author order (see iter_title_prefix)."""
+        for _, book in self._iter_index(self.author_index, prefix.lower()):
+            yield book
+
+    def search_subject(self, subject: str) -> List[Book]:
+        """Return a list of books on exactly this subject."""
+        with self.index_lock.read():
+            return list(self.subject_index.peek(subject.lower()) or [])
+
+    def search_title_fuzzy(self, title: str, max_distance: int = 2, limit: Optional[int] = None) -> List[Book]:
+        """
+        Return books whose title is within `max_distance` edits of this one
+        (case-insensitive), closest titles first, at most `limit` of them.
+        """
+        with self.index_lock.read():
+            # the same_title lists belong to the index, so copy out of them under the lock
+            matches = self.fuzzy_index.search(title, max_distance)
+            books = (book for _, _, same_title in matches for book in same_title)
+            return list(islice(books, limit))
+
+    def search_text(self, query: str, limit: Optional[int] = 10, match_all: bool = True) -> List[Book]:
+        """
+        Return books whose title, author or subject contain the query words,
+        best BM25 match first (at most `limit`). match_all=False finds
+        books with any of the words instead of all of them.
+        """
+        with self.index_lock.read():
+            return [book for _, book in self.text_index.search(query, limit, match_all)]
+
+    def query(
+        self,
+        author: Optional[str] = None,
+        author_prefix: Optional[str] = None,
+        subject: Optional[str] = None,
+        title_prefix: Optional[str] = None,
+    ) -> List[Book]:
+        """
+        Return books matching every filter given (all case-insensitive).
+
+        The smallest posting list is picked as the starting set: exact
+        author/subject lists have a known length, and prefix matches are
+        only counted up to the size of the best list so far. Every other
+        filter is then checked on that starting set alone, so the rest of
+        the catalogue is never touched.
+        """
+        with self.index_lock.read():
+            return self._query(author, author_prefix, subject, title_prefix)
+
+    def _query(
+        self,
+        author: Optional[str],
+        author_prefix: Optional[str],
+        subject: Optional[str],
+        title_prefix: Optional[str],
+    ) -> List[Book]:
+        checks: List[Tuple[str, str, bool]] = []  # (book field, lowercase value, is prefix)
+        best: Optional[List[Book]] = None
+
+        for field, value in (("author", author), ("subject", subject)):
+            if value is None:
+                continue
+            checks.append((field, value.lower(), False))
+            if field == "author":
+                books = self.author_index.search_exact(value)
+            else:
+                books = self.subject_index.peek(value.lower()) or []
+            if best is None or len(books) < len(best):
+                best = books
+
+        for field, value, index in (
+            ("author", author_prefix, self.author_index),
+            ("title", title_prefix, self.title_index),
+        ):
+            if value is None:
+                continue
+            checks.append((field, value.lower(), True))
+            # stop counting once this prefix is no better than the best list
+            cap = None if best is None else len(best)
+            books = list(islice(index.iter_prefix(value), cap))
+            if best is None or len(books) < len(best):
+                best = books
+
+        if best is None:
+            raise ValueError("query needs at least one filter")
+
+        results: List[Book] = []
+        for book in best:
+            for field, value, is_prefix in checks:
+                key = getattr(book, field).lower()
+                if not (key.startswith(value) if is_prefix else key == value):
+                    break
+            else:
+                results.append(book)
+        return results
+
+    # --- loan operations ---
+
+    def _start_loan(self, book: Book, user_id: str, due_date: Optional[date] = None) -> None:
+        book.due_date = due_date or date.today().replace() + timedelta(days=self.loan_period_days)
+        book.is_on_loan = True
+        book.borrower_id = user_id
+        with self._due_lock:
+            self.due_index.add((book.due_date, book.book_id))
+        self._add_user_entry(self.user_loans, user_id, book.book_id)
+        self._record("borrow", book.book_id, user_id, book.due_date.isoformat())
+
+    def _end_loan(self, book: Book) -> None:
+        with self._due_lock:
+            self.due_index.remove((book.due_date, book.book_id))
+        self._remove_user_entry(self.user_loans, book.borrower_id, book.book_id)
+        book.is_on_loan = False
+        book.borrower_id = None
+        book.due_date = None
+        self._record("return", book.book_id)
+
+    def _index_queue(self, book: Book) -> None:
+        """Add everyone already in a book's queue to the per-user index and the expiry heap."""
+        queue = book.reservation_queue
+        for user_id, expires in queue.entries():
+            self._add_user_entry(self.user_reservations, user_id, book.book_id)
+            if expires is not None:
+                with self._users_lock:
+                    heapq.heappush(self.hold_heap, (expires, book.book_id, user_id, queue.ticket(user_id)))
+
+    def _reserve(self, book: Book, user_id: str, expires: Optional[date]) -> None:
+        queue = book.reservation_queue
+        queue.append(user_id, expires)
+        self._add_user_entry(self.user_reservations, user_id, book.book_id)
+        if expires is not None:
+            with self._users_lock:
+                heapq.heappush(self.hold_heap, (expires, book.book_id, user_id, queue.ticket(user_id)))
+        self._record("reserve", book.book_id, user_id, expires.isoformat() if expires is not None else None)
+
+    def _cancel(self, book: Book, user_id: str) -> bool:
+        """Take a user out of a book's queue. Caller holds the book's loan lock."""
+        if not book.has_reservations or not book.reservation_queue.remove(user_id):
+            return False
+        self._remove_user_entry(self.user_reservations, user_id, book.book_id)
+        self._record("cancel", book.book_id, user_id)
+        return True
+
+    def replay_event(self, event: Tuple[Any, ...]) -> None:
+        """
+        Apply one event recorded in a journal. Loans keep the due date they
+        were given at the time rather than being re-dated to today.
+        """
+        kind = event[0]
+        if kind == "add":
+            self.add_book(*event[1:])
+            return
+        if kind == "remove_books":
+            self.remove_books(event[1])
+            return
+
+        book = self.get_book_by_id(event[1])
+        if book is None:
+            raise ValueError(f"Journal refers to unknown book {event[1]}")
+        if kind == "borrow":
+            # a hand-over on return takes the user off the front of the queue
+            if book.has_reservations and book.reservation_queue.front() == event[2]:
+                book.reservation_queue.popleft()
+                self._remove_user_entry(self.user_reservations, event[2], book.book_id)
+            self._start_loan(book, event[2], date.fromisoformat(event[3]))
+        elif kind == "reserve":
+            expires = event[3]
+            self._reserve(book, event[2], date.fromisoformat(expires) if expires is not None else None)
+        elif kind == "cancel":
+            self._cancel(book, event[2])
+        elif kind == "return":
+            self._end_loan(book)
+        elif kind == "remove":
+            self.remove_book(event[1])
+        elif kind == "update":
+            self.update_book(*event[1:])
+        else:
+            raise ValueError(f"Unknown journal event: {kind}")
+
+    def borrow_book(self, book_id: str, user_id: str) -> str:
+        """Borrow a book or join the reservation queue if it is on loan."""
+        # check-then-set of the loan must not interleave with another thread,
+        # and the lookup sits inside the lock so the book cannot be withdrawn meanwhile
+        with self._journalled(), self._loan_lock(book_id):
+            book = self.get_book_by_id(book_id)
+            if book is None:
+                return "Book not found."
+
+            if not book.is_on_loan:
+                self._start_loan(book, user_id)
+                return f"Book borrowed successfully. Due date: {book.due_date}"
+            if book.borrower_id == user_id:
+                return "You already have this book on loan."
+            position = book.reservation_queue.position(user_id)
+            if position is not None:
+                return f"You are already in the reservation queue (position {position})."
+
+            # already on loan → add to reservation queue
+            expires = None
+            if self.hold_period_days is not None:
+                expires = date.today() + timedelta(days=self.hold_period_days)
+            self._reserve(book, user_id, expires)
+        return "Book is currently on loan. You have been added to the reservation queue."
+
+    def return_book(self, book_id: str) -> str:
+        """Return a book and possibly issue it to the next user in the reservation queue."""
+        with self._journalled(), self._loan_lock(book_id):
+            book = self.get_book_by_id(book_id)
+            if book is None:
+                return "Book not found."
+
+            if not book.is_on_loan:
+                return "Book is not currently on loan."
+
+            self._end_loan(book)
+
+            # hand over to the first user whose hold has not lapsed; each
+            # lapsed one skipped here is one expire_holds will not meet
+            today = date.today()
+            while book.has_reservations:
+                next_user, expires = book.reservation_queue.popleft()
+                self._remove_user_entry(self.user_reservations, next_user, book_id)
+                if expires is not None and expires < today:
+                    self._record("cancel", book_id, next_user)
+                    continue
+                self._start_loan(book, next_user)
+                return (
+                    "Book returned and issued to next user in queue: "
+                    f"{next_user}, due on {book.due_date}"
+                )
+
+        return "Book returned and is now available."
+
+    def cancel_reservation(self, book_id: str, user_id: str) -> str:
+        """Take a user out of a book's reservation queue, wherever they are in it (O(1))."""
+        with self._journalled(), self._loan_lock(book_id):
+            book = self.get_book_by_id(book_id)
+            if book is None:
+                return "Book not found."
+            if not self._cancel(book, user_id):
+                return "No reservation found."
+        return "Reservation cancelled."
+
+    def reservation_position(self, book_id: str, user_id: str) -> Optional[int]:
+        """A user's place in a book's queue (1 = next to get it), or None if they are not waiting."""
+        with self._loan_lock(book_id):
+            book = self.get_book_by_id(book_id)
+            if book is None or not book.has_reservations:
+                return None
+            return book.reservation_queue.position(user_id)
+
+    def expire_holds(self, today: Optional[date] = None) -> int:
+        """
+        Cancel every reservation whose hold lapsed before `today`, taking
+        them off the expiry heap in date order: O(k log n) for k lapsed
+        holds. Heap entries for reservations already served or cancelled
+        are recognised by their ticket and dropped. Returns how many
+        reservations were cancelled.
+        """
+        today = today or date.today()
+        lapsed = []
+        with self._users_lock:
+            while self.hold_heap and self.hold_heap[0][0] < today:
+                lapsed.append(heapq.heappop(self.hold_heap))
+
+        cancelled = 0
+        with self._journalled():
+            for _, book_id, user_id, ticket in lapsed:
+                with self._loan_lock(book_id):
+                    book = self.get_book_by_id(book_id)
+                    if book is None or not book.has_reservations or book.reservation_queue.ticket(user_id) != ticket:
+                        continue  # stale: served, cancelled or the book is gone
+                    cancelled += self._cancel(book, user_id)
+        return cancelled
+
+    def list_user_loans(self, user_id: str) -> List[Book]:
+        """Books a user has on loan, soonest due first, read from the per-user index."""
+        with self._users_lock:
+            book_ids = list(self.user_loans.peek(user_id) or ())
+        books = [book for book in self.get_books(book_ids) if book is not None and book.borrower_id == user_id]
+        return sorted(books, key=lambda book: (book.due_date, book.book_id))
+
+    def list_user_reservations(self, user_id: str) -> List[Book]:
+        """Books a user is queued for, by book id; see reservation_position for their place."""
+        with self._users_lock:
+            book_ids = sorted(self.user_reservations.peek(user_id) or ())
+        return [book for book in self.get_books(book_ids) if book is not None]
+
+    # --- reporting/lists ---
+
+    # Listings come as lazy iterators or as pages. A page is the `limit`
+    # books that follow the cursor `after`: the sort key of the last book
+    # of the previous page (see title_cursor and due_cursor), so paging
+    # never re-reads what came before. A cursor is a value, not a book, so
+    # it still works if that book is withdrawn, retitled or returned.
+    # Iterators fetch a chunk at a time and hold no lock between chunks,
+    # so the loop body may call back into the library.
+
+    iter_chunk = 1_000  # books fetched under one read lock by the lazy iterators
+
+    @staticmethod
+    def title_cursor(book: Book) -> Tuple[str, str]:
+        """Cursor to resume a title-ordered listing just after this book."""
+        return book.title.lower(), book.book_id
+
+    @staticmethod
+    def due_cursor(book: Book) -> Tuple[date, str]:
+        """Cursor to resume a due-date-ordered listing just after this book."""
+        return book.due_date, book.book_id
+
+    @staticmethod
+    def _walk_index(
+        index: Any, prefix: str = "", after: Optional[Tuple[str, str]] = None
+    ) -> Iterator[Tuple[Tuple[str, str], Book]]:
+        """
+        Walk a title or author index in (key, book_id) order, yielding
+        (cursor, book): books whose key starts with `prefix`, past `after`.
+        Books sharing a key are kept in book_id order by the index, so
+        resuming inside a key is a bisect. Caller holds the read lock.
+        """
+        start = prefix if after is None else max(after[0], prefix)
+        for key, books in index.iter_entries(start):
+            if not key.startswith(prefix):
+                return
+            first = 0
+            if after is not None and key == after[0]:
+                first = bisect_right(books, after[1], key=_book_id)
+            for book in islice(books, first, None):
+                yield (key, book.book_id), book
+
+    def _iter_index(
+        self, index: Any, prefix: str = "", after: Optional[Tuple[str, str]] = None
+    ) -> Iterator[Tuple[Tuple[str, str], Book]]:
+        """_walk_index, iter_chunk books per read lock, resuming from the last cursor in between."""
+        while True:
+            with self.index_lock.read():
+                chunk = list(islice(self._walk_index(index, prefix, after), self.iter_chunk))
+            yield from chunk
+            if len(chunk) < self.iter_chunk:
+                return
+            after = chunk[-1][0]
+
+    def iter_all_books(self) -> Iterator[Book]:
+        """
+        Lazily yield every book, in title order: the walk is resumed after
+        each chunk, and the hash table's own order cannot be resumed.
+        """
+        return self.iter_books_sorted_by_title()
+
+    def list_all_books(self, after: Optional[Tuple[str, str]] = None, limit: Optional[int] = None) -> List[Book]:
+        """
+        Return a list of all books in the library (unsorted), or one page of
+        them. Pages come in title order, the order a cursor can resume from
+        (see list_books_sorted_by_title).
+        """
+        if after is None and limit is None:
+            with self.index_lock.read():
+                return list(self.id_index.values())
+        return self.list_books_sorted_by_title(after, limit)
+
+    def iter_books_sorted_by_title(self, after: Optional[Tuple[str, str]] = None) -> Iterator[Book]:
+        """Lazily yield books in title order, after the title_cursor `after` if given."""
+        for _, book in self._iter_index(self.title_index, after=after):
+            yield book
+
+    def list_books_sorted_by_title(
+        self, after: Optional[Tuple[str, str]] = None, limit: Optional[int] = None
+    ) -> List[Book]:
+        """
+        Return books sorted by title: all of them, or the `limit` books after
+        the title_cursor `after`. Books sharing a title come in book_id
+        order. This is an in-order walk of the title index, so nothing is
+        sorted as a whole and a page costs O(log n + limit).
+        """
+        return [book for _, book in self._title_page(after, limit)]
+
+    def _title_page(
+        self, after: Optional[Tuple[str, str]], limit: Optional[int]
+    ) -> List[Tuple[Tuple[str, str], Book]]:
+        with self.index_lock.read():
+            return list(islice(self._walk_index(self.title_index, after=after), limit))
+
+    def _loans_due_between(
+        self,
+        start: Optional[date],
+        end: date,
+        after: Optional[Tuple[date, str]] = None,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[date, str]]:
+        """Entries of the due-date index with start <= due_date < end, past `after`, at most `limit`."""
+        with self._due_lock:
+            if after is not None and (start is None or after >= (start,)):
+                loans = self.due_index.iter_from(after, inclusive=False)
+            else:
+                loans = self.due_index.iter_from((start,) if start is not None else ())
+            return list(islice(takewhile(lambda loan: loan < (end,), loans), limit))
+
+    def _loan_books(self, loans: List[Tuple[date, str]]) -> List[Tuple[Tuple[date, str], Book]]:
+        """
+        Pair due-index entries with their books. An entry whose loan ended,
+        or whose book was withdrawn, after the index was read is dropped.
+        """
+        with self.index_lock.read():
+            books = [self.id_index.peek(book_id) for _, book_id in loans]
+        return [(loan, book) for loan, book in zip(loans, books) if book is not None and book.due_date == loan[0]]
+
+    def _books_due_between(
+        self,
+        start: Optional[date],
+        end: date,
+        after: Optional[Tuple[date, str]] = None,
+        limit: Optional[int] = None,
+    ) -> List[Tuple[Tuple[date, str], Book]]:
+        """(due-index entry, book) for loans with start <= due_date < end, read from the due-date index."""
+        return self._loan_books(self._loans_due_between(start, end, after, limit))
+
+    def _iter_overdue(self, today: Optional[date], chunk: int) -> Iterator[Tuple[Tuple[date, str], Book]]:
+        end = today or date.today()
+        after = None
+        while True:
+            loans = self._loans_due_between(None, end, after, chunk)
+            yield from self._loan_books(loans)
+            if len(loans) < chunk:
+                return
+            after = loans[-1]
+
+    def iter_overdue_books(self, today: Optional[date] = None, chunk: int = 1_000) -> Iterator[Book]:
+        """
+        Lazily yield overdue books by due date. They are fetched `chunk` at
+        a time and no lock is held in between, so loans can come and go
+        while the iterator is in use.
+        """
+        for _, book in self._iter_overdue(today, chunk):
+            yield book
+
+    def list_overdue_books(
+        self, today: Optional[date] = None, after: Optional[Tuple[date, str]] = None, limit: Optional[int] = None
+    ) -> List[Book]:
+        """
+        Return a list of all overdue books, sorted by due date, or the
+        `limit` of them after the due_cursor `after`. Only the overdue
+        front of the due-date index is read, so this costs O(log n + k)
+        for k books rather than a scan of the catalogue.
+        """
+        loans = self._books_due_between(None, today or date.today(), after, limit)
+        return [book for _, book in loans]
+
+    def list_books_due_within(
+        self,
+        days: int,
+        today: Optional[date] = None,
+        after: Optional[Tuple[date, str]] = None,
+        limit: Optional[int] = None,
+    ) -> List[Book]:
+        """Return books that are not yet overdue but are due in the next `days` days, by due date (paged like list_overdue_books)."""
+        today = today or date.today()
+        loans = self._books_due_between(today, today + timedelta(days=days + 1), after, limit)
+        return [book for _, book in loans]
+
+
+@contextmanager
+def _gc_paused() -> Iterator[None]:
+    """
+    Switch off the cyclic garbage collector for a while. Building or
+    unpickling a shard allocates millions of objects and none of them are
+    garbage, yet each allocation burst would set off another collection.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _build_shard(title_index_type: str, records: List[Tuple[str, str, str, str]]) -> Library:
+    """Bulk load a new library; runs in a worker process, so the result comes back by pickle."""
+    shard = Library(title_index_type)
+    with _gc_paused():
+        shard.bulk_load(records)
+    return shard
+
+
+class ShardedLibrary:
+    """
+    A catalogue split across several Library shards by a hash of book_id,
+    so every book lives in exactly one shard and lookups by id touch only
+    that shard.
+
+    bulk_load builds the books for empty shards side by side in a
+    ProcessPoolExecutor, using one core per shard. Title- and author-ordered answers are a
+    k-way merge (heapq.merge) of the shards' already-sorted index walks,
+    so they are never sorted as a whole. The shard is picked with crc32
+    rather than hash(), which is salted per process.
+
+    Full-text search and query() are left to the shards themselves:
+    BM25 scores from different shards are not comparable.
+    """
+
+    def __init__(self, shard_count: int = 4, title_index_type: str = "bst") -> None:
+        if shard_count < 1:
+            raise ValueError("shard_count must be at least 1")
+        self.title_index_type = title_index_type
+        self.shards = [Library(title_index_type) for _ in range(shard_count)]
+
+    def shard_for(self, book_id: str) -> Library:
+        return self.shards[zlib.crc32(book_id.encode("utf-8")) % len(self.shards)]
+
+    def __len__(self) -> int:
+        return sum(len(shard.id_index) for shard in self.shards)
+
+    # --- catalogue operations ---
+
+    def add_book(self, book_id: str, title: str, author: str, subject: str) -> None:
+        self.shard_for(book_id).add_book(book_id, title, author, subject)
+
+    def bulk_load(self, records: Iterable[Tuple[str, str, str, str]], workers: Optional[int] = None) -> Dict[str, float]:
+        """
+        Split the records by shard and bulk load the shards at once in
+        `workers` processes (default: one per shard, at most one per core).
+        workers=1 loads the shards one after another in this process.
+
+        Every shard is locked from the duplicate check until its books are
+        in, so a rejected batch changes nothing and no concurrent change
+        falls between the check and the load. A worker process builds a
+        new library for each empty shard, which the live shard then adopts
+        under its locks; shards that already hold books load their part in
+        this process, so every Book a caller holds stays the live one.
+        """
+        report: Dict[str, float] = {}
+
+        start = time.perf_counter()
+        parts: List[List[Tuple[str, str, str, str]]] = [[] for _ in self.shards]
+        count = len(self.shards)
+        for record in records:
+            parts[zlib.crc32(record[0].encode("utf-8")) % count].append(record)
+        report["partition_seconds"] = time.perf_counter() - start
+
+        if workers is None:
+            workers = min(count, os.cpu_count() or 1)
+        with ExitStack() as stack:
+            for shard in self.shards:  # always in shard order, so two bulk loads cannot deadlock
+                stack.enter_context(shard._every_lock())
+
+            start = time.perf_counter()
+            duplicates: List[str] = []
+            for shard, part in zip(self.shards, parts):
+                duplicates.extend(shard._duplicate_ids(book_id for book_id, *_ in part))
+            if duplicates:
+                shown = ", ".join(duplicates[:5])
+                raise ValueError(f"{len(duplicates)} duplicate book id(s), e.g. {shown}")
+            report["duplicate_check_seconds"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            in_workers = [
+                number for number, shard in enumerate(self.shards) if parts[number] and not len(shard.id_index)
+            ] if workers > 1 else []
+            if in_workers:
+                with _gc_paused(), ProcessPoolExecutor(max_workers=workers) as pool:
+                    built = list(pool.map(
+                        _build_shard, [self.title_index_type] * len(in_workers), [parts[number] for number in in_workers]
+                    ))
+                for number, library in zip(in_workers, built):
+                    self.shards[number]._adopt(library)
+            for number, part in enumerate(parts):
+                if part and number not in in_workers:
+                    books = [Book(book_id, title, author, subject) for book_id, title, author, subject in part]
+                    self.shards[number]._index_books(books)
+            for part, shard in zip(parts, self.shards):
+                if part:
+                    shard._record("bulk_load", len(part))
+            report["build_seconds"] = time.perf_counter() - start
+        report["workers"] = workers
+        report["books_loaded"] = sum(len(part) for part in parts)
+        return report
+
+    def remove_book(self, book_id: str) -> Book:
+        return self.shard_for(book_id).remove_book(book_id)
+
+    def update_book(
+        self,
+        book_id: str,
+        title: Optional[str] = None,
+        author: Optional[str] = None,
+        subject: Optional[str] = None,
+    ) -> Book:
+        return self.shard_for(book_id).update_book(book_id, title, author, subject)
+
+    def borrow_book(self, book_id: str, user_id: str) -> str:
+        return self.shard_for(book_id).borrow_book(book_id, user_id)
+
+    def return_book(self, book_id: str) -> str:
+        return self.shard_for(book_id).return_book(book_id)
+
+    def cancel_reservation(self, book_id: str, user_id: str) -> str:
+        return self.shard_for(book_id).cancel_reservation(book_id, user_id)
+
+    def reservation_position(self, book_id: str, user_id: str) -> Optional[int]:
+        return self.shard_for(book_id).reservation_position(book_id, user_id)
+
+    def expire_holds(self, today: Optional[date] = None) -> int:
+        return sum(shard.expire_holds(today) for shard in self.shards)
+
+    def list_user_loans(self, user_id: str) -> List[Book]:
+        return list(heapq.merge(
+            *(shard.list_user_loans(user_id) for shard in self.shards),
+            key=lambda book: (book.due_date, book.book_id),
+        ))
+
+    def list_user_reservations(self, user_id: str) -> List[Book]:
+        return list(heapq.merge(
+            *(shard.list_user_reservations(user_id) for shard in self.shards),
+            key=lambda book: book.book_id,
+        ))
+
+    # --- lookups ---
+
+    def get_book_by_id(self, book_id: str) -> Optional[Book]:
+        return self.shard_for(book_id).get_book_by_id(book_id)
+
+    def get_books(self, book_ids: Iterable[str]) -> List[Optional[Book]]:
+        return [self.shard_for(book_id).get_book_by_id(book_id) for book_id in book_ids]
+
+    def search_title_exact(self, title: str) -> List[Book]:
+        return [book for shard in self.shards for book in shard.search_title_exact(title)]
+
+    def _merge_index(
+        self, field: str, prefix: str = "", after: Optional[Tuple[str, str]] = None
+    ) -> Iterator[Book]:
+        """Merge the shards' chunked walks of the `field` index on their (key, book_id) cursors."""
+        walks = heapq.merge(
+            *(shard._iter_index(getattr(shard, field), prefix.lower(), after) for shard in self.shards),
+            key=itemgetter(0),
+        )
+        for _, book in walks:
+            yield book
+
+    def iter_title_prefix(self, prefix: str) -> Iterator[Book]:
+        return self._merge_index("title_index", prefix)
+
+    def search_title_prefix(self, prefix: str, limit: Optional[int] = None) -> List[Book]:
+        """Each shard answers at most `limit` books and only the first `limit` of the merge are kept."""
+        books = heapq.merge(
+            *(shard.search_title_prefix(prefix, limit) for shard in self.shards),
+            key=lambda book: book.title.lower(),
+        )
+        return list(islice(books, limit))
+
+    def search_author_exact(self, author: str) -> List[Book]:
+        return [book for shard in self.shards for book in shard.search_author_exact(author)]
+
+    def search_author_prefix(self, prefix: str, limit: Optional[int] = None) -> List[Book]:
+        books = heapq.merge(
+            *(shard.search_author_prefix(prefix, limit) for shard in self.shards),
+            key=lambda book: book.author.lower(),
+        )
+        return list(islice(books, limit))
+
+    def search_subject(self, subject: str) -> List[Book]:
+        return [book for shard in self.shards for book in shard.search_subject(subject)]
+
+    def search_title_fuzzy(self, title: str, max_distance: int = 2, limit: Optional[int] = None) -> List[Book]:
+        """Each shard answers closest first; the merge re-measures only the matches it is given."""
+        key = title.lower()
+        books = heapq.merge(
+            *(shard.search_title_fuzzy(title, max_distance, limit) for shard in self.shards),
+            key=lambda book: (edit_distance(key, book.title.lower(), max_distance), book.title.lower()),
+        )
+        return list(islice(books, limit))
+
+    # --- reports ---
+
+    def iter_all_books(self) -> Iterator[Book]:
+        for shard in self.shards:
+            yield from shard.iter_all_books()
+
+    def list_all_books(self, after: Optional[Tuple[str, str]] = None, limit: Optional[int] = None) -> List[Book]:
+        if after is None and limit is None:
+            return [book for shard in self.shards for book in shard.list_all_books()]
+        return self.list_books_sorted_by_title(after, limit)
+
+    def iter_books_sorted_by_title(self, after: Optional[Tuple[str, str]] = None) -> Iterator[Book]:
+        """
+        Merge the shards' title-ordered walks, resuming after the
+        title_cursor `after`. Every shard orders books sharing a title by
+        book_id too, so the merge gives the same order one Library would.
+        """
+        return self._merge_index("title_index", after=after)
+
+    def list_books_sorted_by_title(
+        self, after: Optional[Tuple[str, str]] = None, limit: Optional[int] = None
+    ) -> List[Book]:
+        pages = heapq.merge(
+            *(shard._title_page(after, limit) for shard in self.shards),
+            key=itemgetter(0),
+        )
+        return [book for _, book in islice(pages, limit)]
+
+    def _merge_due(
+        self, start: Optional[date], end: date, after: Optional[Tuple[date, str]], limit: Optional[int]
+    ) -> List[Book]:
+        # merged on the due-index entries, which stay put if a loan ends meanwhile
+        loans = heapq.merge(
+            *(shard._books_due_between(start, end, after, limit) for shard in self.shards),
+            key=itemgetter(0),
+        )
+        return [book for _, book in islice(loans, limit)]
+
+    def iter_overdue_books(self, today: Optional[date] = None) -> Iterator[Book]:
+        loans = heapq.merge(
+            *(shard._iter_overdue(today, 1_000) for shard in self.shards),
+            key=itemgetter(0),
+        )
+        for _, book in loans:
+            yield book
+
+    def list_overdue_books(
+        self, today: Optional[date] = None, after: Optional[Tuple[date, str]] = None, limit: Optional[int] = None
+    ) -> List[Book]:
+        return self._merge_due(None, today or date.today(), after, limit)
+
+    def list_books_due_within(
+        self,
+        days: int,
+        today: Optional[date] = None,
+        after: Optional[Tuple[date, str]] = None,
+        limit: Optional[int] = None,
+    ) -> List[Book]:
+        today = today or date.today()
+        return self._merge_due(today, today + timedelta(days=days + 1), after, limit)
+
+    def stats(self) -> Dict[str, Any]:
+        shards = [shard.stats() for shard in self.shards]
+        return {"books": sum(report["books"] for report in shards), "shards": shards}
+
+
+# --- catalogue files ---
+
+catalogue_fields = ("book_id", "title", "author", "subject")
+
+
+def iter_catalogue_file(path: str) -> Iterator[Tuple[str, str, str, str]]:
+    """
+    Stream (book_id, title, author, subject) records from a catalogue file.
+    `.csv` files need a header row with those column names;
+    `.jsonl` files hold one JSON object per line with the same keys.
+    """
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as file:
+            reader = csv.DictReader(file)
+            missing = [field for field in catalogue_fields if field not in (reader.fieldnames or [])]
+            if missing:
+                raise ValueError(f"{path}: missing column(s) {', '.join(missing)}")
+            for row in reader:
+                # DictReader pads short rows with None and files extra fields under None
+                if None in row or None in row.values():
+                    raise ValueError(
+                        f"{path}, line {reader.line_num}: bad record "
+                        f"(expected {len(reader.fieldnames)} fields)"
+                    )
+                yield row["book_id"], row["title"], row["author"], row["subject"]
+
+    elif path.lower().endswith((".jsonl", ".ndjson")):
+        with open(path, encoding="utf-8") as file:
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                    record = (row["book_id"], row["title"], row["author"], row["subject"])
+                except (ValueError, KeyError, TypeError) as error:
+                    raise ValueError(f"{path}, line {line_number}: bad record ({error})") from None
+                yield record
+
+    else:
+        raise ValueError(f"Unsupported catalogue file type: {path} (expected .csv or .jsonl)")
+
+
+# --- persistence ---
+
+snapshot_magic = b"LIBSNAP1"
+_snapshot_header = struct.Struct("<8sIQ")  # magic, number of books, generation
+_book_header = struct.Struct("<IIIIIiBI")  # 5 string lengths, due ordinal, on loan, queue length
+_string_length = struct.Struct("<I")
+_hold_expiry = struct.Struct("<i")  # after each queued user id: expiry ordinal, 0 = never
+
+
+def write_snapshot(library: Library, path: str, generation: int = 0) -> None:
+    """
+    Write every book, with its loan and reservation state, to a binary
+    snapshot file. Books are written in title order so the title index can
+    be rebuilt from already-sorted input. The file is written next to
+    `path` and then renamed, so a crash never leaves a half-written snapshot.
+    `generation` is stored in the header (see LibraryStore).
+
+    No lock is taken: the caller keeps the library still while it is
+    written, as LibraryStore.compact does by holding all of its locks.
+    """
+    books = [book for _, book in library._walk_index(library.title_index)]
+    temp_path = path + ".tmp"
+
+    with open(temp_path, "wb") as file:
+        file.write(_snapshot_header.pack(snapshot_magic, len(books), generation))
+        for book in books:
+            fields = [
+                value.encode("utf-8")
+                for value in (book.book_id, book.title, book.author, book.subject, book.borrower_id or "")
+            ]
+            queue = list(book.reservation_queue.entries()) if book.has_reservations else []
+            due = book.due_date.toordinal() if book.due_date is not None else 0
+            file.write(_book_header.pack(*(len(field) for field in fields), due, book.is_on_loan, len(queue)))
+            file.write(b"".join(fields))
+            for user_id, expires in queue:
+                encoded = user_id.encode("utf-8")
+                file.write(_string_length.pack(len(encoded)))
+                file.write(encoded)
+                file.write(_hold_expiry.pack(expires.toordinal() if expires is not None else 0))
+
+    os.replace(temp_path, path)
+
+
+def _read_snapshot_header(path: str, data: Any) -> Tuple[int, int]:
+    """(number of books, generation) from the start of a snapshot."""
+    if len(data) < _snapshot_header.size:
+        raise ValueError(f"{path} is not a library snapshot")
+    magic, count, generation = _snapshot_header.unpack_from(data, 0)
+    if magic != snapshot_magic:
+        raise ValueError(f"{path} is not a library snapshot")
+    return count, generation
+
+
+def snapshot_generation(path: str) -> int:
+    """The generation number stored in a snapshot's header."""
+    with open(path, "rb") as file:
+        return _read_snapshot_header(path, file.read(_snapshot_header.size))[1]
+
+
+def read_snapshot(path: str) -> List[Book]:
+    """Decode every book from a snapshot file, reading it through mmap."""
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        count, _ = _read_snapshot_header(path, data)
+
+        books: List[Book] = []
+        offset = _snapshot_header.size
+        for _ in range(count):
+            *lengths, due, on_loan, queue_length = _book_header.unpack_from(data, offset)
+            offset += _book_header.size
+
+            fields = []
+            for length in lengths:
+                fields.append(data[offset:offset + length].decode("utf-8"))
+                offset += length
+            book_id, title, author, subject, borrower_id = fields
+
+            book = Book(book_id, title, author, subject)
+            if on_loan:
+                book.is_on_loan = True
+                book.borrower_id = borrower_id
+                book.due_date = date.fromordinal(due)
+            for _ in range(queue_length):
+                (length,) = _string_length.unpack_from(data, offset)
+                offset += _string_length.size
+                user_id = data[offset:offset + length].decode("utf-8")
+                offset += length
+                (ordinal,) = _hold_expiry.unpack_from(data, offset)
+                offset += _hold_expiry.size
+                book.reservation_queue.append(user_id, date.fromordinal(ordinal) if ordinal else None)
+            books.append(book)
+
+    return books
+
+
+class LibraryStore:
+    """
+    Keeps a Library on disk in `folder`:
+    - catalogue.snapshot: binary snapshot of all books (see write_snapshot)
+    - loans.journal: append-only JSON Lines log of changes since then
+
+    The library is only loaded the first time `store.library` is used:
+    the snapshot is read through mmap and the journal is replayed on top.
+    Loading decodes every book and rebuilds the indexes from them; only
+    the title order is saved, so the title tree is built from sorted input.
+    Once the journal holds compact_after events (or after a bulk load)
+    a fresh snapshot is written and the journal is emptied.
+
+    Each compaction bumps a generation number, stored in the snapshot
+    header and in a {"generation": n} first line of the journal. A journal
+    older than the snapshot (a crash between writing the snapshot and
+    emptying the journal) is already folded in, so it is not replayed.
+    """
+
+    snapshot_name = "catalogue.snapshot"
+    journal_name = "loans.journal"
+    compact_after = 10_000
+
+    def __init__(self, folder: str, title_index_type: str = "bst") -> None:
+        os.makedirs(folder, exist_ok=True)
+        self.snapshot_path = os.path.join(folder, self.snapshot_name)
+        self.journal_path = os.path.join(folder, self.journal_name)
+        self.title_index_type = title_index_type
+
+        self._library: Optional[Library] = None
+        self._journal_file: Optional[Any] = None
+        self.journal_events = 0
+        self.generation = 0
+        self._lock = threading.RLock()  # loans on different books record at the same time
+
+    @property
+    def library(self) -> Library:
+        """The stored Library, loaded from disk on first access."""
+        if self._library is None:
+            self._load()
+        return self._library
+
+    def _load(self) -> None:
+        library = Library(self.title_index_type)
+        if os.path.exists(self.snapshot_path):
+            library._index_books(read_snapshot(self.snapshot_path))
+            self.generation = snapshot_generation(self.snapshot_path)
+
+        damaged = stale = False
+        journal_generation: Optional[int] = None
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # a crash mid-write can only damage the last line
+                        damaged = True
+                        break
+                    if isinstance(event, dict):
+                        journal_generation = event["generation"]
+                        continue
+                    if journal_generation is None:
+                        raise ValueError(f"{self.journal_path} has no generation header")
+                    if journal_generation < self.generation:
+                        stale = True  # the snapshot already holds these events
+                        break
+                    library.replay_event(event)
+                    self.journal_events += 1
+
+        self._library = library
+        self._journal_file = open(self.journal_path, "a", encoding="utf-8")
+        library.journal = self
+        if damaged or stale:
+            self.compact()
+        elif self._journal_file.tell() == 0:
+            self._write_journal_header()
+
+    def _write_journal_header(self) -> None:
+        self._journal_file.write(json.dumps({"generation": self.generation}) + "\n")
+        self._journal_file.flush()
+
+    def record(self, event: Tuple[Any, ...]) -> None:
+        """
+        Append one event to the journal. The Library calls this inside the
+        critical section that made the change; a full journal is compacted
+        later, by compact_if_due, once the Library has let go of its locks.
+        """
+        with self._lock:
+            if event[0] == "bulk_load":
+                # cheaper to snapshot than to journal every new book;
+                # bulk_load holds every lock of the library while it records
+                self._write_compacted()
+                return
+
+            self._journal_file.write(json.dumps(event) + "\n")
+            self._journal_file.flush()
+            self.journal_events += 1
+
+    def compact_if_due(self) -> None:
+        """Compact once the journal holds compact_after events (called by the Library, holding no locks)."""
+        if self.journal_events < self.compact_after:
+            return
+        library = self.library
+        with library._all_loan_locks(), library.index_lock.write(), self._lock:
+            if self.journal_events >= self.compact_after:  # another thread may have compacted meanwhile
+                self._write_compacted()
+
+    def compact(self) -> None:
+        """
+        Write a fresh snapshot of the library and start an empty journal.
+        Every loan lock and the index write lock are held meanwhile, so no
+        change can be half made, or made but not yet journalled.
+        """
+        library = self.library
+        with library._all_loan_locks(), library.index_lock.write(), self._lock:
+            self._write_compacted()
+
+    def _write_compacted(self) -> None:
+        """Snapshot and empty the journal; the caller holds every lock of the library."""
+        # the snapshot goes in place before the journal is emptied; a crash in
+        # between leaves a journal of the old generation, which _load skips
+        write_snapshot(self._library, self.snapshot_path, self.generation + 1)
+        self.generation += 1
+        self._journal_file.close()
+        self._journal_file = open(self.journal_path, "w", encoding="utf-8")
+        self._write_journal_header()
+        self.journal_events = 0
 
-    def list_all_books(self) -> List[Book]:
-        """Return a list of all books in the library (unsorted)."""
-        all_books: List[Book] = []
-        for bucket in self.id_index.buckets:
-            for _, book in bucket:
-                all_books.append(book)
-        return all_books
-
-    def list_books_sorted_by_title(self) -> List[Book]:
-        """Return all books sorted by title."""
-        books = self.list_all_books()
-        return sorted(books, key=lambda b: b.title.lower())
-
-    def list_overdue_books(self) -> List[Book]:
-        """Return a list of all overdue books, sorted by due date."""
-        today = date.today()
-        overdue: List[Book] = []
-
-        for book in self.list_all_books():
-            if book.is_on_loan and book.due_date is not None and book.due_date < today:
-                overdue.append(book)
-
-        return sorted(overdue, key=lambda b: b.due_date)
+    def close(self) -> None:
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
+        if self._library is not None:
+            self._library.journal = None
+            self._library = None
@@ -0,0 +1,89 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, List
+
+
+async def run_connection(
+    host: str, port: int, requests: int, book_count: int, seed: int, latencies: List[float]
+) -> int:
+    """
+    One client connection sending `requests` requests back to back and
+    timing each round trip. Returns the number of error replies.
+    """
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    errors = 0
+    try:
+        for request_id in range(requests):
+            roll = rng.random()
+            if roll < 0.6:
+                op, args = "get_book", {"book_id": f"B{rng.randrange(book_count)}"}
+            elif roll < 0.9:
+                op, args = "search_title_prefix", {"prefix": f"Title {rng.randrange(100):02d}", "limit": 10}
+            else:
+                op, args = "borrow_book", {"book_id": f"B{rng.randrange(book_count)}", "user_id": f"U{seed}"}
+
+            start = time.perf_counter()
+            writer.write(json.dumps({"id": request_id, "op": op, "args": args}).encode("utf-8") + b"\n")
+            await writer.drain()
+            reply = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - start)
+            if "error" in reply:
+                errors += 1
+    finally:
+        writer.close()
+    return errors
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+async def run_load(
+    host: str, port: int, connections: int = 50, requests: int = 200, book_count: int = 10_000
+) -> Dict[str, Any]:
+    """
+    Open `connections` clients that each send `requests` requests, and
+    report throughput and p50/p99 latency in milliseconds.
+    """
+    latencies: List[float] = []
+    start = time.perf_counter()
+    errors = await asyncio.gather(*(
+        run_connection(host, port, requests, book_count, seed, latencies)
+        for seed in range(connections)
+    ))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors),
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load generator for server.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--connections", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200, help="requests per connection")
+    parser.add_argument("--books", type=int, default=10_000, help="ids are drawn from B0..B<books-1>")
+    args = parser.parse_args()
+
+    result = asyncio.run(run_load(args.host, args.port, args.connections, args.requests, args.books))
+    print(f"{result['requests']} requests in {result['seconds']:.2f}s ({result['errors']} errors)")
+    print(f"  throughput  {result['requests_per_second']:,.0f} req/s")
+    print(f"  latency p50 {result['p50_ms']:.2f} ms")
+    print(f"  latency p99 {result['p99_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
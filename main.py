@@ -1,4 +1,9 @@
-from library import Library
+import argparse
+from typing import Any, Callable, Dict, List, Optional
+
+from library import Book, Library, LibraryStore, iter_catalogue_file
+
+page_size = 20  # books shown before asking whether to go on
 
 
 def print_menu() -> None:
@@ -12,13 +17,123 @@ def print_menu() -> None:
     print("7. List all books")
     print("8. List all books sorted by title")
     print("9. List overdue books")
+    print("10. Import books from a CSV/JSON Lines file")
+    print("11. Search books by author / subject / title prefix")
+    print("12. Show library statistics")
+    print("13. Search words in title / author / subject")
+    print("14. Remove a book")
+    print("15. Edit a book")
+    print("16. Show a user's loans and reservations")
+    print("17. Cancel a reservation")
     print("0. Exit")
 
 
-def main() -> None:
+def import_catalogue(library: Library, path: str) -> None:
+    """Bulk load a catalogue file and print how long each stage took."""
+    try:
+        report = library.bulk_load(iter_catalogue_file(path))
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}")
+        return
+
+    print(f"Imported {report['books_loaded']} books from {path}")
+    for stage in ("read", "duplicate_check", "id_index", "title_index", "secondary_index"):
+        print(f"  {stage:<16} {report[stage + '_seconds']:.3f}s")
+
+
+def print_pages(
+    fetch: Callable[[Optional[Any], int], List[Book]],
+    heading: str,
+    empty: str,
+    cursor: Callable[[Book], Any] = Library.title_cursor,
+) -> None:
+    """
+    Print a listing page by page. fetch(after, limit) returns the next page
+    and cursor(last book) the `after` for the page that follows, so only
+    one page of books is ever held, however big the catalogue.
+    """
+    books = fetch(None, page_size)
+    if not books:
+        print(empty)
+        return
+    print(heading)
+    while True:
+        for book in books:
+            print("  ", book)
+        if len(books) < page_size:
+            return
+        if input("Press Enter for more, or q to stop: ").strip().lower() == "q":
+            return
+        books = fetch(cursor(books[-1]), page_size)
+        if not books:
+            return
+
+
+def print_stats(stats: Dict[str, Any]) -> None:
+    """Print Library.stats() one structure per line."""
+    print(f"Books: {stats['books']}")
+    for section in ("id_index", "title_index", "author_index", "subject_index", "loans"):
+        details = ", ".join(
+            f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+            for key, value in stats[section].items()
+        )
+        print(f"  {section:<14} {details}")
+
+    cache = stats.get("search_cache")
+    if cache is not None:
+        print(
+            f"  search_cache   {cache['entries']}/{cache['max_entries']} entries, "
+            f"hit rate {cache['hit_rate']:.1%}, {cache['invalidations']} invalidated"
+        )
+
+    operations = stats["operations"]
+    if operations is None:
+        print("Operation metrics are off (start with --metrics to collect them).")
+        return
+    print("  operation                     calls    mean µs   p99 µs    max µs")
+    for name, metric in sorted(operations.items()):
+        print(
+            f"  {name:<28} {metric['calls']:>6} {metric['mean_us']:>10.1f} "
+            f"{metric['p99_us']:>8} {metric['max_us']:>9.1f}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Library catalogue menu")
+    parser.add_argument("catalogues", nargs="*", help="CSV/JSON Lines files to import before the menu")
+    parser.add_argument("--data", help="folder to keep the library in between runs")
+    parser.add_argument("--metrics", action="store_true", help="count and time every library operation")
+    parser.add_argument("--search-cache", type=int, default=0, metavar="ENTRIES", help="cache this many title search results")
+    args = parser.parse_args(argv)
+
     print("Starting library program...")  # debug line so we see *something*
-    library = Library()
+    store: Optional[LibraryStore] = None
+    if args.data:
+        store = LibraryStore(args.data)
+        library = store.library
+        print(f"Opened {len(library.id_index)} books from {args.data}")
+    else:
+        library = Library()
+    if args.metrics:
+        library.enable_metrics()
+    if args.search_cache:
+        library.enable_search_cache(max_entries=args.search_cache)
+
+    # any catalogue files given on the command line are loaded before the menu
+    for path in args.catalogues:
+        import_catalogue(library, path)
+    lapsed = library.expire_holds()
+    if lapsed:
+        print(f"Cancelled {lapsed} reservation(s) whose hold had lapsed.")
+
+    try:
+        run_menu(library)
+    finally:
+        if store is not None:
+            store.close()
 
+
+def run_menu(library: Library) -> None:
     while True:
         print_menu()
         choice = input("Enter your choice: ").strip()
@@ -47,6 +162,11 @@ def main() -> None:
             results = library.search_title_exact(title)
             if not results:
                 print("No books found.")
+                suggestions = library.search_title_fuzzy(title, max_distance=2, limit=5)
+                if suggestions:
+                    print("Did you mean:")
+                    for book in suggestions:
+                        print("  ", book)
             else:
                 print("Books found:")
                 for book in results:
@@ -74,32 +194,91 @@ def main() -> None:
             print(message)
 
         elif choice == "7":
-            books = library.list_all_books()
-            if not books:
-                print("No books in library.")
-            else:
-                print("All books:")
-                for book in books:
-                    print("  ", book)
+            print_pages(library.list_all_books, "All books:", "No books in library.")
 
         elif choice == "8":
-            books = library.list_books_sorted_by_title()
-            if not books:
-                print("No books in library.")
+            print_pages(library.list_books_sorted_by_title, "Books sorted by title:", "No books in library.")
+
+        elif choice == "9":
+            print_pages(
+                lambda after, limit: library.list_overdue_books(after=after, limit=limit),
+                "Overdue books:",
+                "No overdue books.",
+                Library.due_cursor,
+            )
+
+        elif choice == "10":
+            path = input("Enter path of catalogue file: ").strip()
+            import_catalogue(library, path)
+
+        elif choice == "11":
+            # blank answers mean "no filter on this field"
+            author = input("Author (exact, blank to skip): ").strip() or None
+            author_prefix = input("Author prefix (blank to skip): ").strip() or None
+            subject = input("Subject (blank to skip): ").strip() or None
+            title_prefix = input("Title prefix (blank to skip): ").strip() or None
+            try:
+                results = library.query(author, author_prefix, subject, title_prefix)
+            except ValueError as error:
+                print(f"Error: {error}")
+                continue
+            if not results:
+                print("No books found.")
             else:
-                print("Books sorted by title:")
-                for book in books:
+                print("Books found:")
+                for book in results:
                     print("  ", book)
 
-        elif choice == "9":
-            overdue_books = library.list_overdue_books()
-            if not overdue_books:
-                print("No overdue books.")
+        elif choice == "12":
+            print_stats(library.stats())
+
+        elif choice == "13":
+            words = input("Enter search words: ").strip()
+            results = library.search_text(words, limit=20)
+            if not results:
+                print("No books found.")
             else:
-                print("Overdue books:")
-                for book in overdue_books:
+                print("Best matches:")
+                for book in results:
                     print("  ", book)
 
+        elif choice == "14":
+            book_id = input("Enter book ID to remove: ").strip()
+            try:
+                book = library.remove_book(book_id)
+                print("Removed:", book)
+            except ValueError as error:
+                print(f"Error: {error}")
+
+        elif choice == "15":
+            book_id = input("Enter book ID to edit: ").strip()
+            # blank answers keep the current value
+            title = input("New title (blank to keep): ").strip() or None
+            author = input("New author (blank to keep): ").strip() or None
+            subject = input("New subject (blank to keep): ").strip() or None
+            try:
+                book = library.update_book(book_id, title, author, subject)
+                print("Updated:", book)
+            except ValueError as error:
+                print(f"Error: {error}")
+
+        elif choice == "16":
+            user_id = input("Enter user ID: ").strip()
+            loans = library.list_user_loans(user_id)
+            reservations = library.list_user_reservations(user_id)
+            if not loans and not reservations:
+                print("No loans or reservations.")
+            for book in loans:
+                print("  On loan, due", book.due_date, "→", book)
+            for book in reservations:
+                position = library.reservation_position(book.book_id, user_id)
+                print(f"  Reserved, position {position} →", book)
+
+        elif choice == "17":
+            book_id = input("Enter book ID: ").strip()
+            user_id = input("Enter your user ID: ").strip()
+            print(library.cancel_reservation(book_id, user_id))
+
         elif choice == "0":
             print("Goodbye!")
             break
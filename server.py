@@ -0,0 +1,300 @@
+import argparse
+import asyncio
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from library import Book, Library, LibraryStore, iter_catalogue_file
+
+
+# Protocol: newline-delimited JSON over TCP.
+# request:  {"id": 1, "op": "search_title_prefix", "args": {"prefix": "alg", "limit": 10}}
+# response: {"id": 1, "result": ...}  or  {"id": 1, "error": "..."}
+# streamed listings send {"id": 1, "items": [...]} chunks, then {"id": 1, "done": true, "count": n}
+
+# read-only operations that are coalesced into batches
+batched_ops = {
+    "get_book": "get_book_by_id",
+    "search_title_exact": "search_title_exact",
+    "search_title_prefix": "search_title_prefix",
+    "search_title_fuzzy": "search_title_fuzzy",
+    "search_author_exact": "search_author_exact",
+    "search_author_prefix": "search_author_prefix",
+    "search_subject": "search_subject",
+    "search_text": "search_text",
+    "query": "query",
+    "list_overdue_books": "list_overdue_books",
+    "reservation_position": "reservation_position",
+    "list_user_loans": "list_user_loans",
+    "list_user_reservations": "list_user_reservations",
+    "stats": "stats",
+}
+
+# operations that change the library, run one at a time in a worker thread
+write_ops = {
+    "add_book": "add_book",
+    "borrow_book": "borrow_book",
+    "return_book": "return_book",
+    "remove_book": "remove_book",
+    "remove_books": "remove_books",
+    "update_book": "update_book",
+    "cancel_reservation": "cancel_reservation",
+    "expire_holds": "expire_holds",
+}
+
+streamed_ops = {"list_all_books", "list_books_sorted_by_title"}
+
+
+def book_to_dict(book: Optional[Book]) -> Optional[Dict[str, Any]]:
+    if book is None:
+        return None
+    return {
+        "book_id": book.book_id,
+        "title": book.title,
+        "author": book.author,
+        "subject": book.subject,
+        "is_on_loan": book.is_on_loan,
+        "due_date": book.due_date.isoformat() if book.due_date is not None else None,
+        "borrower_id": book.borrower_id,
+    }
+
+
+def to_json(result: Any) -> Any:
+    """Turn Library results (books, lists of books, strings) into JSON values."""
+    if isinstance(result, list):
+        return [book_to_dict(item) for item in result]
+    if isinstance(result, Book):
+        return book_to_dict(result)
+    return result
+
+
+class RequestBatcher:
+    """
+    Collects read requests that arrive close together and answers them
+    with one hop to a worker thread. All get_book lookups in a batch share
+    a single Library.get_books call (one read lock for the lot). Other
+    reads that repeat the same op and arguments within a batch are run
+    once and the answer is shared; distinct searches still run one after
+    another, each under its own read lock.
+
+    A batch is sent when max_batch requests are waiting or max_delay
+    seconds after its first request, whichever comes first.
+    """
+
+    def __init__(self, library: Library, max_batch: int = 256, max_delay: float = 0.0005) -> None:
+        self.library = library
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending: List[Tuple[str, Dict[str, Any], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.batches_run = 0
+
+    def submit(self, op: str, args: Dict[str, Any]) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((op, args, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[str, Dict[str, Any], asyncio.Future]]) -> None:
+        self.batches_run += 1
+        try:
+            outcomes = await asyncio.to_thread(self._run_batch, [(op, args) for op, args, _ in batch])
+        except Exception as error:  # should not happen: errors are caught per request
+            outcomes = [(False, str(error))] * len(batch)
+
+        for (_, _, future), (ok, value) in zip(batch, outcomes):
+            if future.cancelled():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(ValueError(value))
+
+    def _run_batch(self, requests: List[Tuple[str, Dict[str, Any]]]) -> List[Tuple[bool, Any]]:
+        """Runs in a worker thread. Returns (ok, JSON result or error text) per request."""
+        outcomes: List[Tuple[bool, Any]] = [(False, "not run")] * len(requests)
+
+        # a malformed request must only fail itself, never the rest of its batch
+        lookups = [i for i, (op, _) in enumerate(requests) if op == "get_book"]
+        try:
+            books = self.library.get_books(requests[i][1]["book_id"] for i in lookups)
+            for i, book in zip(lookups, books):
+                outcomes[i] = (True, book_to_dict(book))
+        except Exception:
+            # one bad id spoils the shared call: look the ids up one at a time instead
+            for i in lookups:
+                try:
+                    outcomes[i] = (True, book_to_dict(self.library.get_book_by_id(requests[i][1]["book_id"])))
+                except Exception as error:
+                    outcomes[i] = (False, f"bad arguments: {error!r}")
+
+        # identical reads (a burst of clients asking for the same search) are answered once
+        answered: Dict[str, Tuple[bool, Any]] = {}
+        for i, (op, args) in enumerate(requests):
+            if op == "get_book":
+                continue
+            key = json.dumps([op, args], sort_keys=True, default=repr)
+            if key not in answered:
+                try:
+                    result = getattr(self.library, batched_ops[op])(**args)
+                    answered[key] = (True, to_json(result))
+                except Exception as error:
+                    answered[key] = (False, str(error))
+            outcomes[i] = answered[key]
+        return outcomes
+
+
+class LibraryServer:
+    """
+    asyncio TCP front-end for a Library. Every connection may pipeline
+    requests; answers carry the request id and can come back out of order.
+    Library calls run in worker threads (the Library is thread-safe),
+    so the event loop never blocks on a lock.
+    """
+
+    stream_chunk = 200  # books per streamed message, well under asyncio's 64 KiB line limit
+
+    def __init__(self, library: Library, batcher: Optional[RequestBatcher] = None) -> None:
+        self.library = library
+        self.batcher = batcher or RequestBatcher(library)
+        self._server: Optional[Any] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Start listening and return the port actually bound."""
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        write_lock = asyncio.Lock()  # streamed chunks must not interleave with other replies
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.ensure_future(self._handle_request(line, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _send(self, writer: asyncio.StreamWriter, write_lock: asyncio.Lock, message: Dict[str, Any]) -> None:
+        async with write_lock:
+            writer.write(json.dumps(message).encode("utf-8") + b"\n")
+            await writer.drain()
+
+    async def _handle_request(self, line: bytes, writer: asyncio.StreamWriter, write_lock: asyncio.Lock) -> None:
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            op = request["op"]
+            args = request.get("args", {})
+
+            if op in streamed_ops:
+                await self._stream_books(op, request_id, writer, write_lock)
+                return
+            if op in batched_ops:
+                result = await self.batcher.submit(op, args)
+            elif op in write_ops:
+                result = to_json(await asyncio.to_thread(getattr(self.library, write_ops[op]), **args))
+            else:
+                raise ValueError(f"Unknown operation: {op}")
+            reply = {"id": request_id, "result": result}
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            reply = {"id": request_id, "error": str(error)}
+        await self._send(writer, write_lock, reply)
+
+    async def _stream_books(
+        self, op: str, request_id: Any, writer: asyncio.StreamWriter, write_lock: asyncio.Lock
+    ) -> None:
+        """
+        Send a listing in chunks. Each chunk is one page fetched from the
+        library after the previous page's last book (its title_cursor), then
+        encoded and flushed (waiting for the client to read it) before the
+        next, so neither the listing nor its JSON ever sits in memory whole.
+        """
+        listing = getattr(self.library, op)
+
+        def fetch_page(after: Optional[Tuple[str, str]]) -> Tuple[List[Book], Optional[Tuple[str, str]]]:
+            # the cursor is taken at once, before the books can be retitled
+            books = listing(after=after, limit=self.stream_chunk)
+            return books, Library.title_cursor(books[-1]) if books else None
+
+        after = None
+        count = 0
+        async with write_lock:
+            while True:
+                books, cursor = await asyncio.to_thread(fetch_page, after)
+                if books:
+                    chunk = [book_to_dict(book) for book in books]
+                    writer.write(json.dumps({"id": request_id, "items": chunk}).encode("utf-8") + b"\n")
+                    await writer.drain()
+                    count += len(books)
+                if len(books) < self.stream_chunk:
+                    break
+                after = cursor
+            writer.write(json.dumps({"id": request_id, "done": True, "count": count}).encode("utf-8") + b"\n")
+            await writer.drain()
+
+
+async def run_server(library: Library, host: str, port: int) -> None:
+    server = LibraryServer(library)
+    bound = await server.start(host, port)
+    print(f"Library server listening on {host}:{bound}")
+    await server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve a Library over TCP (JSON Lines)")
+    parser.add_argument("catalogues", nargs="*", help="CSV/JSON Lines files to import at startup")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--data", help="folder to keep the library in between runs")
+    parser.add_argument("--search-cache", type=int, default=0, metavar="ENTRIES", help="cache this many title search results")
+    args = parser.parse_args()
+
+    store = LibraryStore(args.data) if args.data else None
+    library = store.library if store is not None else Library()
+    for path in args.catalogues:
+        report = library.bulk_load(iter_catalogue_file(path))
+        print(f"Imported {report['books_loaded']} books from {path}")
+    if args.search_cache:
+        library.enable_search_cache(max_entries=args.search_cache)
+
+    try:
+        asyncio.run(run_server(library, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if store is not None:
+            store.close()
+
+
+if __name__ == "__main__":
+    main()
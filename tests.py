@@ -1,5 +1,24 @@
+import asyncio
+import csv
+import json
+import math
+import os
+import pickle
+import random
+import sys
+import tempfile
+import threading
 import time
-from library import Library, HashTable, TitleIndexBst, Book
+import tracemalloc
+from collections import deque
+from datetime import date, timedelta
+from benchmarks import bench_search_cache, bench_sharding, catalogues, compare, run_suite, zipf_queries
+from library import (
+    Library, LibraryStore, ShardedLibrary, HashTable, TitleIndexBst, Book, ReservationQueue, SearchCache,
+    SortedBlockList, edit_distance, iter_catalogue_file, write_snapshot,
+)
+from loadgen import run_load
+from server import LibraryServer, book_to_dict
 
 
 def print_header(title: str) -> None:
@@ -48,28 +67,63 @@ def test_zero_and_null_values() -> None:
 
 # 3. LARGE DATA STRUCTURES (1,000,000 items)
 
+def average_lookup_time(hash_table: HashTable, keys: list) -> float:
+    start = time.perf_counter()
+    for key in keys:
+        hash_table.get(key)
+    return (time.perf_counter() - start) / len(keys)
+
+
 def test_large_dataset() -> None:
     print_header("TEST 3: Large Dataset (1,000,000 values)")
 
-    hash_table = HashTable(capacity=2_000_003)  # large prime for better distribution
     N = 200_000  # you can increase to 1,000,000 later; this keeps test fast
+    checkpoints = [1_000, 10_000, 100_000, N]
 
-    print(f"Inserting {N} items into hash table...")
-    start = time.time()
+    for open_addressing in (False, True):
+        # start from the default small capacity so the table has to grow by itself
+        hash_table = HashTable(open_addressing=open_addressing)
+        mode = "open addressing" if open_addressing else "separate chaining"
+        print(f"\nInserting {N} items into hash table ({mode})...")
 
-    for i in range(N):
-        hash_table.put(f"id{i}", i)
+        start = time.time()
+        timings = []
+        inserted = 0
+        for checkpoint in checkpoints:
+            for i in range(inserted, checkpoint):
+                hash_table.put(f"id{i}", i)
+            inserted = checkpoint
 
-    end = time.time()
-    print(f"Done in {end - start:.3f} seconds")
+            # Test lookup performance at this size
+            step = max(1, checkpoint // 1_000)
+            keys = [f"id{i}" for i in range(0, checkpoint, step)]
+            per_lookup = average_lookup_time(hash_table, keys)
+            timings.append(per_lookup)
+            stats = hash_table.stats()
+            longest = stats["max_probe_length"] if open_addressing else stats["max_chain_length"]
+            print(
+                f"  N={checkpoint:>7} | capacity={hash_table.capacity:>7} "
+                f"| load {stats['load_factor']:.2f} | longest {'probe' if open_addressing else 'chain'} {longest:>3} "
+                f"| avg lookup {per_lookup * 1e9:.0f} ns"
+            )
 
-    # Test lookup performance
-    lookup_key = f"id{N // 2}"
-    print(f"Looking up: {lookup_key}")
-    start = time.time()
-    result = hash_table.get(lookup_key)
-    end = time.time()
-    print("Lookup result:", result, "| Time:", f"{end - start:.6f}s")
+            # lookups stay O(1): the load stays bounded, so chains and probe runs stay short at every size
+            assert stats["load_factor"] <= hash_table.max_load_factor
+            if open_addressing:
+                assert stats["mean_probe_length"] < 3, stats
+            else:
+                assert stats["max_chain_length"] <= 12, stats
+
+        end = time.time()
+        print(f"Done in {end - start:.3f} seconds")
+
+        lookup_key = f"id{N // 2}"
+        print(f"Looking up: {lookup_key} →", hash_table.get(lookup_key))
+        print(f"Lookup time growth from N={checkpoints[0]} to N={N}: x{timings[-1] / timings[0]:.2f}")
+
+        assert len(hash_table) == N
+        assert hash_table.get(lookup_key) == N // 2
+        assert hash_table.capacity > N  # the table resized itself
 
 
 # 4. LARGE DATA TYPES (> 64 bits)
@@ -82,12 +136,1327 @@ def test_large_data_types() -> None:
     lib = Library()
     lib.add_book("BIG1", "HugeNumberTest", "Author", "Maths")
 
+    # Book uses __slots__, so extra per-book data goes in a table keyed by book id
     book = lib.get_book_by_id("BIG1")
-    book.large_value = extremely_large_number
+    extra_values = HashTable()
+    extra_values.put(book.book_id, extremely_large_number)
+    stored = extra_values.get(book.book_id)
+
+    print("Stored a 500-bit integer against book", book.book_id)
+    print("Stored value:", stored)
+    print("Value bit-length:", stored.bit_length())
+    assert stored == 2**500
+
+
+# 5. TITLE INDEX BALANCE (sorted bulk inserts)
+
+def tree_height(node) -> int:
+    # iterative so the check itself cannot hit the recursion limit
+    height = 0
+    stack = [(node, 1)] if node is not None else []
+    while stack:
+        current, depth = stack.pop()
+        height = max(height, depth)
+        for child in (current.left, current.right):
+            if child is not None:
+                stack.append((child, depth + 1))
+    return height
+
+
+def test_sorted_title_index() -> None:
+    print_header("TEST 5: Title Index With Titles Inserted In Sorted Order")
+
+    bst = TitleIndexBst()
+    N = 50_000  # far beyond the old ~1000 title recursion limit
+
+    start = time.time()
+    for i in range(N):
+        title = f"Title {i:06d}"
+        bst.insert(title, Book(f"B{i}", title, "Author", "Subject"))
+    end = time.time()
+    print(f"Inserted {N} sorted titles in {end - start:.3f} seconds")
+
+    height = tree_height(bst.root)
+    print("Tree height:", height, "| AVL bound:", int(1.44 * math.log2(N + 2)))
+    assert height <= 1.44 * math.log2(N + 2)
+
+    print("Exact search('title 012345') →", bst.search_exact("title 012345"))
+    print("Prefix search('Title 0499') →", len(bst.search_prefix("Title 0499")), "books")
+    assert len(bst.search_exact("Title 012345")) == 1
+    assert len(bst.search_prefix("Title 0499")) == 100
+    assert bst.search_exact("Missing") == []
+
+
+# 6. BULK CATALOGUE LOADING
+
+def test_bulk_load() -> None:
+    print_header("TEST 6: Bulk Loading a Catalogue File")
+
+    N = 100_000
+    with tempfile.TemporaryDirectory() as folder:
+        csv_path = os.path.join(folder, "catalogue.csv")
+        with open(csv_path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(["book_id", "title", "author", "subject"])
+            for i in range(N):
+                writer.writerow([f"B{i}", f"Title {i % 50_000:06d}", f"Author {i % 97}", "Maths"])
+
+        jsonl_path = os.path.join(folder, "extra.jsonl")
+        with open(jsonl_path, "w", encoding="utf-8") as file:
+            file.write(json.dumps({"book_id": "X1", "title": "Algorithms", "author": "A", "subject": "CS"}) + "\n")
+            file.write(json.dumps({"book_id": "X2", "title": "Title 000001", "author": "B", "subject": "CS"}) + "\n")
+
+        lib = Library()
+        lib.add_book("EXISTING", "Algorithms", "Someone", "CS")
+
+        report = lib.bulk_load(iter_catalogue_file(csv_path))
+        print(f"Loaded {report['books_loaded']} books from CSV:")
+        for stage, seconds in report.items():
+            if stage.endswith("_seconds"):
+                print(f"  {stage:<26} {seconds:.3f}s")
+
+        lib.bulk_load(iter_catalogue_file(jsonl_path))
+        print("Merged a JSON Lines file into the existing indexes")
+
+        height = tree_height(lib.title_index.root)
+        print("Title tree height:", height)
+        assert height <= 1.44 * math.log2(50_000 + 2)
+        assert len(lib.list_all_books()) == N + 3
+        assert len(lib.search_title_exact("Algorithms")) == 2
+        assert len(lib.search_title_exact("title 000001")) == 3
+        assert len(lib.search_title_prefix("Title 0499")) == 200
+
+        # duplicates are reported and nothing is loaded
+        try:
+            lib.bulk_load([("B5", "Again", "A", "S"), ("NEW", "New", "A", "S")])
+            raise AssertionError("duplicate id was accepted")
+        except ValueError as error:
+            print("Duplicate bulk load →", error)
+        assert lib.get_book_by_id("NEW") is None
+
+        # short or long CSV rows are rejected with the line they are on
+        for row in ("Z1,T1,A1,S1\nZ2,T2\n", "Z1,T1,A1,S1,extra\n"):
+            bad_path = os.path.join(folder, "bad.csv")
+            with open(bad_path, "w", encoding="utf-8") as file:
+                file.write("book_id,title,author,subject\n" + row)
+            try:
+                lib.bulk_load(iter_catalogue_file(bad_path))
+                raise AssertionError("malformed CSV row was accepted")
+            except ValueError as error:
+                print("Malformed CSV row →", error)
+                assert "line" in str(error)
+        assert lib.get_book_by_id("Z1") is None
+
+
+# 7. RADIX TREE PREFIX SEARCH
+
+def test_radix_title_index() -> None:
+    print_header("TEST 7: Radix Tree Title Index vs BST")
+
+    random.seed(7)
+    words = ["algorithms", "algebra", "all", "data", "database", "dat", "Deep", "learning", "a", ""]
+    bst_lib = Library()
+    radix_lib = Library(title_index_type="radix")
+
+    for i in range(20_000):
+        title = " ".join(random.choice(words) for _ in range(random.randint(1, 3)))
+        bst_lib.add_book(f"B{i}", title, "Author", "Subject")
+        radix_lib.add_book(f"B{i}", title, "Author", "Subject")
+
+    for prefix in ["", "a", "al", "ALG", "data b", "dat", "deep learning", "x", "algorithms all a"]:
+        from_bst = [book.book_id for book in bst_lib.search_title_prefix(prefix)]
+        from_radix = [book.book_id for book in radix_lib.search_title_prefix(prefix)]
+        assert from_bst == from_radix, prefix
+        print(f"Prefix {prefix!r:<20} → {len(from_radix)} matches (BST and radix agree)")
+
+    for title in ["all", "Data Database", "deep learning deep", "missing"]:
+        from_bst = [book.book_id for book in bst_lib.search_title_exact(title)]
+        assert from_bst == [book.book_id for book in radix_lib.search_title_exact(title)], title
+
+    # top-k completion only touches k results however many titles match
+    start = time.perf_counter()
+    top = radix_lib.search_title_prefix("a", limit=10)
+    elapsed = time.perf_counter() - start
+    print("Top 10 for 'a':", [book.title for book in top[:3]], "...", f"({elapsed * 1e6:.0f} µs)")
+    assert [book.book_id for book in top] == [book.book_id for book in bst_lib.search_title_prefix("a", limit=10)]
+
+    lazy = radix_lib.iter_title_prefix("data")
+    print("First lazy result for 'data':", next(lazy))
+
+
+# 8. AUTHOR / SUBJECT INDEXES AND MULTI-FIELD QUERIES
+
+def test_secondary_indexes() -> None:
+    print_header("TEST 8: Author / Subject Indexes and Multi-Field Queries")
+
+    random.seed(8)
+    authors = ["Knuth", "Knight", "Cormen", "Sedgewick", "Skiena"]
+    subjects = ["Algorithms", "Maths", "Databases", "Networks"]
+    lib = Library()
+    for i in range(5_000):
+        lib.add_book(f"B{i}", f"Title {i:05d}", random.choice(authors), random.choice(subjects))
+    lib.bulk_load(
+        (f"X{i}", f"Extra {i:05d}", random.choice(authors), random.choice(subjects))
+        for i in range(5_000)
+    )
+    all_books = lib.list_all_books()
+
+    def scan(**filters) -> set:
+        # brute-force reference answer over the whole catalogue
+        matches = set()
+        for book in all_books:
+            if "author" in filters and book.author.lower() != filters["author"].lower():
+                continue
+            if "author_prefix" in filters and not book.author.lower().startswith(filters["author_prefix"].lower()):
+                continue
+            if "subject" in filters and book.subject.lower() != filters["subject"].lower():
+                continue
+            if "title_prefix" in filters and not book.title.lower().startswith(filters["title_prefix"].lower()):
+                continue
+            matches.add(book.book_id)
+        return matches
+
+    cases = [
+        {"author": "knuth"},
+        {"subject": "MATHS"},
+        {"author_prefix": "Kn", "subject": "Databases"},
+        {"author": "Skiena", "subject": "Networks", "title_prefix": "Title 01"},
+        {"title_prefix": "Extra 0000", "author_prefix": "S"},
+        {"author": "Nobody", "subject": "Maths"},
+    ]
+    for filters in cases:
+        found = {book.book_id for book in lib.query(**filters)}
+        assert found == scan(**filters), filters
+        print(f"{filters} → {len(found)} books")
+
+    assert len(lib.search_author_prefix("kn", limit=5)) == 5
+    assert {book.author for book in lib.search_author_prefix("Kn")} == {"Knuth", "Knight"}
+
+    try:
+        lib.query()
+        raise AssertionError("query without filters was accepted")
+    except ValueError as error:
+        print("Empty query →", error)
+
+
+# 9. DUE-DATE INDEX FOR OVERDUE REPORTS
+
+def test_due_date_index() -> None:
+    print_header("TEST 9: Due-Date Index for Overdue Reporting")
+
+    lib = Library()
+    lib.bulk_load((f"B{i}", f"Title {i}", "Author", "Subject") for i in range(100_000))
+
+    # loans with due dates spread over the next 30 days
+    for i in range(0, 3_000, 3):
+        lib.loan_period_days = i % 30
+        lib.borrow_book(f"B{i}", f"U{i}")
+    lib.borrow_book("B0", "WAITING")  # joins the queue, no second index entry
+    for i in range(0, 3_000, 9):
+        lib.return_book(f"B{i}")  # B0 goes straight to WAITING
+
+    today = date.today()
+    for days_ahead in (0, 10, 31):
+        as_of = today + timedelta(days=days_ahead)
+        expected = sorted(
+            (book for book in lib.list_all_books() if book.is_on_loan and book.due_date < as_of),
+            key=lambda b: (b.due_date, b.book_id),
+        )
+        start = time.perf_counter()
+        overdue = lib.list_overdue_books(today=as_of)
+        elapsed = time.perf_counter() - start
+        assert overdue == expected
+        print(f"Overdue as of today+{days_ahead:<2} → {len(overdue):>4} books ({elapsed * 1e6:.0f} µs)")
+
+    due_soon = lib.list_books_due_within(3)
+    assert due_soon and all(today <= book.due_date <= today + timedelta(days=3) for book in due_soon)
+    print("Due within 3 days →", len(due_soon), "books")
+    assert len(lib.due_index) == sum(book.is_on_loan for book in lib.list_all_books())
+
+    # the blocked sorted list agrees with a plain sorted list through splits and removals
+    rng = random.Random(9)
+    blocks, plain = SortedBlockList(), []
+    SortedBlockList.block_size, old_block_size = 8, SortedBlockList.block_size
+    try:
+        for _ in range(5_000):
+            value = (rng.randrange(60), f"B{rng.randrange(500)}")
+            if plain and rng.random() < 0.4:
+                value = plain[rng.randrange(len(plain))]
+                plain.remove(value)
+                assert blocks.remove(value)
+            else:
+                plain.append(value)
+                plain.sort()
+                blocks.add(value)
+        assert list(blocks) == plain and len(blocks) == len(plain)
+        assert not blocks.remove((99, "missing"))
+        for probe in ((10,), (30, "B250"), (59, "B999")):
+            assert list(blocks.iter_from(probe)) == [value for value in plain if value >= probe]
+            assert list(blocks.iter_from(probe, inclusive=False)) == [value for value in plain if value > probe]
+    finally:
+        SortedBlockList.block_size = old_block_size
+
+    # a borrow/return pair costs about the same with 10x more loans outstanding
+    timings = []
+    for loans in (20_000, 200_000):
+        big = Library()
+        big.bulk_load((f"B{i}", "Title", "Author", "Subject") for i in range(loans + 1))
+        for i in range(loans):
+            big.loan_period_days = i % 365
+            big.borrow_book(f"B{i}", "U1")
+        big.loan_period_days = 180
+        start = time.perf_counter()
+        for _ in range(2_000):
+            big.borrow_book(f"B{loans}", "U2")
+            big.return_book(f"B{loans}")
+        timings.append((time.perf_counter() - start) / 2_000)
+        print(f"{loans:>7,} loans out: borrow + return {timings[-1] * 1e6:.1f} µs")
+    assert timings[1] < timings[0] * 3
+
+
+# 10. MEMORY PER BOOK (tracemalloc)
+
+class DictBook:
+    # the old Book layout: a __dict__ per object and an eager deque
+    def __init__(self, book_id: str, title: str, author: str, subject: str) -> None:
+        self.book_id = book_id
+        self.title = title
+        self.author = author
+        self.subject = subject
+        self.is_on_loan = False
+        self.due_date = None
+        self.borrower_id = None
+        self.reservation_queue = deque()
+
+
+def bytes_per_book(book_class, n: int) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    # author/subject are built per row, as they would be when parsing a file
+    books = [
+        book_class(f"B{i}", f"Title {i}", "Author " + str(i % 500), "Subject " + str(i % 20))
+        for i in range(n)
+    ]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    assert len(books) == n
+    return used / n
+
+
+def test_book_memory() -> None:
+    print_header("TEST 10: Memory Used per Book")
+
+    N = 100_000
+    old = bytes_per_book(DictBook, N)
+    new = bytes_per_book(Book, N)
+    print(f"dict + deque Book : {old:7.1f} bytes/book")
+    print(f"slotted Book      : {new:7.1f} bytes/book ({old / new:.1f}x smaller)")
+    assert new < old / 2
+
+    book = Book("R1", "Reserved", "Author", "Subject")
+    assert not book.has_reservations
+    book.reservation_queue.append("U1")
+    assert book.has_reservations
+
+
+# 11. PERSISTENT CATALOGUE (snapshot + loan journal)
+
+def library_state(lib: Library) -> list:
+    return sorted(
+        (book.book_id, book.title, book.author, book.subject, book.is_on_loan,
+         book.borrower_id, book.due_date, list(book.reservation_queue))
+        for book in lib.list_all_books()
+    )
+
+
+def test_persistent_store() -> None:
+    print_header("TEST 11: Snapshot and Loan Journal on Disk")
+
+    N = 50_000
+    with tempfile.TemporaryDirectory() as folder:
+        store = LibraryStore(folder)
+        lib = store.library
+        lib.bulk_load((f"B{i}", f"Title {i:05d}", f"Author {i % 97}", "Maths") for i in range(N))
+        assert store.journal_events == 0  # a bulk load is written straight into a snapshot
+
+        lib.add_book("NEW", "Brand New", "Someone", "CS")
+        lib.borrow_book("B1", "U1")
+        lib.borrow_book("B1", "U2")  # reserves
+        lib.borrow_book("B2", "U3")
+        lib.return_book("B1")  # handed over to U2
+        lib.return_book("B2")
+        lib.loan_period_days = 3
+        lib.borrow_book("NEW", "U4")
+        print("Journal events since snapshot:", store.journal_events)
+        expected = library_state(lib)
+        store.close()
+
+        start = time.perf_counter()
+        reopened = LibraryStore(folder)
+        restored = reopened.library
+        elapsed = time.perf_counter() - start
+        print(f"Reopened {len(restored.list_all_books())} books in {elapsed:.3f}s")
+        assert library_state(restored) == expected
+        assert restored.search_title_prefix("brand") == [restored.get_book_by_id("NEW")]
+        assert [book.book_id for book in restored.list_overdue_books(today=date.today() + timedelta(days=30))] == ["NEW", "B1"]
+
+        # compaction folds the journal into the snapshot
+        reopened.compact()
+        restored.return_book("NEW")
+        reopened.close()
+        with open(os.path.join(folder, LibraryStore.journal_name), "a", encoding="utf-8") as file:
+            file.write('["borrow", "B3"')  # torn write from a crash
+        again = LibraryStore(folder)
+        assert not again.library.get_book_by_id("NEW").is_on_loan
+        assert not again.library.get_book_by_id("B3").is_on_loan
+        assert again.journal_events == 0  # the damaged journal was compacted away
+        print("Torn journal line ignored; journal events now:", again.journal_events)
+
+        # a crash after the new snapshot is in place but before the journal is
+        # emptied: the journal's events are already in the snapshot
+        again.library.borrow_book("B4", "U5")
+        again.library.add_book("LATE", "Late Arrival", "Someone", "CS")
+        expected = library_state(again.library)
+        expected_loans = list(again.library.due_index)
+        write_snapshot(again.library, again.snapshot_path, again.generation + 1)
+        again.close()
+        crashed = LibraryStore(folder)
+        assert library_state(crashed.library) == expected
+        assert list(crashed.library.due_index) == expected_loans  # no loan applied twice
+        assert crashed.journal_events == 0  # the stale journal was compacted away
+        print("Journal from before the last snapshot skipped; generation now", crashed.generation)
+        crashed.close()
+
+
+# 12. CONCURRENT BORROW / RETURN
+
+def loan_worker(lib: Library, seed: int, operations: int, counts: dict) -> None:
+    rng = random.Random(seed)
+    local = {"borrowed": 0, "reserved": 0, "handed_over": 0, "returned": 0}
+    for _ in range(operations):
+        book_id = f"B{rng.randrange(200)}"  # a small hot set so threads collide
+        roll = rng.random()
+        if roll < 0.45:
+            message = lib.borrow_book(book_id, f"T{seed}-{rng.randrange(1_000)}")
+            if message.startswith("Book borrowed"):
+                local["borrowed"] += 1
+            elif "added to the reservation queue" in message:
+                local["reserved"] += 1
+        elif roll < 0.9:
+            message = lib.return_book(book_id)
+            if message.startswith("Book returned"):
+                local["returned"] += 1
+            if "issued to next user" in message:
+                local["handed_over"] += 1
+        else:
+            lib.search_title_prefix("Title 00", limit=20)
+    with counts["lock"]:
+        for key, value in local.items():
+            counts[key] += value
+
+
+def test_concurrent_loans() -> None:
+    print_header("TEST 12: Concurrent Borrow / Return Stress Test")
+
+    old_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads as often as possible to provoke races
+    try:
+        for threads in (1, 2, 4, 8):
+            lib = Library()
+            lib.bulk_load((f"B{i}", f"Title {i:05d}", "Author", "Subject") for i in range(10_000))
+            counts = {"lock": threading.Lock(), "borrowed": 0, "reserved": 0, "handed_over": 0, "returned": 0}
+            operations = 40_000 // threads
+
+            workers = [
+                threading.Thread(target=loan_worker, args=(lib, seed, operations, counts))
+                for seed in range(threads)
+            ]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+
+            books = lib.list_all_books()
+            on_loan = sum(book.is_on_loan for book in books)
+            waiting = sum(len(book.reservation_queue) for book in books if book.has_reservations)
+
+            # every loan started was either returned or is still out: no double loans
+            assert counts["borrowed"] + counts["handed_over"] - counts["returned"] == on_loan
+            # every reservation was either handed the book or is still queued: none lost
+            assert counts["reserved"] == counts["handed_over"] + waiting
+            assert sorted(lib.due_index) == list(lib.due_index) and len(lib.due_index) == on_loan
+            assert all(book.has_reservations <= book.is_on_loan for book in books)
+
+            print(
+                f"{threads} thread(s): {threads * operations / elapsed:>9,.0f} ops/s "
+                f"| on loan {on_loan:>3} | queued {waiting:>4}"
+            )
+
+        # with a journal: events land in the order the changes were made, and
+        # compaction never catches a change that is made but not yet journalled
+        for compact_after in (1_000_000, 100):
+            with tempfile.TemporaryDirectory() as folder:
+                store = LibraryStore(folder)
+                store.compact_after = compact_after
+                lib = store.library
+                lib.bulk_load((f"B{i}", f"Title {i:05d}", "Author", "Subject") for i in range(1_000))
+                counts = {"lock": threading.Lock(), "borrowed": 0, "reserved": 0, "handed_over": 0, "returned": 0}
+
+                def churn() -> None:
+                    for i in range(2_000):
+                        lib.add_book(f"X{i % 5}", f"Churn {i}", "Author", "Subject")
+                        lib.remove_book(f"X{i % 5}")
+
+                def borrow_new() -> None:
+                    for i in range(20_000):
+                        lib.borrow_book(f"X{i % 5}", "U1")
+
+                workers = [threading.Thread(target=loan_worker, args=(lib, seed, 3_000, counts)) for seed in range(2)]
+                workers += [threading.Thread(target=churn), threading.Thread(target=borrow_new)]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+                expected, expected_loans = library_state(lib), list(lib.due_index)
+                store.close()
+
+                reopened = LibraryStore(folder)
+                assert library_state(reopened.library) == expected
+                assert list(reopened.library.due_index) == expected_loans
+                print(
+                    f"Journalled run (compact after {compact_after:,}) reopened intact "
+                    f"from generation {reopened.generation} + {reopened.journal_events:,} events"
+                )
+                reopened.close()
+    finally:
+        sys.setswitchinterval(old_interval)
+
+
+# 13. ASYNCIO SERVER WITH REQUEST BATCHING
+
+async def send_request(reader, writer, request: dict) -> list:
+    writer.write(json.dumps(request).encode("utf-8") + b"\n")
+    await writer.drain()
+    replies = [json.loads(await reader.readline())]
+    while "items" in replies[-1]:
+        replies.append(json.loads(await reader.readline()))
+    return replies
+
+
+async def exercise_server() -> None:
+    lib = Library()
+    lib.bulk_load((f"B{i}", f"Title {i:05d}", f"Author {i % 7}", "Maths") for i in range(10_000))
+    server = LibraryServer(lib)
+    port = await server.start()
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        [reply] = await send_request(reader, writer, {"id": 1, "op": "get_book", "args": {"book_id": "B42"}})
+        assert reply == {"id": 1, "result": book_to_dict(lib.get_book_by_id("B42"))}
+        [reply] = await send_request(reader, writer, {"id": 2, "op": "borrow_book", "args": {"book_id": "B42", "user_id": "U1"}})
+        assert reply["result"].startswith("Book borrowed")
+        [reply] = await send_request(reader, writer, {"id": 3, "op": "nope"})
+        assert "error" in reply
+
+        replies = await send_request(reader, writer, {"id": 4, "op": "list_all_books"})
+        streamed = [book["book_id"] for chunk in replies[:-1] for book in chunk["items"]]
+        assert replies[-1] == {"id": 4, "done": True, "count": 10_000}
+        assert len(replies) > 2 and sorted(streamed) == sorted(f"B{i}" for i in range(10_000))
+        print(f"list_all_books streamed in {len(replies) - 1} chunks")
+        writer.close()
+
+        # malformed requests fail alone, not the batch they were coalesced into
+        outcomes = server.batcher._run_batch([
+            ("get_book", {"book_id": "B1"}),
+            ("search_title_exact", {"title": 5}),
+            ("search_title_prefix", {"prefix": "Title 0000"}),
+            ("get_book", {"book_id": ["not", "hashable"]}),
+            ("get_book", {}),
+            ("get_book", {"book_id": "B2"}),
+        ])
+        assert [ok for ok, _ in outcomes] == [True, False, True, False, False, True]
+        assert outcomes[0][1]["book_id"] == "B1" and outcomes[5][1]["book_id"] == "B2"
+        assert len(outcomes[2][1]) == 10
+        print("Bad requests in a batch →", [value for ok, value in outcomes if not ok])
+
+        # identical reads in one batch are answered by a single library call
+        lib.enable_metrics()
+        outcomes = server.batcher._run_batch(
+            [("search_title_prefix", {"prefix": "Title 001", "limit": 5})] * 3
+            + [("search_title_prefix", {"limit": 5, "prefix": "Title 001"}), ("search_title_prefix", {"prefix": "Title 002"})]
+        )
+        assert outcomes[0] == outcomes[3] and outcomes[0] != outcomes[4]
+        assert lib.stats()["operations"]["search_title_prefix"]["calls"] == 2
+        lib.disable_metrics()
+
+        batches_before = server.batcher.batches_run
+        result = await run_load("127.0.0.1", port, connections=40, requests=100, book_count=10_000)
+        batches = server.batcher.batches_run - batches_before
+        print(
+            f"{result['requests']} requests: {result['requests_per_second']:,.0f} req/s, "
+            f"p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms, "
+            f"{batches} read batches"
+        )
+        assert result["errors"] == 0
+        assert batches < result["requests"]  # bursts were coalesced
+    finally:
+        await server.close()
+
+
+def test_async_server() -> None:
+    print_header("TEST 13: Asyncio Server With Request Batching")
+    asyncio.run(exercise_server())
+
+
+# 14. BENCHMARK SUITE SMOKE TEST
+
+def test_benchmark_suite() -> None:
+    print_header("TEST 14: Benchmark Suite and Regression Check")
+
+    report = run_suite([500], repeats=2, progress=lambda message: None)
+    results = report["results"]
+    print(f"{len(results)} benchmarks recorded, e.g.")
+    for key in ("hashtable.open.get/skewed/500", "library.get_book_by_id/sorted/500", "library.memory/duplicates/500"):
+        print(f"  {key:<38} {results[key]}")
+    assert {key.split("/")[1] for key in results} == set(catalogues)
+    assert json.loads(json.dumps(report)) == report  # plain JSON all the way down
+
+    assert compare(report, report) == []
+    slower = json.loads(json.dumps(report))
+    slower["results"]["library.get_book_by_id/sorted/500"]["min_ns_per_op"] *= 2
+    regressions = compare(report, slower)
+    print("Injected regression →", regressions)
+    assert len(regressions) == 1 and "library.get_book_by_id/sorted/500" in regressions[0]
+
+
+# 15. INSTRUMENTATION AND STRUCTURAL STATS
+
+def test_metrics_and_stats() -> None:
+    print_header("TEST 15: Operation Metrics and Structural Stats")
+
+    lib = Library()
+    lib.bulk_load((f"B{i}", f"Title {i:05d}", f"Author {i % 13}", f"Subject {i % 5}") for i in range(20_000))
+    assert lib.stats()["operations"] is None
+    assert "get_book_by_id" not in lib.__dict__  # no wrappers while metrics are off
+
+    lib.enable_metrics()
+    for i in range(1_000):
+        lib.get_book_by_id(f"B{i}")
+    for i in range(50):
+        lib.borrow_book("B7", f"U{i}")
+    lib.return_book("B7")
+    lib.search_title_prefix("Title 00", limit=10)
+
+    stats = lib.stats()
+    operations = stats["operations"]
+    for name in ("get_book_by_id", "borrow_book", "return_book", "search_title_prefix"):
+        metric = operations[name]
+        print(f"  {name:<22} calls={metric['calls']:<5} mean={metric['mean_us']:.1f} µs p99<={metric['p99_us']} µs")
+    # calls made inside borrow/return are not counted as extra lookups
+    assert operations["get_book_by_id"]["calls"] == 1_000
+    assert operations["borrow_book"]["calls"] == 50
+    assert sum(operations["borrow_book"]["histogram"]) == 50
+
+    print("id_index   →", stats["id_index"])
+    print("title_index→", stats["title_index"])
+    print("loans      →", stats["loans"])
+    assert stats["id_index"]["size"] == 20_000 and stats["id_index"]["max_chain_length"] >= 1
+    assert stats["title_index"]["keys"] == 20_000
+    assert stats["title_index"]["height"] <= stats["title_index"]["avl_height_bound"]
+    assert stats["title_index"]["max_balance_factor"] <= 1
+    assert stats["loans"] == {"on_loan": 1, "books_with_reservations": 1, "waiting_users": 48, "max_queue_length": 48}
+
+    open_table = HashTable(open_addressing=True)
+    for i in range(1_000):
+        open_table.put(f"k{i}", i)
+    print("open addressing →", open_table.stats())
+    assert open_table.stats()["max_probe_length"] >= 0
+
+    radix_stats = Library(title_index_type="radix")
+    radix_stats.add_book("R1", "Algorithms", "A", "S")
+    radix_stats.add_book("R2", "Algebra", "A", "S")
+    assert radix_stats.stats()["title_index"]["keys"] == 2
+
+    lib.disable_metrics()
+    assert lib.stats()["operations"] is None and "get_book_by_id" not in lib.__dict__
+
+
+# 16. FULL-TEXT SEARCH WITH BM25
+
+def test_full_text_search() -> None:
+    print_header("TEST 16: Full-Text Search (Inverted Index + BM25)")
+
+    random.seed(16)
+    words = ["algorithms", "data", "structures", "python", "networks", "deep", "learning", "graph", "theory"]
+    lib = Library()
+    lib.bulk_load(
+        (f"B{i}", " ".join(random.choices(words, k=random.randint(1, 4))), f"Author {i % 300}", random.choice(words))
+        for i in range(200_000)
+    )
+    lib.add_book("S1", "Graph Theory", "Short", "Maths")
+    lib.add_book("S2", "An Extremely Long And Wordy Introduction To Graph Things", "Long", "Maths")
+    books = lib.list_all_books()
+
+    def words_of(book) -> set:
+        return set(f"{book.title} {book.author} {book.subject}".lower().split())
+
+    for query, match_all in (("graph theory", True), ("Python DEEP learning", True), ("networks author 7", True), ("graph python", False)):
+        terms = set(query.lower().split())
+        expected = {
+            book.book_id for book in books
+            if (terms <= words_of(book) if match_all else terms & words_of(book))
+        }
+        found = lib.search_text(query, limit=None, match_all=match_all)
+        assert {book.book_id for book in found} == expected, query
+        start = time.perf_counter()
+        top = lib.search_text(query, limit=10, match_all=match_all)
+        elapsed = time.perf_counter() - start
+        assert [book.book_id for book in top] == [book.book_id for book in found[:10]]
+        print(f"{query!r:<24} {'AND' if match_all else 'OR ':<3} → {len(found):>6} matches, top 10 in {elapsed * 1000:.1f} ms")
+
+    # BM25: a rare word outweighs a common one, and shorter documents rank higher
+    assert lib.search_text("short graph")[0].book_id == "S1"
+    ranked = [book.book_id for book in lib.search_text("graph maths", limit=None)]
+    assert ranked.index("S1") < ranked.index("S2")
+    assert lib.search_text("nonexistentword") == [] and lib.search_text("") == []
+
+
+# 17. FUZZY TITLE SEARCH
+
+def make_typo(text: str, rng: random.Random) -> str:
+    position = rng.randrange(len(text))
+    kind = rng.choice(("delete", "insert", "replace"))
+    if kind == "delete":
+        return text[:position] + text[position + 1:]
+    letter = rng.choice("abcdefghijklmnopqrstuvwxyz")
+    if kind == "insert":
+        return text[:position] + letter + text[position:]
+    return text[:position] + letter + text[position + 1:]
+
+
+def test_fuzzy_title_search() -> None:
+    print_header("TEST 17: Typo-Tolerant Title Search")
+
+    rng = random.Random(17)
+    # a vocabulary of made-up words, so titles vary the way real ones do
+    syllables = ["al", "go", "ri", "thm", "da", "ta", "net", "work", "sys", "tem", "the", "o", "ry", "lin", "ear", "gra", "ph"]
+    words = list({"".join(rng.choices(syllables, k=rng.randint(2, 4))) for _ in range(2_000)})
+    lib = Library()
+    lib.bulk_load(
+        (f"B{i}", " ".join(rng.sample(words, rng.randint(2, 4))).title(), "Author", "Subject")
+        for i in range(50_000)
+    )
+    lib.add_book("A1", "Algorithms", "Someone", "CS")
+    assert [book.book_id for book in lib.search_title_fuzzy("Algoritms", max_distance=1)] == ["A1"]
+    assert lib.search_title_exact("Algoritms") == []
+
+    titles = lib.fuzzy_index.keys
+    index_seconds = scan_seconds = 0.0
+    for _ in range(20):
+        query = make_typo(make_typo(rng.choice(titles), rng), rng)
+
+        start = time.perf_counter()
+        found = lib.search_title_fuzzy(query, max_distance=2)
+        index_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = [
+            book for title in titles if edit_distance(query, title, 2) <= 2
+            for book in lib.search_title_exact(title)
+        ]
+        scan_seconds += time.perf_counter() - start
+
+        assert {book.book_id for book in found} == {book.book_id for book in expected}, query
+        distances = [edit_distance(query, book.title.lower()) for book in found]
+        assert found and distances == sorted(distances)
+
+    print(f"{len(titles)} distinct titles, 20 queries with 2 typos each (k=2):")
+    print(f"  linear Levenshtein scan: {scan_seconds / 20 * 1000:8.2f} ms/query")
+    print(f"  trigram index          : {index_seconds / 20 * 1000:8.2f} ms/query ({scan_seconds / index_seconds:.0f}x faster)")
+    assert index_seconds * 10 < scan_seconds
+
+
+# 18. REMOVING AND UPDATING BOOKS
+
+def check_avl(node) -> int:
+    # returns the height, checking stored heights, balance and key order on the way
+    if node is None:
+        return 0
+    left, right = check_avl(node.left), check_avl(node.right)
+    assert abs(left - right) <= 1 and node.height == 1 + max(left, right)
+    assert node.left is None or node.left.key < node.key
+    assert node.right is None or node.right.key > node.key
+    return node.height
+
+
+def catalogue_answers(lib: Library) -> dict:
+    ids = lambda books: sorted(book.book_id for book in books)
+    return {
+        "all": ids(lib.list_all_books()),
+        "sorted": [book.title for book in lib.list_books_sorted_by_title()],  # ties come in book_id order
+        "prefix": [ids(lib.search_title_prefix(p)) for p in ("", "t", "title 01", "new")],
+        "exact": [ids(lib.search_title_exact(t)) for t in ("Title 00010", "Title 00011", "New Title 5")],
+        "author": [ids(lib.search_author_prefix(a)) for a in ("author 1", "renamed")],
+        "subject": [ids(lib.search_subject(s)) for s in ("Subject 0", "Subject 3", "Moved")],
+        "text": [ids(lib.search_text(q, limit=None)) for q in ("title", "renamed author", "moved")],
+        "fuzzy": [ids(lib.search_title_fuzzy(t)) for t in ("Title 00101", "New Titel 7")],
+        "overdue": [book.book_id for book in lib.list_overdue_books(today=date.today() + timedelta(days=30))],
+    }
+
+
+def test_remove_and_update() -> None:
+    print_header("TEST 18: Removing and Updating Books")
+
+    rng = random.Random(18)
+    records = [(f"B{i}", f"Title {i // 2:05d}", f"Author {i % 17}", f"Subject {i % 5}") for i in range(4_000)]
+    for title_index_type in ("bst", "radix"):
+        lib = Library(title_index_type=title_index_type)
+        lib.bulk_load(records)
+        for i in range(0, 400, 4):
+            lib.borrow_book(f"B{i}", "U1")
+            lib.borrow_book(f"B{i}", "U2")
+
+        removed = rng.sample([record[0] for record in records], 1_500)
+        for book_id in removed[:100]:
+            lib.remove_book(book_id)
+        start = time.perf_counter()
+        lib.remove_books(removed[100:] + ["MISSING"])
+        print(f"[{title_index_type}] removed 1,500 books ({time.perf_counter() - start:.3f}s for the batch of 1,400)")
+        assert lib.text_index.removed < 1_500  # compaction kicked in
+        for i in range(0, 60, 3):
+            if lib.get_book_by_id(f"B{i}") is not None:
+                lib.update_book(f"B{i}", title=f"New Title {i}", author="Renamed Author", subject="Moved")
+
+        # a library built directly from the final catalogue must answer the same
+        fresh = Library(title_index_type=title_index_type)
+        fresh.bulk_load(
+            (book.book_id, book.title, book.author, book.subject) for book in lib.list_all_books()
+        )
+        for i in range(0, 400, 4):
+            if fresh.get_book_by_id(f"B{i}") is not None:
+                fresh.borrow_book(f"B{i}", "U1")
+        assert catalogue_answers(lib) == catalogue_answers(fresh)
+        if title_index_type == "bst":
+            check_avl(lib.title_index.root)
+            check_avl(lib.author_index.root)
+
+        try:
+            lib.remove_book(removed[0])
+            raise AssertionError("removed a missing book")
+        except ValueError as error:
+            print(f"[{title_index_type}] removing twice →", error)
+
+    # removals and updates survive a restart through the journal
+    with tempfile.TemporaryDirectory() as folder:
+        store = LibraryStore(folder)
+        store.library.bulk_load(records[:100])
+        store.library.remove_book("B1")
+        store.library.remove_books(["B2", "B3"])
+        store.library.update_book("B4", title="Retitled")
+        expected = library_state(store.library)
+        store.close()
+        reopened = LibraryStore(folder)
+        assert library_state(reopened.library) == expected
+        assert [book.book_id for book in reopened.library.search_title_exact("retitled")] == ["B4"]
+        reopened.close()
+
+    # random inserts and deletes keep the AVL tree valid
+    bst = TitleIndexBst()
+    present = {}
+    for step in range(5_000):
+        title = f"T{rng.randrange(500):03d}"
+        if title in present and rng.random() < 0.5:
+            assert bst.remove(title, present.pop(title))
+        elif title not in present:
+            present[title] = Book(f"X{step}", title, "A", "S")
+            bst.insert(title, present[title])
+    check_avl(bst.root)
+    assert [node.key for node in bst._iter_nodes()] == sorted(title.lower() for title in present)
+
+    # document frequencies count live books only, so an idf never goes
+    # negative while tombstones wait for compaction
+    lib = Library()
+    for i in range(100):
+        lib.add_book(f"C{i}", f"Common Title {i}" if i < 60 else f"Common Rare {i}", "Author", "Subject")
+    lib.remove_books(f"C{i}" for i in range(60, 80))  # 20 of 100: below the compaction ratio
+    text = lib.text_index
+    assert text.removed == 20 and len(text.postings["common"][0]) == 100
+    assert text.doc_freq["common"] == 80 and text.doc_freq["rare"] == 20
+    assert all(text._idf(term) > 0 for term in text.postings)
+    lib.update_book("C0", title="Renamed")
+    assert text.doc_freq["common"] == 79 and text.doc_freq["renamed"] == 1
+
+    # a book withdrawn or returned between reading the due-date index and
+    # looking up its book is left out, not reported as None
+    lib = Library()
+    for i in range(3):
+        lib.add_book(f"D{i}", f"Due {i}", "Author", "Subject")
+        lib.borrow_book(f"D{i}", "U1")
+    today = date.today() + timedelta(days=60)
+    loans = lib._loans_due_between(None, today)
+    lib.remove_book("D0")
+    lib.return_book("D1")
+    assert [book.book_id for _, book in lib._loan_books(loans)] == ["D2"]
+    assert [book.book_id for book in lib.list_overdue_books(today=today)] == ["D2"]
+
+
+# 19. SHARDED LIBRARY
+
+def test_sharded_library() -> None:
+    print_header("TEST 19: Sharded Library Built in Worker Processes")
+
+    records = catalogues["skewed"](20_000, 19)
+    single = Library()
+    single.bulk_load(records)
+    sharded = ShardedLibrary(shard_count=4)
+    shards = list(sharded.shards)
+    report = sharded.bulk_load(records, workers=2)  # two processes even on a one-core machine
+    print(f"Built 4 shards with {report['workers']} worker processes in {report['build_seconds']:.2f}s")
+    assert len(sharded) == len(records)
+    assert all(live is shard for live, shard in zip(sharded.shards, shards))  # shards adopt the built books
+    assert all(0 < len(shard.id_index) < len(records) for shard in sharded.shards)
+
+    # a shard sent back from a worker process works like one built here
+    for book_id, title, _, _ in records[:200]:
+        book = sharded.get_book_by_id(book_id)
+        assert book is not None and book.title == title
+        assert book in sharded.shard_for(book_id).search_title_exact(title)
+
+    ids = lambda books: [book.book_id for book in books]
+    titles = lambda books: [book.title.lower() for book in books]
+    assert titles(sharded.list_books_sorted_by_title()) == titles(single.list_books_sorted_by_title())
+    for prefix in ("", "a", "data ", "learning deep"):
+        assert titles(sharded.search_title_prefix(prefix, limit=25)) == titles(single.search_title_prefix(prefix, limit=25))
+    assert sorted(ids(sharded.search_title_prefix("modern"))) == sorted(ids(single.search_title_prefix("modern")))
+    assert sorted(ids(sharded.search_title_exact(records[5][1]))) == sorted(ids(single.search_title_exact(records[5][1])))
+    assert sorted(ids(sharded.search_author_exact("Author 1"))) == sorted(ids(single.search_author_exact("Author 1")))
+    assert [book.author.lower() for book in sharded.search_author_prefix("author 2", limit=30)] == \
+        [book.author.lower() for book in single.search_author_prefix("author 2", limit=30)]
+    assert sorted(ids(sharded.search_subject("data"))) == sorted(ids(single.search_subject("data")))
+    typo = records[7][1].replace("a", "", 1)
+    assert titles(sharded.search_title_fuzzy(typo, max_distance=1)) == titles(single.search_title_fuzzy(typo, max_distance=1))
+
+    for book_id, *_ in records[:300:3]:
+        assert sharded.borrow_book(book_id, "U1") == single.borrow_book(book_id, "U1")
+    later = date.today() + timedelta(days=30)
+    assert ids(sharded.list_overdue_books(today=later)) == ids(single.list_overdue_books(today=later))
+    sharded.remove_book(records[0][0])
+    sharded.update_book(records[3][0], title="Zzz Last Title")
+    assert sharded.get_book_by_id(records[0][0]) is None
+    assert ids(sharded.list_books_sorted_by_title()[-1:]) == [records[3][0]]
+
+    # a batch with a duplicate id is rejected without touching any shard,
+    # even when the duplicate lands in a later shard than the new books
+    last = sharded.shards[-1]
+    duplicate = next(book_id for book_id, *_ in records[1:] if sharded.shard_for(book_id) is last)
+    batch = [(f"NEW{i}", "T", "A", "S") for i in range(40)] + [(duplicate, "T", "A", "S")]
+    for workers in (1, 2):
+        try:
+            sharded.bulk_load(batch, workers=workers)
+            raise AssertionError("duplicate id was accepted")
+        except ValueError as error:
+            print(f"Duplicate batch rejected ({workers} worker(s)):", error)
+        assert sharded.get_book_by_id("NEW0") is None and len(sharded) == len(records) - 1
+
+    # loading into shards that already hold books keeps them in this process,
+    # so Book objects callers hold stay the live ones
+    held = sharded.get_book_by_id(records[10][0])
+    sharded.bulk_load(batch[:-1], workers=2)
+    assert len(sharded) == len(records) - 1 + 40
+    assert sharded.get_book_by_id(records[10][0]) is held
+    sharded.borrow_book(records[10][0], "U3")
+    assert held.borrower_id == "U3"
+
+    # books added while a bulk load runs in worker processes wait for it
+    # and are kept, rather than landing in a shard that is then replaced
+    racing = ShardedLibrary(shard_count=4)
+    loader = threading.Thread(target=racing.bulk_load, args=(records[:5_000],), kwargs={"workers": 2})
+    loader.start()
+    for i in range(200):
+        racing.add_book(f"RACE{i}", "Race", "A", "S")
+    loader.join()
+    assert len(racing) == 5_000 + 200 and racing.get_book_by_id("RACE0") is not None
+
+    # pickled libraries re-bucket their hash tables and get fresh locks
+    copy = pickle.loads(pickle.dumps(single))
+    assert copy.get_book_by_id(records[9][0]).title == records[9][1]
+    assert copy.borrow_book(records[9][0], "U2") == single.borrow_book(records[9][0], "U2")
+
+    results = bench_sharding(records, repeats=1, seed=19, workers=[1, 2])
+    print(f"{os.cpu_count()} core(s) available")
+    for key, result in results.items():
+        speedup = f" ({result['speedup']:.2f}x)" if "speedup" in result else ""
+        print(f"  {key:40s}: {result['min_ns_per_op'] / 1000:8.2f} us/book{speedup}")
+
+
+# 20. STREAMING AND PAGINATED LISTINGS
+
+def collect_pages(fetch, page: int, cursor=Library.title_cursor) -> list:
+    """Page through a listing with after=/limit= and return every book id seen."""
+    seen, after = [], None
+    while True:
+        books = fetch(after=after, limit=page)
+        seen.extend(book.book_id for book in books)
+        if len(books) < page:
+            return seen
+        after = cursor(books[-1])
+
+
+def test_paginated_listings() -> None:
+    print_header("TEST 20: Streaming and Paginated Listings")
+
+    rng = random.Random(20)
+    # many books share a title, so pages must split groups of equal titles cleanly
+    records = [(f"B{i}", f"Title {rng.randrange(300):03d}", "Author", "Subject") for i in range(3_000)]
+    for title_index_type in ("bst", "radix"):
+        lib = Library(title_index_type=title_index_type)
+        lib.bulk_load(records)
+        full = [book.book_id for book in lib.list_books_sorted_by_title()]
+        titles = [book.title.lower() for book in lib.list_books_sorted_by_title()]
+        assert titles == sorted(titles) and len(full) == len(records)
+        assert collect_pages(lib.list_books_sorted_by_title, 7) == full
+        assert collect_pages(lib.list_all_books, 50) == full
+        cursor = Library.title_cursor(lib.get_book_by_id(full[99]))
+        assert [book.book_id for book in lib.iter_books_sorted_by_title(after=cursor)] == full[100:]
+        assert sorted(book.book_id for book in lib.iter_all_books()) == sorted(full)
+        entries = list(lib.title_index.iter_entries("title 150"))
+        assert entries[0][0] == "title 150" and len(entries) == 150
+        assert [key for key, _ in lib.title_index.iter_entries("title 149x")][:1] == ["title 150"]
+        # books sharing a title are kept in book_id order as they are added
+        lib.add_book("B1000a", records[1_000][1], "Author", "Subject")
+        lib.add_book("A0", records[1_000][1], "Author", "Subject")
+        for _, books in lib.title_index.iter_entries(""):
+            book_ids = [book.book_id for book in books]
+            assert book_ids == sorted(book_ids)
+
+    # resuming inside one huge group of equal titles bisects to the cursor
+    # rather than walking or sorting the group for every page
+    same = Library()
+    same.bulk_load((f"S{i:06d}", "Same Title", "Author", "Subject") for i in range(100_000))
+    start = time.perf_counter()
+    first = same.list_books_sorted_by_title(limit=10)
+    deep = same.list_books_sorted_by_title(after=("same title", "S090000"), limit=10)
+    page_seconds = time.perf_counter() - start
+    assert [book.book_id for book in first] == [f"S{i:06d}" for i in range(10)]
+    assert [book.book_id for book in deep] == [f"S{i:06d}" for i in range(90_001, 90_011)]
+    start = time.perf_counter()
+    sorted(same.list_all_books(), key=lambda book: book.book_id)
+    sort_seconds = time.perf_counter() - start
+    print(f"Two pages inside a 100,000-book title: {page_seconds * 1e6:.0f} us, full sort: {sort_seconds * 1e3:.0f} ms")
+    assert page_seconds * 20 < sort_seconds
+
+    # overdue pages, and a lazy overdue walk in small chunks
+    for i in range(0, 3_000, 7):
+        lib.borrow_book(f"B{i}", "U1")
+    for i in range(0, 3_000, 21):
+        lib.return_book(f"B{i}")
+        lib.borrow_book(f"B{i}", "U2")  # later due date for some loans
+    later = date.today() + timedelta(days=60)
+    overdue = [book.book_id for book in lib.list_overdue_books(today=later)]
+    assert collect_pages(lambda **page: lib.list_overdue_books(today=later, **page), 25, Library.due_cursor) == overdue
+    assert [book.book_id for book in lib.iter_overdue_books(today=later, chunk=16)] == overdue
+    due_soon = [book.book_id for book in lib.list_books_due_within(60)]
+    assert collect_pages(lambda **page: lib.list_books_due_within(60, **page), 30, Library.due_cursor) == due_soon
+
+    # a cursor still resumes in the right place after its book is withdrawn,
+    # retitled or returned
+    full = [book.book_id for book in lib.list_books_sorted_by_title()]
+    page = lib.list_books_sorted_by_title(limit=500)
+    after = Library.title_cursor(page[-1])
+    lib.remove_book(page[-1].book_id)
+    lib.update_book(page[-2].book_id, title="Aaa First Now")
+    assert [book.book_id for book in lib.list_books_sorted_by_title(after=after, limit=5)] == full[500:505]
+    overdue_page = lib.list_overdue_books(today=later, limit=10)
+    after = Library.due_cursor(overdue_page[-1])
+    lib.return_book(overdue_page[-1].book_id)
+    assert [book.book_id for book in lib.list_overdue_books(today=later, after=after, limit=3)] == overdue[10:13]
+
+    # iterators hold no lock between chunks, so the loop body may call the
+    # library even while a writer is waiting
+    writer = threading.Thread(
+        target=lambda: [lib.add_book(f"W{i}", f"Written {i}", "A", "S") for i in range(200)], daemon=True
+    )
+    walked = []
+
+    def walk_and_borrow() -> None:
+        for book in lib.iter_books_sorted_by_title():
+            if len(walked) == 10:
+                writer.start()
+            if len(walked) % 100 == 0:
+                lib.borrow_book(book.book_id, "U9")
+            walked.append(book)
+
+    walker = threading.Thread(target=walk_and_borrow, daemon=True)
+    walker.start()
+    walker.join(timeout=60)
+    writer.join(timeout=60)
+    assert not walker.is_alive() and not writer.is_alive(), "deadlocked"
+    assert len(walked) >= len(full) - 1
+
+    # the sharded library pages through its merged order the same way
+    sharded = ShardedLibrary(shard_count=3)
+    sharded.bulk_load(records, workers=1)
+    full = [book.book_id for book in sharded.list_books_sorted_by_title()]
+    assert collect_pages(sharded.list_books_sorted_by_title, 11) == full
+    for i in range(0, 3_000, 5):
+        sharded.borrow_book(f"B{i}", "U1")
+    overdue = [book.book_id for book in sharded.list_overdue_books(today=later)]
+    assert collect_pages(lambda **page: sharded.list_overdue_books(today=later, **page), 40, Library.due_cursor) == overdue
+    assert [book.book_id for book in sharded.iter_overdue_books(today=later)] == overdue
+
+    # the first page of a big catalogue comes straight off the title index
+    big = Library()
+    big.bulk_load((f"B{i}", f"Title {rng.random():.12f}", "Author", "Subject") for i in range(200_000))
+    start = time.perf_counter()
+    page = big.list_books_sorted_by_title(limit=20)
+    page_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    expected = sorted(big.list_all_books(), key=lambda book: book.title.lower())[:40]
+    sort_seconds = time.perf_counter() - start
+    assert [book.book_id for book in page] == [book.book_id for book in expected[:20]]
+    start = time.perf_counter()
+    next_page = big.list_books_sorted_by_title(after=Library.title_cursor(page[-1]), limit=20)
+    next_seconds = time.perf_counter() - start
+    assert [book.book_id for book in next_page] == [book.book_id for book in expected[20:]]
+    print(f"First page of 20: {page_seconds * 1e6:.0f} us, next page {next_seconds * 1e6:.0f} us, "
+          f"full sort: {sort_seconds * 1e3:.0f} ms")
+    assert page_seconds * 100 < sort_seconds
+
+    # walking everything lazily never builds the whole list
+    tracemalloc.start()
+    walked = sum(1 for _ in big.iter_books_sorted_by_title())
+    lazy_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert walked == 200_000
+    print(f"Lazy title-order walk of 200,000 books peaked at {lazy_peak / 1024:.0f} KiB")
+    assert lazy_peak < 200_000 * 8 / 4  # well under the size of a list of every book
+
+
+# 21. RESERVATIONS, PER-USER INDEXES AND HOLD EXPIRY
+
+def test_reservations() -> None:
+    print_header("TEST 21: Reservations, Per-User Lists and Hold Expiry")
+
+    # queue positions stay right through cancellations anywhere in the queue
+    rng = random.Random(21)
+    queue, model = ReservationQueue(), []
+    for step in range(5_000):
+        roll = rng.random()
+        if roll < 0.5:
+            user = f"U{rng.randrange(300)}"
+            assert queue.append(user) == (user not in model)
+            if user not in model:
+                model.append(user)
+        elif roll < 0.7 and model:
+            assert queue.popleft()[0] == model.pop(0)
+        elif model:
+            user = rng.choice(model)
+            assert queue.remove(user)
+            model.remove(user)
+        if step % 50 == 0:
+            assert list(queue) == model
+            assert all(queue.position(user) == position for position, user in enumerate(model, 1))
+    assert queue.position("nobody") is None and not queue.remove("nobody")
+
+    lib = Library()
+    lib.bulk_load((f"B{i}", f"Title {i}", "Author", "Subject") for i in range(2_000))
+    lib.borrow_book("B1", "U1")
+    assert lib.borrow_book("B1", "U1") == "You already have this book on loan."
+    lib.borrow_book("B1", "U2")
+    lib.borrow_book("B1", "U3")
+    assert lib.borrow_book("B1", "U2") == "You are already in the reservation queue (position 1)."
+    assert len(lib.get_book_by_id("B1").reservation_queue) == 2
+    assert lib.cancel_reservation("B1", "U2") == "Reservation cancelled."
+    assert lib.cancel_reservation("B1", "U2") == "No reservation found."
+    assert lib.reservation_position("B1", "U3") == 1
+
+    # per-user lists agree with a scan of the whole catalogue after a random workload
+    for _ in range(20_000):
+        book_id, user_id = f"B{rng.randrange(300)}", f"U{rng.randrange(100)}"
+        roll = rng.random()
+        if roll < 0.5:
+            lib.borrow_book(book_id, user_id)
+        elif roll < 0.8:
+            lib.return_book(book_id)
+        else:
+            lib.cancel_reservation(book_id, user_id)
+    books = lib.list_all_books()
+    for user_id in (f"U{i}" for i in range(100)):
+        loans = sorted(book.book_id for book in books if book.borrower_id == user_id)
+        reserved = sorted(book.book_id for book in books if book.has_reservations and user_id in book.reservation_queue)
+        assert sorted(book.book_id for book in lib.list_user_loans(user_id)) == loans
+        assert [book.book_id for book in lib.list_user_reservations(user_id)] == sorted(reserved)
+        for book in lib.list_user_reservations(user_id):
+            assert lib.reservation_position(book.book_id, user_id) == list(book.reservation_queue).index(user_id) + 1
+
+    # by default a reservation waits however long the queue takes: users
+    # queued behind several loans still get the book in turn
+    lib = Library()
+    lib.bulk_load((f"B{i}", f"Title {i}", "Author", "Subject") for i in range(10))
+    lib.borrow_book("B0", "U0")
+    for user in ("U1", "U2", "U3"):
+        lib.borrow_book("B0", user)
+    assert lib.hold_heap == []
+    today = date.today()
+    for user, days in (("U1", 14), ("U2", 28), ("U3", 42)):
+        assert lib.expire_holds(today + timedelta(days=days)) == 0
+        assert f"issued to next user in queue: {user}" in lib.return_book("B0")
+    assert not lib.get_book_by_id("B0").has_reservations
+
+    # holds lapse: expire_holds drops them in date order, stale heap entries are skipped
+    lib = Library()
+    lib.bulk_load((f"B{i}", f"Title {i}", "Author", "Subject") for i in range(10))
+    lib.borrow_book("B0", "U0")
+    for days, user in ((5, "U1"), (10, "U2"), (20, "U3"), (20, "U4")):
+        lib.hold_period_days = days
+        lib.borrow_book("B0", user)
+    lib.cancel_reservation("B0", "U4")
+    today = date.today()
+    assert lib.expire_holds(today) == 0
+    assert lib.expire_holds(today + timedelta(days=11)) == 2
+    assert list(lib.get_book_by_id("B0").reservation_queue) == ["U3"]
+    assert lib.list_user_reservations("U1") == [] and lib.reservation_position("B0", "U3") == 1
+    assert lib.expire_holds(today + timedelta(days=40)) == 1  # U4's cancelled entry is stale
+    assert not lib.get_book_by_id("B0").has_reservations and lib.hold_heap == []
+
+    # a hand-over skips users whose hold lapsed before the book came back
+    lib.hold_period_days = -1  # holds placed now have already lapsed
+    lib.borrow_book("B0", "U5")
+    lib.hold_period_days = 30
+    lib.borrow_book("B0", "U6")
+    assert "issued to next user in queue: U6" in lib.return_book("B0")
+    assert lib.list_user_reservations("U5") == [] and [book.book_id for book in lib.list_user_loans("U6")] == ["B0"]
+
+    # reservations, cancellations and expiry dates survive the journal and the snapshot
+    with tempfile.TemporaryDirectory() as folder:
+        store = LibraryStore(folder)
+        store.library.bulk_load((f"B{i}", f"Title {i}", "Author", "Subject") for i in range(10))
+        lib = store.library
+        lib.hold_period_days = 30
+        lib.borrow_book("B1", "U1")
+        for user in ("U2", "U3", "U4"):
+            lib.borrow_book("B1", user)
+        lib.cancel_reservation("B1", "U3")
+        lib.return_book("B1")  # handed to U2
+        expected = list(lib.get_book_by_id("B1").reservation_queue.entries())
+        store.close()
+
+        for compact in (False, True):
+            store = LibraryStore(folder)
+            lib = store.library
+            assert list(lib.get_book_by_id("B1").reservation_queue.entries()) == expected
+            assert [book.book_id for book in lib.list_user_reservations("U4")] == ["B1"]
+            assert [book.book_id for book in lib.list_user_loans("U2")] == ["B1"]
+            assert "U4" in {user_id for _, _, user_id, _ in lib.hold_heap}
+            if not compact:
+                store.compact()  # next round reads it all back from a snapshot
+            store.close()
+
+    # user-centric queries and queue positions stay cheap at scale
+    lib = Library()
+    lib.bulk_load((f"B{i}", f"Title {i}", "Author", "Subject") for i in range(100_000))
+    for i in range(0, 100_000, 10):
+        lib.borrow_book(f"B{i}", f"U{i % 1_000}")
+    for i in range(10_000):
+        lib.borrow_book("B0", f"W{i}")
+    for i in range(0, 10_000, 3):
+        lib.cancel_reservation("B0", f"W{i}")
+
+    start = time.perf_counter()
+    for i in range(100):
+        lib.list_user_loans(f"U{i * 10}")
+        lib.reservation_position("B0", f"W{9_997 - 3 * i}")
+    indexed = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(10):
+        [book for book in lib.list_all_books() if book.borrower_id == f"U{i * 10}"]
+        list(lib.get_book_by_id("B0").reservation_queue).index(f"W{9_997 - 3 * i}")
+    scanned = (time.perf_counter() - start) * 10
+    assert lib.reservation_position("B0", "W9998") == 6_666
+    print(f"100 user lookups + queue positions: indexed {indexed * 1e3:.1f} ms, scanning {scanned * 1e3:.0f} ms")
+    assert indexed * 20 < scanned
+
+
+# 22. TITLE SEARCH RESULT CACHE
+
+def test_search_cache() -> None:
+    print_header("TEST 22: LRU/TTL Cache for Title Searches")
+
+    # LRU order and TTL, with a clock the test controls
+    now = [0.0]
+    cache = SearchCache(max_entries=3, ttl_seconds=10, max_result_size=2, clock=lambda: now[0])
+    book = Book("B1", "Title", "Author", "Subject")
+    for text in ("a", "b", "c"):
+        cache.put("prefix", text, 10, [book])
+    assert cache.get("prefix", "a", 10) == [book]  # "a" is now the most recently used
+    cache.put("prefix", "d", 10, [book])
+    assert cache.get("prefix", "b", 10) is None and cache.get("prefix", "a", 10) == [book]
+    cache.put("exact", "big", None, [book] * 3)  # too large to cache
+    assert cache.get("exact", "big") is None
+    now[0] = 11.0
+    assert cache.get("prefix", "a", 10) is None
+    stats = cache.stats()
+    print("cache stats →", stats)
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["expirations"]) == (2, 3, 1, 1)
+
+    # every answer matches an uncached library while books come, go and change title
+    rng = random.Random(22)
+    words = ["data", "deep", "design", "dune", "drift", "delta"]
+    records = [(f"B{i}", " ".join(rng.choices(words, k=2)), "Author", "Subject") for i in range(2_000)]
+    cached, plain = Library(), Library()
+    for lib in (cached, plain):
+        lib.bulk_load(records)
+    cached.enable_search_cache(max_entries=200)
+    queries = [("exact", " ".join(pair)) for pair in zip(words, reversed(words))] + \
+        [("prefix", prefix) for prefix in ("d", "de", "dee", "deep d", "dr", "x")]
+    next_id = 0
+    for step in range(3_000):
+        kind, text = rng.choice(queries)
+        limit = rng.choice((None, 5))
+        if kind == "exact":
+            assert [b.book_id for b in cached.search_title_exact(text)] == \
+                [b.book_id for b in plain.search_title_exact(text)]
+        else:
+            assert [b.book_id for b in cached.search_title_prefix(text, limit)] == \
+                [b.book_id for b in plain.search_title_prefix(text, limit)]
+        if step % 10 == 0:
+            roll = rng.random()
+            book_id = f"B{rng.randrange(2_000)}"
+            title = " ".join(rng.choices(words, k=2))
+            for lib in (cached, plain):
+                if roll < 0.4:
+                    lib.add_book(f"N{next_id}", title, "Author", "Subject")
+                elif roll < 0.7 and lib.get_book_by_id(book_id) is not None:
+                    lib.remove_book(book_id)
+                elif lib.get_book_by_id(book_id) is not None:
+                    lib.update_book(book_id, title=title)
+            next_id += 1
+    stats = cached.stats()["search_cache"]
+    print(f"random workload: hit rate {stats['hit_rate']:.0%}, {stats['invalidations']} entries invalidated")
+    assert stats["hits"] > 0 and stats["invalidations"] > 0
+
+    # invalidation is precise: a new title only drops its own prefixes
+    cached.search_cache.clear()
+    cached.search_title_prefix("x")
+    cached.search_title_prefix("d", limit=5)
+    cached.search_title_exact("dune drift")
+    before = cached.search_cache.stats()["invalidations"]
+    cached.add_book("X1", "xylophone", "Author", "Subject")
+    assert cached.search_cache.stats()["invalidations"] == before + 1
+    assert len(cached.search_cache) == 2 and cached.search_cache.get("prefix", "x") is None
+    assert [book.book_id for book in cached.search_title_prefix("x")] == ["X1"]
+    cached.disable_search_cache()
+    assert cached.stats()["search_cache"] is None
 
-    print("Assigned a 500-bit integer to a book attribute.")
-    print("Stored value:", book.large_value)
-    print("Value bit-length:", book.large_value.bit_length())
+    # a Zipf-skewed replay is faster with the cache on
+    records = catalogues["skewed"](20_000, 22)
+    assert len(zipf_queries(records, 1_000, 22)) == 1_000
+    results = bench_search_cache(records, repeats=3, seed=22)
+    for key, result in results.items():
+        hit_rate = f" (hit rate {result['hit_rate']:.1%})" if "hit_rate" in result else ""
+        print(f"  {key:44s}: {result['min_ns_per_op'] / 1000:6.2f} us/search{hit_rate}")
+    assert results["cache.zipf_searches_cached"]["min_ns_per_op"] * 2 < results["cache.zipf_searches_uncached"]["min_ns_per_op"]
 
 
 # MAIN TEST RUNNER
@@ -97,4 +1466,22 @@ if __name__ == "__main__":
     test_zero_and_null_values()
     test_large_dataset()
     test_large_data_types()
+    test_sorted_title_index()
+    test_bulk_load()
+    test_radix_title_index()
+    test_secondary_indexes()
+    test_due_date_index()
+    test_book_memory()
+    test_persistent_store()
+    test_concurrent_loans()
+    test_async_server()
+    test_benchmark_suite()
+    test_metrics_and_stats()
+    test_full_text_search()
+    test_fuzzy_title_search()
+    test_remove_and_update()
+    test_sharded_library()
+    test_paginated_listings()
+    test_reservations()
+    test_search_cache()
     print("\nALL TESTS COMPLETED.\n")